@@ -0,0 +1,380 @@
+"""
+Offline benchmark for the pricing API.
+
+Runs the FastAPI app in-process (TestClient) and, with --uvicorn, against a
+local uvicorn server. Measures cold start, /predict-prices latency
+percentiles, batch throughput and optimize_prices cost per grid size, and
+writes everything to a JSON file so runs can be compared.
+
+Requests are synthesized from server/data/retail_price.csv. When the model
+artifacts in the models directory are unreadable (e.g. Git LFS pointers
+that were never pulled), small stand-in models with the same feature
+layout are trained from the same CSV into a temporary directory.
+
+Usage:
+    python benchmark.py [--requests 200] [--uvicorn] [--output bench.json]
+                        [--compare previous.json] [--models-dir DIR]
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+PRICE_API_DIR = os.path.dirname(os.path.abspath(__file__))
+RETAIL_CSV = os.path.join(PRICE_API_DIR, "..", "..", "data", "retail_price.csv")
+
+FEATURES = [
+    "price_std", "product_score", "avg_competitor_price", "min_competitor_price",
+    "month_year_encoded", "price_vs_avg_comp", "day_of_week", "month", "cost_per_unit",
+    "product_category_name_encoded", "is_weekend", "price_ratio_to_avg_comp", "max_competitor_price",
+]
+DEMAND_FEATURES = FEATURES + ["your_price"]
+# retail_price.csv has no unit cost; assume a fixed share of the selling price
+COST_RATIO = 0.6
+# Lower-is-better metrics that --compare flags when they grow by more than this
+REGRESSION_THRESHOLD = 0.15
+
+
+def load_retail_rows(path: str = RETAIL_CSV) -> List[Dict[str, str]]:
+    with open(path, newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def synthetic_requests(rows: List[Dict[str, str]], count: int) -> List[Dict[str, Any]]:
+    requests = []
+    for i in range(count):
+        row = rows[i % len(rows)]
+        comps = [float(row[key]) for key in ("comp_1", "comp_2", "comp_3")]
+        unit_price = float(row["unit_price"])
+        requests.append({
+            "product_id": f"{row['product_id']}-{i}",
+            "avg_competitor_price": round(sum(comps) / len(comps), 2),
+            "min_competitor_price": min(comps),
+            "max_competitor_price": max(comps),
+            "cost_per_unit": round(unit_price * COST_RATIO, 2),
+            "product_category_name": row["product_category_name"],
+            "product_score": float(row["product_score"]),
+        })
+    return requests
+
+
+def shipped_models_usable(models_dir: str) -> bool:
+    import joblib
+
+    try:
+        for name in ("features.json", "demand_features.json"):
+            with open(os.path.join(models_dir, name)) as f:
+                json.load(f)
+        for name in ("revenue_model.pkl", "profit_model.pkl", "demand_model.pkl"):
+            joblib.load(os.path.join(models_dir, name))
+    except Exception:  # noqa: BLE001
+        return False
+    return True
+
+
+def build_stand_in_models(target_dir: str, rows: List[Dict[str, str]]) -> None:
+    """Trains small models with the production feature layout from retail_price.csv."""
+    import joblib
+    import numpy as np
+    from sklearn.ensemble import GradientBoostingRegressor, RandomForestRegressor
+    from sklearn.preprocessing import LabelEncoder, StandardScaler
+
+    categories = LabelEncoder().fit([row["product_category_name"] for row in rows])
+    month_years = LabelEncoder().fit([row["month_year"] for row in rows])
+
+    matrix, revenue, profit, demand = [], [], [], []
+    for row in rows:
+        comps = np.array([float(row[key]) for key in ("comp_1", "comp_2", "comp_3")])
+        price = float(row["unit_price"])
+        cost = price * COST_RATIO
+        avg = float(comps.mean())
+        day, month = int(row["weekday"]) % 7, int(row["month"])
+        features = {
+            "price_std": float(comps.std()),
+            "product_score": float(row["product_score"]),
+            "avg_competitor_price": avg,
+            "min_competitor_price": float(comps.min()),
+            "month_year_encoded": float(month_years.transform([row["month_year"]])[0]),
+            "price_vs_avg_comp": price - avg,
+            "day_of_week": float(day),
+            "month": float(month),
+            "cost_per_unit": cost,
+            "product_category_name_encoded": float(categories.transform([row["product_category_name"]])[0]),
+            "is_weekend": 1.0 if int(row["weekend"]) > 0 and day >= 5 else 0.0,
+            "price_ratio_to_avg_comp": price / avg if avg else 1.0,
+            "max_competitor_price": float(comps.max()),
+            "your_price": price,
+        }
+        matrix.append([features[name] for name in DEMAND_FEATURES])
+        qty = float(row["qty"])
+        revenue.append(float(row["total_price"]))
+        profit.append(float(row["total_price"]) - qty * cost)
+        demand.append(qty)
+
+    X = np.array(matrix)
+    X_base = X[:, :len(FEATURES)]
+    targets = {
+        "revenue": (X_base, np.array(revenue), GradientBoostingRegressor(n_estimators=100, max_depth=4, random_state=0)),
+        "profit": (X_base, np.array(profit), GradientBoostingRegressor(n_estimators=200, max_depth=5, learning_rate=0.05, random_state=0)),
+        "demand": (X, np.array(demand), RandomForestRegressor(n_estimators=100, max_depth=10, random_state=0, n_jobs=1)),
+    }
+    os.makedirs(target_dir, exist_ok=True)
+    for key, (data, target, model) in targets.items():
+        scaler = StandardScaler().fit(data)
+        model.fit(scaler.transform(data), target)
+        # The shipped scalers were fitted on DataFrames; the API validates against these names
+        scaler.feature_names_in_ = np.array(DEMAND_FEATURES if key == "demand" else FEATURES, dtype=object)
+        joblib.dump(model, os.path.join(target_dir, f"{key}_model.pkl"))
+        joblib.dump(scaler, os.path.join(target_dir, f"{key}_scaler.pkl"))
+
+    joblib.dump({"product_category_name": categories, "month_year": month_years}, os.path.join(target_dir, "label_encoders.pkl"))
+    for name, features in (("features.json", FEATURES), ("demand_features.json", DEMAND_FEATURES)):
+        with open(os.path.join(target_dir, name), "w") as f:
+            json.dump(features, f)
+    with open(os.path.join(target_dir, "metadata.json"), "w") as f:
+        json.dump({"version": "stand-in"}, f)
+
+
+def percentiles(samples_ms: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples_ms)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(int(q * len(ordered)), len(ordered) - 1)], 3)
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered), 3),
+        "p50_ms": pick(0.50),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "max_ms": round(ordered[-1], 3),
+    }
+
+
+def time_calls(call: Callable[[Any], Any], payloads: List[Any]) -> List[float]:
+    samples = []
+    for payload in payloads:
+        started = time.perf_counter()
+        call(payload)
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def measure_cold_start(env: Dict[str, str], request: Dict[str, Any]) -> Dict[str, float]:
+    """Import + first request in a fresh interpreter, i.e. what a new container pays."""
+    script = (
+        "import json, sys, time\n"
+        "t0 = time.perf_counter()\n"
+        "import main\n"
+        "from fastapi.testclient import TestClient\n"
+        "t1 = time.perf_counter()\n"
+        "with TestClient(main.app) as client:\n"
+        "    t2 = time.perf_counter()\n"
+        "    client.post('/predict-prices', json=json.loads(sys.argv[1])).raise_for_status()\n"
+        "    t3 = time.perf_counter()\n"
+        "print(json.dumps({'import_ms': (t1 - t0) * 1000, 'startup_ms': (t2 - t1) * 1000,"
+        " 'first_request_ms': (t3 - t2) * 1000, 'total_ms': (t3 - t0) * 1000}))\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", script, json.dumps(request)],
+        cwd=PRICE_API_DIR, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return {key: round(value, 1) for key, value in json.loads(output.strip().splitlines()[-1]).items()}
+
+
+def bench_in_process(requests: List[Dict[str, Any]], latency_requests: int, batch_sizes: List[int], grid_sizes: List[int]) -> Dict[str, Any]:
+    """`requests` must hold at least max(batch_sizes) products; latency runs use the first `latency_requests`."""
+    import numpy as np
+    from fastapi.testclient import TestClient
+
+    import main
+    from feature_plan import MarketColumns, TimeContext
+
+    results: Dict[str, Any] = {}
+    with TestClient(main.app) as client:
+        client.post("/predict-prices", json=requests[0]).raise_for_status()
+
+        def post_one(payload):
+            client.post("/predict-prices", json=payload).raise_for_status()
+
+        single = requests[:latency_requests]
+        results["predict_prices"] = percentiles(time_calls(post_one, single))
+
+        # Same products again: served from the prediction cache when it is enabled
+        results["predict_prices_repeat"] = percentiles(time_calls(post_one, single))
+
+        batches = {}
+        for size in batch_sizes:
+            main.prediction_cache.clear()
+            payload = requests[:size]
+            started = time.perf_counter()
+            client.post("/predict-prices/batch", json=payload).raise_for_status()
+            elapsed = time.perf_counter() - started
+            # keyed by what was actually sent, so a short request list can't pass for a bigger batch
+            batches[str(len(payload))] = {
+                "products": len(payload),
+                "elapsed_ms": round(elapsed * 1000, 3),
+                "products_per_sec": round(len(payload) / elapsed, 1),
+            }
+        results["batch"] = batches
+
+    models = main.store.current()
+    parsed = [main.PricingRequest(**payload) for payload in requests]
+    ctx = TimeContext.now(models.encoders)
+    grids = {}
+    for grid_points in grid_sizes:
+        for products in (1, min(100, len(parsed))):
+            market = MarketColumns.from_requests(parsed[:products], models.encoders)
+            samples = time_calls(
+                lambda _: main.optimize_prices(models.pipeline("profit"), market, ctx, grid_points=grid_points),
+                range(10),
+            )
+            grids[f"grid{grid_points}_products{products}"] = {
+                "mean_ms": round(float(np.mean(samples)), 3),
+                "min_ms": round(float(np.min(samples)), 3),
+            }
+    results["optimize_prices"] = grids
+    results["health"] = main.store.status()
+    return results
+
+
+def bench_uvicorn(env: Dict[str, str], requests: List[Dict[str, Any]], port: int) -> Dict[str, Any]:
+    """Single requests vs. one batch of the same products, both uncached."""
+    # The batch resends products the single-request loop just priced, and the
+    # server's cache can't be cleared from here; with it on, the batch would
+    # only measure cache hits
+    server_env = dict(env, PRICE_API_CACHE_TTL_SEC="0")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=PRICE_API_DIR, env=server_env,
+    )
+    base = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.time() + 60
+        while True:
+            try:
+                urllib.request.urlopen(f"{base}/health", timeout=1).read()
+                break
+            except OSError:
+                if time.time() > deadline or server.poll() is not None:
+                    raise RuntimeError("uvicorn did not become healthy")
+                time.sleep(0.2)
+
+        def post(path: str, payload: Any) -> None:
+            body = json.dumps(payload).encode()
+            req = urllib.request.Request(f"{base}{path}", data=body, headers={"Content-Type": "application/json"})
+            urllib.request.urlopen(req, timeout=60).read()
+
+        post("/predict-prices", requests[0])
+        latency = percentiles(time_calls(lambda payload: post("/predict-prices", payload), requests))
+        started = time.perf_counter()
+        post("/predict-prices/batch", requests)
+        elapsed = time.perf_counter() - started
+        return {
+            "cache": "disabled",
+            "predict_prices": latency,
+            "batch": {"products": len(requests), "elapsed_ms": round(elapsed * 1000, 3),
+                      "products_per_sec": round(len(requests) / elapsed, 1)},
+        }
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def _flatten(prefix: str, value: Any, out: Dict[str, float]) -> Dict[str, float]:
+    if isinstance(value, dict):
+        for key, item in value.items():
+            _flatten(f"{prefix}.{key}" if prefix else key, item, out)
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        out[prefix] = float(value)
+    return out
+
+
+def compare(current: Dict[str, Any], previous: Dict[str, Any]) -> List[str]:
+    """Lists latency-style metrics (*_ms) that got slower than REGRESSION_THRESHOLD."""
+    now = _flatten("", current["results"], {})
+    before = _flatten("", previous["results"], {})
+    regressions = []
+    for key, value in sorted(now.items()):
+        old = before.get(key)
+        if not key.endswith("_ms") or not old or key.startswith("health"):
+            continue
+        change = (value - old) / old
+        if change > REGRESSION_THRESHOLD:
+            regressions.append(f"{key}: {old:.3f} -> {value:.3f} ms (+{change:.0%})")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Pricing API benchmark")
+    parser.add_argument("--requests", type=int, default=200, help="requests for latency percentiles")
+    parser.add_argument("--batch-sizes", default="1,10,100,1000")
+    parser.add_argument("--grid-sizes", default="10,25,50,100")
+    parser.add_argument("--models-dir", default=os.path.join(PRICE_API_DIR, "models"))
+    parser.add_argument("--uvicorn", action="store_true", help="also benchmark a local uvicorn server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output", default="price_api_benchmark.json")
+    parser.add_argument("--compare", help="previous results JSON to check for regressions")
+    args = parser.parse_args()
+
+    rows = load_retail_rows()
+    requests = synthetic_requests(rows, max(args.requests, max(int(s) for s in args.batch_sizes.split(","))))
+
+    models_dir = args.models_dir
+    stand_in = not shipped_models_usable(models_dir)
+    workdir = tempfile.mkdtemp(prefix="price_api_bench_")
+    if stand_in:
+        models_dir = os.path.join(workdir, "models")
+        build_stand_in_models(models_dir, rows)
+
+    # The API reads its settings at import time, so configure before importing main
+    env = dict(os.environ)
+    env.update({"PRICE_API_MODELS_DIR": models_dir, "PRICE_API_MODEL_WATCH_SEC": "0"})
+    os.environ.update(env)
+    sys.path.insert(0, PRICE_API_DIR)
+
+    report: Dict[str, Any] = {
+        "timestamp": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "models": "stand-in" if stand_in else "shipped",
+        "config": {key: value for key, value in sorted(env.items()) if key.startswith("PRICE_API_")},
+        "results": {},
+    }
+    report["results"]["cold_start"] = measure_cold_start(env, requests[0])
+    report["results"]["in_process"] = bench_in_process(
+        requests,
+        args.requests,
+        [int(size) for size in args.batch_sizes.split(",")],
+        [int(size) for size in args.grid_sizes.split(",")],
+    )
+    if args.uvicorn:
+        report["results"]["uvicorn"] = bench_uvicorn(env, requests[:args.requests], args.port)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    print(json.dumps(report["results"], indent=2, default=str))
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f))
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
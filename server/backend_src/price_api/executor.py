@@ -0,0 +1,155 @@
+"""
+Bounded executor for CPU-bound inference.
+
+Handlers await submit()/submit_one() instead of running sklearn on the
+event loop or in Starlette's shared threadpool. The number of queued
+items is capped (QueueFullError -> 503); a batch larger than the cap is
+admitted when the queue is otherwise empty, so it counts as the whole queue
+rather than being rejected outright. With a micro-batch window
+single-product requests that arrive within a few milliseconds of each
+other are merged into one batch call.
+
+PRICE_API_INFERENCE_MODE=process runs batches in a spawned process pool;
+each child imports the API module and keeps its own models, cache and
+model watcher. The API process then loads no models itself, and /health and
+/cache/stats answer from one of the inference processes.
+"""
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Tuple
+
+INFERENCE_MODE = os.getenv("PRICE_API_INFERENCE_MODE", "thread")
+INFERENCE_WORKERS = int(os.getenv("PRICE_API_INFERENCE_WORKERS", "2"))
+INFERENCE_QUEUE_LIMIT = int(os.getenv("PRICE_API_INFERENCE_QUEUE_LIMIT", "256"))
+MICROBATCH_WINDOW_MS = float(os.getenv("PRICE_API_MICROBATCH_WINDOW_MS", "0"))
+MICROBATCH_MAX_SIZE = int(os.getenv("PRICE_API_MICROBATCH_MAX_SIZE", "128"))
+
+
+class QueueFullError(RuntimeError):
+    pass
+
+
+class InferenceExecutor:
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], List[Any]],
+        mode: str = INFERENCE_MODE,
+        workers: int = INFERENCE_WORKERS,
+        queue_limit: int = INFERENCE_QUEUE_LIMIT,
+        window_ms: float = MICROBATCH_WINDOW_MS,
+        max_batch_size: int = MICROBATCH_MAX_SIZE,
+        initializer: Optional[Callable[[], None]] = None,
+    ):
+        self.batch_fn = batch_fn
+        self.mode = mode
+        self.workers = max(workers, 1)
+        self.queue_limit = queue_limit
+        self.window_sec = window_ms / 1000.0
+        self.max_batch_size = max(max_batch_size, 1)
+        self._initializer = initializer
+        self._pool: Optional[Executor] = None
+        # Items accepted but not finished; only touched from the event loop
+        self._depth = 0
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self.rejected = 0
+        self.batches = 0
+        self.items = 0
+
+    def _executor(self) -> Executor:
+        if self._pool is None:
+            if self.mode == "process":
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=self._initializer,
+                )
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+        return self._pool
+
+    def _reserve(self, count: int) -> int:
+        """Claims queue slots; returns how many so the caller releases the same amount."""
+        if self.queue_limit > 0:
+            if self._depth + min(count, self.queue_limit) > self.queue_limit:
+                self.rejected += count
+                raise QueueFullError(f"Inference queue full ({self._depth}/{self.queue_limit})")
+            # an oversized batch takes the whole queue instead of never fitting
+            count = min(count, self.queue_limit)
+        self._depth += count
+        return count
+
+    async def _run(self, items: List[Any], reserved: int) -> List[Any]:
+        loop = asyncio.get_running_loop()
+        try:
+            self.batches += 1
+            self.items += len(items)
+            return await loop.run_in_executor(self._executor(), self.batch_fn, items)
+        finally:
+            self._depth -= reserved
+
+    async def submit(self, items: List[Any]) -> List[Any]:
+        """Runs one batch as-is; raises QueueFullError when over the queue limit."""
+        reserved = self._reserve(len(items))
+        return await self._run(items, reserved)
+
+    async def call(self, fn: Callable[[], Any]) -> Any:
+        """Runs a small no-argument function on the pool (in process mode: in one inference process)."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor(), fn)
+
+    async def submit_one(self, item: Any) -> Any:
+        """Runs a single item, merged with its neighbours when micro-batching is on."""
+        if self.window_sec <= 0:
+            return (await self.submit([item]))[0]
+
+        self._reserve(1)
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window_sec, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._run_pending(batch))
+
+    async def _run_pending(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        try:
+            results = await self._run([item for item, _ in batch], len(batch))
+        except Exception as exc:  # noqa: BLE001
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "queue_depth": self._depth,
+            "queue_limit": self.queue_limit,
+            "microbatch_window_ms": self.window_sec * 1000.0,
+            "batches": self.batches,
+            "items": self.items,
+            "rejected": self.rejected,
+        }
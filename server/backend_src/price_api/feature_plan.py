@@ -0,0 +1,178 @@
+"""
+Column layout for the pricing models.
+
+A FeaturePlan is compiled once from a features.json list: every known
+feature gets a fixed column index and a source, so building a batch of
+candidate rows is a handful of vectorized column writes into a
+preallocated matrix instead of one dict per candidate price.
+"""
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, Optional, Sequence
+
+import numpy as np
+
+FALLBACK_PRODUCT_SCORE = 0.5
+DEFAULT_CATEGORY_ENCODED = 0.0
+
+# Features that change with the candidate price; everything else is fixed per product
+PRICE_FEATURES = ("price_vs_avg_comp", "price_ratio_to_avg_comp", "your_price")
+
+
+@dataclass(frozen=True)
+class TimeContext:
+    day_of_week: int
+    month: int
+    month_year_encoded: float
+
+    @classmethod
+    def now(cls, encoders=None) -> "TimeContext":
+        now = datetime.utcnow()
+        encoded = encoders.month_year(now.month, now.year) if encoders is not None else None
+        return cls(
+            day_of_week=now.weekday(),
+            month=now.month,
+            month_year_encoded=encoded if encoded is not None else now.year * 100 + now.month,
+        )
+
+    @property
+    def is_weekend(self) -> float:
+        return 1.0 if self.day_of_week >= 5 else 0.0
+
+
+@dataclass
+class MarketColumns:
+    """Per-product request fields as column arrays, one entry per product."""
+
+    avg_competitor_price: np.ndarray
+    min_competitor_price: np.ndarray
+    max_competitor_price: np.ndarray
+    cost_per_unit: np.ndarray
+    price_std: np.ndarray
+    product_score: np.ndarray
+    category_encoded: np.ndarray
+
+    @classmethod
+    def from_requests(cls, requests: Sequence, encoders=None) -> "MarketColumns":
+        raw = np.array(
+            [
+                (
+                    req.avg_competitor_price,
+                    req.min_competitor_price,
+                    req.max_competitor_price,
+                    req.cost_per_unit,
+                    req.price_std,
+                )
+                for req in requests
+            ],
+            dtype=np.float64,
+        ).reshape(-1, 5)
+        avg, low, high, cost, std = raw.T
+        spread = high - low
+        # Same rule as _price_std: explicit std wins, else a third of the spread
+        std = np.where(std > 0, std, np.where(spread > 0, spread / 3, 0.0))
+
+        default_score = encoders.default_product_score if encoders is not None else FALLBACK_PRODUCT_SCORE
+        score = np.array(
+            [req.product_score if req.product_score is not None else default_score for req in requests],
+            dtype=np.float64,
+        )
+        if encoders is not None:
+            category = encoders.category_codes(req.product_category_name for req in requests)
+        else:
+            category = np.full(len(requests), DEFAULT_CATEGORY_ENCODED)
+        return cls(avg, low, high, cost, std, score, category)
+
+    def __len__(self) -> int:
+        return len(self.avg_competitor_price)
+
+
+_Source = Callable[[MarketColumns, TimeContext], object]
+
+STATIC_SOURCES: Dict[str, _Source] = {
+    "price_std": lambda m, t: m.price_std,
+    "product_score": lambda m, t: m.product_score,
+    "avg_competitor_price": lambda m, t: m.avg_competitor_price,
+    "min_competitor_price": lambda m, t: m.min_competitor_price,
+    "max_competitor_price": lambda m, t: m.max_competitor_price,
+    "cost_per_unit": lambda m, t: m.cost_per_unit,
+    "month_year_encoded": lambda m, t: float(t.month_year_encoded),
+    "day_of_week": lambda m, t: float(t.day_of_week),
+    "month": lambda m, t: float(t.month),
+    "is_weekend": lambda m, t: t.is_weekend,
+    "product_category_name_encoded": lambda m, t: m.category_encoded,
+}
+
+
+class FeaturePlan:
+    def __init__(self, names: Sequence[str]):
+        self.names = tuple(names)
+        self.width = len(self.names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        # Unknown feature names stay at 0.0, matching the old .get(name, 0.0)
+        self._static = [(self.index[name], STATIC_SOURCES[name]) for name in self.names if name in STATIC_SOURCES]
+        self._price_columns = {name: self.index.get(name) for name in PRICE_FEATURES}
+        self.price_columns = np.array([i for i in self._price_columns.values() if i is not None], dtype=np.intp)
+
+    @classmethod
+    def from_file(cls, path: str) -> "FeaturePlan":
+        with open(path, "r") as f:
+            return cls(json.load(f))
+
+    def validate(self, model, label: str) -> None:
+        """Fails model loading when the plan's column order can't match the estimator."""
+        expected = getattr(model, "n_features_in_", None)
+        if expected is not None and expected != self.width:
+            raise RuntimeError(f"{label} expects {expected} features, feature plan has {self.width}")
+        trained_names: Optional[np.ndarray] = getattr(model, "feature_names_in_", None)
+        if trained_names is not None and tuple(trained_names) != self.names:
+            raise RuntimeError(f"{label} feature order {list(trained_names)} does not match {list(self.names)}")
+
+    def base_rows(self, market: MarketColumns, ctx: TimeContext) -> np.ndarray:
+        """One row per product with every price-independent column filled."""
+        rows = np.zeros((len(market), self.width), dtype=np.float64)
+        for column, source in self._static:
+            rows[:, column] = source(market, ctx)
+        return rows
+
+    def fill_candidates(
+        self,
+        base: np.ndarray,
+        market: MarketColumns,
+        prices: np.ndarray,
+        out: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """
+        Expands base rows to one row per (product, candidate price).
+
+        prices has shape (products, candidates); row i * candidates + j of the
+        result scores prices[i, j]. Pass out to reuse a buffer across calls.
+        """
+        products, candidates = prices.shape
+        if out is None:
+            out = np.empty((products * candidates, self.width), dtype=np.float64)
+        view = out.reshape(products, candidates, self.width)
+        view[:] = base[:, None, :]
+
+        # Products without a market average are priced against themselves
+        avg = market.avg_competitor_price[:, None]
+        reference = np.where(avg != 0, avg, prices)
+        columns = self._price_columns
+        if columns["price_vs_avg_comp"] is not None:
+            view[:, :, columns["price_vs_avg_comp"]] = prices - reference
+        if columns["price_ratio_to_avg_comp"] is not None:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                ratio = np.where(reference != 0, prices / reference, 1.0)
+            view[:, :, columns["price_ratio_to_avg_comp"]] = ratio
+        if columns["your_price"] is not None:
+            view[:, :, columns["your_price"]] = prices
+        return out
+
+    def rows(self, market: MarketColumns, ctx: TimeContext, prices: Sequence[float]) -> np.ndarray:
+        """One row per product, each at its own single candidate price."""
+        base = self.base_rows(market, ctx)
+        return self.fill_candidates(base, market, np.asarray(prices, dtype=np.float64).reshape(-1, 1))
+
@@ -1,47 +1,96 @@
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-import joblib
+from pydantic import BaseModel, confloat
 import numpy as np
 from datetime import datetime
-import json
 import os
+from typing import List, Optional
+
+from cache import PredictionCache
+from executor import InferenceExecutor, QueueFullError
+from feature_plan import MarketColumns, TimeContext
+from pipeline import InferencePipeline
+from registry import PRELOAD_MODELS, ModelSet, ModelStore
 
 MIN_MARGIN_MULTIPLIER = 1.1
-FALLBACK_PRODUCT_SCORE = 0.5
-DEFAULT_CATEGORY_ENCODED = 0.0
+MAX_BATCH_SIZE = int(os.getenv("PRICE_API_MAX_BATCH_SIZE", "5000"))
+
+# Price search space for the revenue / profit strategies
+SEARCH_FLOOR_RATIO = 0.8
+SEARCH_CEILING_RATIO = 1.25
+OPTIMIZER_GRID_POINTS = int(os.getenv("PRICE_API_GRID_POINTS", "25"))
+OPTIMIZER_REFINE_ROUNDS = int(os.getenv("PRICE_API_REFINE_ROUNDS", "2"))
+# Predictions within this share of the best one count as a tie, broken toward the anchor price;
+# a whole band inside it is a flat response and the anchor price is used as-is
+OPTIMIZER_TIE_TOLERANCE = float(os.getenv("PRICE_API_TIE_TOLERANCE", "1e-4"))
+# Anchor prices (the pre-search strategy prices): a markup over the competitor average
+REVENUE_ANCHOR_MULTIPLIER = 1.05
+PROFIT_ANCHOR_MULTIPLIER = 1.10
 
 app = FastAPI(title="Dynamic Pricing API", version="1.0.0")
 
-# Load models at startup
-revenue_model = joblib.load('models/revenue_model.pkl')
-profit_model = joblib.load('models/profit_model.pkl')
-demand_model = joblib.load('models/demand_model.pkl')
+WARMUP_REQUEST = {
+    "product_id": "warmup",
+    "avg_competitor_price": 50.0,
+    "min_competitor_price": 40.0,
+    "max_competitor_price": 60.0,
+    "cost_per_unit": 25.0,
+}
+
+
+def _warm_models(model_set: ModelSet) -> None:
+    predict_batch([PricingRequest(**WARMUP_REQUEST)], model_set, use_cache=False)
+
+
+# Models load lazily on first use (or at startup with PRICE_API_PRELOAD_MODELS=1);
+# new versions are loaded, warmed and swapped in by the store's watcher thread
+store = ModelStore(warmup=_warm_models)
+prediction_cache = PredictionCache()
+
+
+def _init_inference_process() -> None:
+    # Runs in each spawned inference process (PRICE_API_INFERENCE_MODE=process)
+    if PRELOAD_MODELS:
+        store.current().load()
+    store.start_watching()
+
+
+@app.on_event("startup")
+def start_model_store():
+    # In process mode the inference processes own the models (see _init_inference_process);
+    # a copy loaded or watched here would never serve a request
+    if inference.mode == "process":
+        return
+    if PRELOAD_MODELS:
+        store.current().load()
+    store.start_watching()
 
-with open('models/features.json', 'r') as f:
-    feature_names = json.load(f)
+
+@app.on_event("shutdown")
+def stop_model_store():
+    inference.shutdown()
+    store.stop_watching()
+
+
+# Zero or negative prices would collapse the search band to 0 and divide by it in the margin
+PositivePrice = confloat(gt=0)
 
 
 class PricingRequest(BaseModel):
     product_id: str
-    avg_competitor_price: float
-    min_competitor_price: float
-    max_competitor_price: float
-    cost_per_unit: float
+    avg_competitor_price: PositivePrice
+    min_competitor_price: PositivePrice
+    max_competitor_price: PositivePrice
+    cost_per_unit: PositivePrice
     price_std: float = 0.0
+    product_category_name: Optional[str] = None
+    product_score: Optional[float] = None
 
 
 class PricingResponse(BaseModel):
     product_id: str
     timestamp: str
     strategies: dict
-
-
-def _current_time_context() -> tuple[int, int, int]:
-    now = datetime.utcnow()
-    day_of_week = now.weekday()
-    month = now.month
-    month_year_encoded = now.year * 100 + now.month
-    return day_of_week, month, month_year_encoded
+    model_version: Optional[str] = None
 
 
 def _price_std(req: PricingRequest) -> float:
@@ -51,56 +100,258 @@ def _price_std(req: PricingRequest) -> float:
     return float(spread / 3) if spread > 0 else 0.0
 
 
-def _with_price_features(req: PricingRequest, candidate_price: float) -> dict[str, float]:
-    day_of_week, month, month_year_encoded = _current_time_context()
-    avg_price = req.avg_competitor_price or candidate_price
-    ratio = candidate_price / avg_price if avg_price else 1.0
-    price_delta = candidate_price - avg_price
-
-    feature_map: dict[str, float] = {
-        "price_std": _price_std(req),
-        "product_score": FALLBACK_PRODUCT_SCORE,
-        "avg_competitor_price": float(req.avg_competitor_price),
-        "min_competitor_price": float(req.min_competitor_price),
-        "month_year_encoded": float(month_year_encoded),
-        "price_vs_avg_comp": float(price_delta),
-        "day_of_week": float(day_of_week),
-        "month": float(month),
-        "cost_per_unit": float(req.cost_per_unit),
-        "product_category_name_encoded": DEFAULT_CATEGORY_ENCODED,
-        "is_weekend": 1.0 if day_of_week >= 5 else 0.0,
-        "price_ratio_to_avg_comp": float(ratio),
-        "max_competitor_price": float(req.max_competitor_price)
-    }
+def _search_bounds(market: MarketColumns) -> tuple[np.ndarray, np.ndarray]:
+    floors = np.maximum(
+        market.cost_per_unit * MIN_MARGIN_MULTIPLIER,
+        market.min_competitor_price * SEARCH_FLOOR_RATIO
+    )
+    ceilings = np.maximum(market.max_competitor_price * SEARCH_CEILING_RATIO, floors)
+    return floors, ceilings
+
+
+def anchor_prices(market: MarketColumns, multiplier: float) -> np.ndarray:
+    """Strategy price without a model: avg competitor price × multiplier, never under the minimum margin."""
+    return np.maximum(market.avg_competitor_price * multiplier, market.cost_per_unit * MIN_MARGIN_MULTIPLIER)
 
-    return feature_map
+
+def optimize_prices(
+    pipeline: InferencePipeline,
+    market: MarketColumns,
+    ctx: TimeContext,
+    anchors: Optional[np.ndarray] = None,
+    grid_points: int = OPTIMIZER_GRID_POINTS,
+    refine_rounds: int = OPTIMIZER_REFINE_ROUNDS,
+    tie_tolerance: float = OPTIMIZER_TIE_TOLERANCE,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Coarse-to-fine search for the price that maximizes the model prediction.
+
+    Every round scores the candidate grids of all products with a single
+    predict call, then narrows each grid to one step either side of its best
+    price. Near-equal predictions are resolved toward `anchors` (default: the
+    band floor), and a product whose whole band predicts the same value gets
+    its anchor price, since the model gives no reason to move off it.
+    Returns (best_prices, best_values), one entry per product.
+    """
+    grid_points = max(grid_points, 3)
+    products = len(market)
+    floors, ceilings = _search_bounds(market)
+    anchors = floors if anchors is None else np.clip(anchors, floors, ceilings)
+    lows, highs = floors.copy(), ceilings.copy()
+    rows = np.arange(products)
+    steps = np.linspace(0.0, 1.0, grid_points)
+
+    best_prices = floors.copy()
+    best_values = np.full(products, -np.inf)
+    flat = np.zeros(products, dtype=bool)
+    flat_values = np.zeros(products)
+
+    base = pipeline.base_rows(market, ctx)
+    matrix = np.empty((products * grid_points, pipeline.plan.width), dtype=np.float64)
+
+    for round_no in range(refine_rounds + 1):
+        grid = lows[:, None] + (highs - lows)[:, None] * steps[None, :]
+        pipeline.fill_candidates(base, market, grid, out=matrix)
+        values = pipeline.predict(matrix).reshape(products, grid_points)
+
+        top = values.max(axis=1)
+        tolerance = tie_tolerance * np.maximum(np.abs(top), 1.0)
+        if round_no == 0:
+            flat = top - values.min(axis=1) <= tolerance
+            flat_values = values.mean(axis=1)
+
+        # among candidates tied with the best, take the one nearest the anchor
+        tied = values >= (top - tolerance)[:, None]
+        round_idx = np.where(tied, np.abs(grid - anchors[:, None]), np.inf).argmin(axis=1)
+        round_values = values[rows, round_idx]
+        round_prices = grid[rows, round_idx]
+        closer = np.abs(round_prices - anchors) < np.abs(best_prices - anchors)
+        improved = (round_values > best_values + tolerance) | (
+            (np.abs(round_values - best_values) <= tolerance) & closer
+        )
+        best_prices = np.where(improved, round_prices, best_prices)
+        best_values = np.where(improved, round_values, best_values)
+
+        spacing = (highs - lows) / (grid_points - 1)
+        lows = np.maximum(best_prices - spacing, floors)
+        highs = np.minimum(best_prices + spacing, ceilings)
+
+    best_prices = np.where(flat, anchors, best_prices)
+    best_values = np.where(flat, flat_values, best_values)
+    return best_prices, best_values
+
+
+def optimize_price(pipeline: InferencePipeline, req: PricingRequest, **search_options) -> tuple[float, float]:
+    encoders = store.current().encoders
+    market = MarketColumns.from_requests([req], encoders)
+    best_prices, best_values = optimize_prices(pipeline, market, TimeContext.now(encoders), **search_options)
+    return float(best_prices[0]), float(best_values[0])
+
+
+def _undercut_price(req: PricingRequest) -> float:
+    # Competitive Undercutting (ensure minimum margin)
+    undercut_price = round(req.min_competitor_price * 0.95, 2)
+    min_viable_price = round(req.cost_per_unit * MIN_MARGIN_MULTIPLIER, 2)
+    if undercut_price < min_viable_price:
+        undercut_price = min_viable_price
+    return undercut_price
+
+
+def _build_response(
+    req: PricingRequest,
+    prices: tuple[float, float, float],
+    predictions: tuple[float, float, float],
+    timestamp: str,
+) -> dict:
+    revenue_price, profit_price, undercut_price = prices
+    predicted_revenue, predicted_profit, predicted_demand = (max(float(p), 0.0) for p in predictions)
+    undercut_revenue = undercut_price * predicted_demand
+
+    return {
+        "product_id": req.product_id,
+        "timestamp": timestamp,
+        "strategies": {
+            "revenue_maximization": {
+                "recommended_price": round(revenue_price, 2),
+                "predicted_revenue": round(predicted_revenue, 2),
+                "description": "Maximizes total revenue (price × volume)",
+                "confidence": "medium"
+            },
+            "profit_maximization": {
+                "recommended_price": round(profit_price, 2),
+                "predicted_profit": round(predicted_profit, 2),
+                "profit_margin_pct": round(((profit_price - req.cost_per_unit) / profit_price) * 100, 1),
+                "description": "Maximizes profit margin per unit",
+                "confidence": "medium"
+            },
+            "competitive_undercut": {
+                "recommended_price": round(undercut_price, 2),
+                "predicted_demand": round(predicted_demand, 1),
+                "estimated_revenue": round(undercut_revenue, 2),
+                "description": "Undercuts cheapest competitor by 5%",
+                "confidence": "high"
+            }
+        },
+        "market_context": _market_context(req)
+    }
 
 
-def build_feature_vector(req: PricingRequest, candidate_price: float) -> list[float]:
-    feature_map = _with_price_features(req, candidate_price)
-    return [float(feature_map.get(name, 0.0)) for name in feature_names]
+def _market_context(req: PricingRequest) -> dict:
+    return {
+        "avg_competitor_price": req.avg_competitor_price,
+        "min_competitor_price": req.min_competitor_price,
+        "max_competitor_price": req.max_competitor_price,
+        "your_cost": req.cost_per_unit,
+        "price_std": _price_std(req)
+    }
 
 
-def optimize_price(model, features, cost, min_price, max_price, step=0.50):
+def cache_key(req: PricingRequest, model_fingerprint: Optional[str], ctx: TimeContext) -> tuple:
+    """
+    Requests that round to the same cents (on the same model/day) share a
+    prediction. Keyed on the metadata fingerprint, not the version string,
+    so retrained models that kept their "version" never serve stale prices.
     """
-    Grid search to find optimal price that maximizes model prediction
+    return (
+        model_fingerprint,
+        ctx.day_of_week,
+        ctx.month,
+        ctx.month_year_encoded,
+        round(req.avg_competitor_price, 2),
+        round(req.min_competitor_price, 2),
+        round(req.max_competitor_price, 2),
+        round(req.cost_per_unit, 2),
+        round(_price_std(req), 2),
+        req.product_category_name,
+        None if req.product_score is None else round(req.product_score, 2),
+    )
+
+
+def predict_batch(
+    requests: List[PricingRequest],
+    models: Optional[ModelSet] = None,
+    use_cache: bool = True,
+) -> List[dict]:
     """
-    prices = np.arange(min_price, max_price, step)
-    best_price = min_price
-    best_value = -float('inf')
-    
-    for price in prices:
-        # Create feature vector with this price
-        test_features = features.copy()
-        # Models don't directly use price, but affect through demand
-        
-        predicted_value = model.predict([test_features])[0]
-        
-        if predicted_value > best_value:
-            best_value = predicted_value
-            best_price = price
-    
-    return float(best_price), float(best_value)
+    Prices a batch of products. Cached products skip feature building and
+    inference; the rest call each model a fixed number of times per batch
+    (once per search round), independent of the batch size.
+    The whole batch runs on one model set, even if a new version is swapped
+    in meanwhile.
+    """
+    if not requests:
+        return []
+
+    models = models or store.current()
+    encoders = models.encoders
+    ctx = TimeContext.now(encoders)
+    timestamp = datetime.utcnow().isoformat()
+    use_cache = use_cache and prediction_cache.enabled
+
+    responses: List[Optional[dict]] = [None] * len(requests)
+    keys: List[Optional[tuple]] = [None] * len(requests)
+    misses: List[int] = []
+    for i, req in enumerate(requests):
+        if use_cache:
+            keys[i] = cache_key(req, models.fingerprint, ctx)
+            cached = prediction_cache.get(keys[i])
+            if cached is not None:
+                responses[i] = {
+                    **cached,
+                    "product_id": req.product_id,
+                    "timestamp": timestamp,
+                    "market_context": _market_context(req),
+                }
+                continue
+        misses.append(i)
+
+    if misses:
+        pending = [requests[i] for i in misses]
+        computed = _predict_uncached(pending, models, ctx, timestamp)
+        for i, response in zip(misses, computed):
+            responses[i] = response
+            if use_cache:
+                prediction_cache.put(keys[i], response)
+
+    return responses
+
+
+def _predict_uncached(
+    requests: List[PricingRequest],
+    models: ModelSet,
+    ctx: TimeContext,
+    timestamp: str,
+) -> List[dict]:
+    market = MarketColumns.from_requests(requests, models.encoders)
+
+    # Strategies 1 & 2: search the price grid against the revenue / profit models
+    revenue_prices, predicted_revenue = optimize_prices(
+        models.pipeline("revenue"), market, ctx, anchors=anchor_prices(market, REVENUE_ANCHOR_MULTIPLIER)
+    )
+    profit_prices, predicted_profit = optimize_prices(
+        models.pipeline("profit"), market, ctx, anchors=anchor_prices(market, PROFIT_ANCHOR_MULTIPLIER)
+    )
+
+    # Strategy 3: rule-based undercut, scored by the demand model
+    undercut_prices = [_undercut_price(req) for req in requests]
+    demand_pipeline = models.pipeline("demand")
+    predicted_demand = demand_pipeline.predict(demand_pipeline.rows(market, ctx, undercut_prices))
+
+    prices = [
+        (round(float(revenue_prices[i]), 2), round(float(profit_prices[i]), 2), undercut_prices[i])
+        for i in range(len(requests))
+    ]
+
+    responses = []
+    for i, req in enumerate(requests):
+        response = _build_response(req, prices[i], (predicted_revenue[i], predicted_profit[i], predicted_demand[i]), timestamp)
+        response["model_version"] = models.version
+        responses.append(response)
+    return responses
+
+
+# CPU-bound inference runs here, never on the event loop
+inference = InferenceExecutor(predict_batch, initializer=_init_inference_process)
 
 
 @app.get("/")
@@ -109,7 +360,7 @@ def root():
 
 
 @app.post("/predict-prices", response_model=PricingResponse)
-def predict_optimal_prices(request: PricingRequest):
+async def predict_optimal_prices(request: PricingRequest):
     """
     Returns 3 pricing strategies:
     1. Revenue Maximization
@@ -117,80 +368,67 @@ def predict_optimal_prices(request: PricingRequest):
     3. Competitive Undercutting
     """
     try:
-        # Prepare baseline inferred price
-        baseline_price = max(
-            request.avg_competitor_price,
-            request.cost_per_unit * MIN_MARGIN_MULTIPLIER
-        )
+        return await inference.submit_one(request)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
 
-        # Strategy 1: Revenue Maximization (slightly above market average)
-        revenue_price = round(max(baseline_price, request.avg_competitor_price * 1.05), 2)
-        revenue_features = build_feature_vector(request, revenue_price)
-        predicted_revenue = float(revenue_model.predict([revenue_features])[0])
-
-        # Strategy 2: Profit Maximization (higher margin target)
-        profit_price = round(max(baseline_price, request.avg_competitor_price * 1.10), 2)
-        profit_features = build_feature_vector(request, profit_price)
-        predicted_profit = float(profit_model.predict([profit_features])[0])
-
-        # Strategy 3: Competitive Undercutting (ensure minimum margin)
-        undercut_price = round(request.min_competitor_price * 0.95, 2)
-        min_viable_price = round(request.cost_per_unit * MIN_MARGIN_MULTIPLIER, 2)
-        if undercut_price < min_viable_price:
-            undercut_price = min_viable_price
-
-        undercut_features = build_feature_vector(request, undercut_price)
-        predicted_demand = float(demand_model.predict([undercut_features])[0])
-
-        predicted_revenue = max(predicted_revenue, 0.0)
-        predicted_profit = max(predicted_profit, 0.0)
-        predicted_demand = max(predicted_demand, 0.0)
-        undercut_revenue = undercut_price * predicted_demand
-
-        response = {
-            "product_id": request.product_id,
-            "timestamp": datetime.utcnow().isoformat(),
-            "strategies": {
-                "revenue_maximization": {
-                    "recommended_price": round(revenue_price, 2),
-                    "predicted_revenue": round(predicted_revenue, 2),
-                    "description": "Maximizes total revenue (price × volume)",
-                    "confidence": "medium"
-                },
-                "profit_maximization": {
-                    "recommended_price": round(profit_price, 2),
-                    "predicted_profit": round(predicted_profit, 2),
-                    "profit_margin_pct": round(((profit_price - request.cost_per_unit) / profit_price) * 100, 1),
-                    "description": "Maximizes profit margin per unit",
-                    "confidence": "medium"
-                },
-                "competitive_undercut": {
-                    "recommended_price": round(undercut_price, 2),
-                    "predicted_demand": round(predicted_demand, 1),
-                    "estimated_revenue": round(undercut_revenue, 2),
-                    "description": "Undercuts cheapest competitor by 5%",
-                    "confidence": "high"
-                }
-            },
-            "market_context": {
-                "avg_competitor_price": request.avg_competitor_price,
-                "min_competitor_price": request.min_competitor_price,
-                "max_competitor_price": request.max_competitor_price,
-                "your_cost": request.cost_per_unit,
-                "price_std": _price_std(request)
-            }
-        }
-        
-        return response
-    
+
+@app.post("/predict-prices/batch", response_model=List[PricingResponse])
+async def predict_optimal_prices_batch(requests: List[PricingRequest]):
+    """
+    Same strategies as /predict-prices for many products at once.
+    Results are returned in request order.
+    """
+    if len(requests) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large: {len(requests)} > {MAX_BATCH_SIZE}"
+        )
+    try:
+        return await inference.submit(requests)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
 
 
-@app.get("/health")
-def health_check():
+@app.get("/inference/stats")
+def inference_stats():
+    return inference.stats()
+
+
+def _cache_stats() -> dict:
+    return {**prediction_cache.stats(), "pid": os.getpid()}
+
+
+def _health() -> dict:
+    model_status = store.status()
     return {
-        "status": "healthy",
-        "models_loaded": True,
+        "status": "unhealthy" if model_status["error"] else "healthy",
+        **model_status,
+        "pid": os.getpid(),
         "timestamp": datetime.utcnow().isoformat()
-    }
\ No newline at end of file
+    }
+
+
+async def _from_inference(fn):
+    """
+    In process mode the models and cache live in the inference processes, so
+    the answer comes from one of them (whichever the pool picks); each
+    process has its own cache, and "pid" says which one reported.
+    """
+    if inference.mode == "process":
+        return await inference.call(fn)
+    return fn()
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return await _from_inference(_cache_stats)
+
+
+@app.get("/health")
+async def health_check():
+    return await _from_inference(_health)
\ No newline at end of file
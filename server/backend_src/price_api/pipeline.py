@@ -0,0 +1,137 @@
+"""
+Per-model inference pipeline: encode -> scale -> predict.
+
+Label encoders become plain dict lookups and StandardScaler statistics are
+folded into two NumPy arrays, so the whole transform is a couple of
+vectorized ops over the batch matrix instead of sklearn transform calls.
+"""
+from __future__ import annotations
+
+import os
+from typing import Dict, Iterable, Optional
+
+import joblib
+import numpy as np
+
+from feature_plan import DEFAULT_CATEGORY_ENCODED, FALLBACK_PRODUCT_SCORE, FeaturePlan, MarketColumns, TimeContext
+
+
+def load_optional(path: str):
+    return joblib.load(path) if os.path.exists(path) else None
+
+
+class Encoders:
+    """O(1) lookups built from the training label encoders."""
+
+    def __init__(
+        self,
+        categories: Dict[str, float],
+        month_years: Dict[str, float],
+        default_product_score: float = FALLBACK_PRODUCT_SCORE,
+    ):
+        self.categories = categories
+        self.month_years = month_years
+        self.default_product_score = default_product_score
+        # Latest known code per calendar month, for dates after the training window
+        self._month_fallback: Dict[int, float] = {}
+        for key in sorted(month_years, key=lambda k: (k[-4:], k[3:5])):
+            self._month_fallback[int(key[3:5])] = month_years[key]
+
+    @classmethod
+    def load(cls, path: str, reference_scaler=None) -> "Encoders":
+        label_encoders = load_optional(path) or {}
+
+        def _table(name: str) -> Dict[str, float]:
+            encoder = label_encoders.get(name)
+            if encoder is None:
+                return {}
+            return {str(label): float(code) for code, label in enumerate(encoder.classes_)}
+
+        # Missing scores are imputed with the training mean when a scaler knows it
+        default_score = FALLBACK_PRODUCT_SCORE
+        names = getattr(reference_scaler, "feature_names_in_", None)
+        if names is not None and "product_score" in list(names) and reference_scaler.mean_ is not None:
+            default_score = float(reference_scaler.mean_[list(names).index("product_score")])
+
+        return cls(_table("product_category_name"), _table("month_year"), default_score)
+
+    def category_codes(self, names: Iterable[Optional[str]]) -> np.ndarray:
+        lookup = self.categories.get
+        return np.array(
+            [lookup(name, DEFAULT_CATEGORY_ENCODED) if name else DEFAULT_CATEGORY_ENCODED for name in names],
+            dtype=np.float64,
+        )
+
+    def month_year(self, month: int, year: int) -> Optional[float]:
+        if not self.month_years:
+            return None
+        code = self.month_years.get(f"01-{month:02d}-{year}")
+        if code is None:
+            code = self._month_fallback.get(month)
+        return code
+
+
+class FoldedScaler:
+    """StandardScaler folded into x * multiplier + offset."""
+
+    def __init__(self, multiplier: np.ndarray, offset: np.ndarray):
+        self.multiplier = multiplier
+        self.offset = offset
+
+    @classmethod
+    def from_sklearn(cls, scaler, width: int) -> "FoldedScaler":
+        scale = scaler.scale_ if getattr(scaler, "scale_", None) is not None else np.ones(width)
+        mean = scaler.mean_ if getattr(scaler, "mean_", None) is not None else np.zeros(width)
+        multiplier = 1.0 / np.asarray(scale, dtype=np.float64)
+        return cls(multiplier, -np.asarray(mean, dtype=np.float64) * multiplier)
+
+    def apply(self, matrix: np.ndarray) -> np.ndarray:
+        matrix *= self.multiplier
+        matrix += self.offset
+        return matrix
+
+    def apply_columns(self, matrix: np.ndarray, columns: np.ndarray) -> np.ndarray:
+        matrix[:, columns] = matrix[:, columns] * self.multiplier[columns] + self.offset[columns]
+        return matrix
+
+
+class InferencePipeline:
+    """
+    Feature plan, folded scaler and estimator for one model.
+
+    Base rows are scaled once per product; candidate expansion only rescales
+    the price-dependent columns, so the candidate matrix handed to predict is
+    already in model space.
+    """
+
+    def __init__(self, model, plan: FeaturePlan, scaler=None, label: str = "model"):
+        plan.validate(model, label)
+        if scaler is not None:
+            plan.validate(scaler, f"{label} scaler")
+        self.model = model
+        self.plan = plan
+        self.label = label
+        self.scaler = FoldedScaler.from_sklearn(scaler, plan.width) if scaler is not None else None
+
+    def base_rows(self, market: MarketColumns, ctx: TimeContext) -> np.ndarray:
+        rows = self.plan.base_rows(market, ctx)
+        return self.scaler.apply(rows) if self.scaler is not None else rows
+
+    def fill_candidates(
+        self,
+        base: np.ndarray,
+        market: MarketColumns,
+        prices: np.ndarray,
+        out: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        matrix = self.plan.fill_candidates(base, market, prices, out=out)
+        if self.scaler is not None and len(self.plan.price_columns):
+            self.scaler.apply_columns(matrix, self.plan.price_columns)
+        return matrix
+
+    def rows(self, market: MarketColumns, ctx: TimeContext, prices) -> np.ndarray:
+        base = self.base_rows(market, ctx)
+        return self.fill_candidates(base, market, np.asarray(prices, dtype=np.float64).reshape(-1, 1))
+
+    def predict(self, matrix: np.ndarray) -> np.ndarray:
+        return self.model.predict(matrix)
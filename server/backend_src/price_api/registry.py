@@ -0,0 +1,301 @@
+"""
+Lazy, versioned model registry for the price API.
+
+Nothing is read from disk at import time: the first request that needs a
+model loads the whole set (models, feature plans, scalers, encoders) under
+a lock. Paths resolve relative to this package unless PRICE_API_MODELS_DIR
+is set, and PRICE_API_MMAP_MODELS=1 loads pickles with mmap_mode='r' so
+array-backed estimators share pages between worker processes.
+PRICE_API_COMPILED_MODELS selects models served by the array-backed
+evaluator in tree_eval.py instead of sklearn.
+
+ModelStore watches metadata.json (or the newest subdirectory of
+PRICE_API_MODEL_VERSIONS_DIR) and hot-swaps a fully loaded, warmed
+ModelSet when it changes. Requests hold on to the set they started with,
+so in-flight work finishes on the old version.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import joblib
+
+from feature_plan import FeaturePlan
+from pipeline import Encoders, InferencePipeline, load_optional
+from tree_eval import CompiledEnsemble, max_abs_error
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODELS_DIR = os.getenv("PRICE_API_MODELS_DIR", os.path.join(PACKAGE_DIR, "models"))
+MMAP_MODELS = os.getenv("PRICE_API_MMAP_MODELS", "0").lower() in ("1", "true", "yes")
+PRELOAD_MODELS = os.getenv("PRICE_API_PRELOAD_MODELS", "0").lower() in ("1", "true", "yes")
+MODEL_VERSIONS_DIR = os.getenv("PRICE_API_MODEL_VERSIONS_DIR", "")
+MODEL_WATCH_INTERVAL_SEC = float(os.getenv("PRICE_API_MODEL_WATCH_SEC", "30"))
+# Comma-separated model keys (or "all") served by tree_eval instead of sklearn
+COMPILED_MODELS = {
+    key.strip() for key in os.getenv("PRICE_API_COMPILED_MODELS", "").split(",") if key.strip()
+}
+# Pickles compiled at load time must reproduce sklearn within this on COMPILE_CHECK_ROWS probe
+# rows, or the model is served by sklearn: from_sklearn leans on private sklearn internals
+COMPILE_TOLERANCE = float(os.getenv("PRICE_API_COMPILE_TOLERANCE", "1e-9"))
+COMPILE_CHECK_ROWS = 256
+METADATA_FILE = "metadata.json"
+
+MODEL_FILES = {
+    "revenue": ("revenue_model.pkl", "revenue_scaler.pkl", "features.json"),
+    "profit": ("profit_model.pkl", "profit_scaler.pkl", "features.json"),
+    "demand": ("demand_model.pkl", "demand_scaler.pkl", "demand_features.json"),
+}
+
+
+class ModelSet:
+    def __init__(
+        self,
+        models_dir: str = MODELS_DIR,
+        mmap: bool = MMAP_MODELS,
+        compiled: frozenset = frozenset(COMPILED_MODELS),
+    ):
+        self.models_dir = models_dir
+        self.mmap_mode = "r" if mmap else None
+        self.compiled = compiled
+        self.backends: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._pipelines: Optional[Dict[str, InferencePipeline]] = None
+        self._encoders: Optional[Encoders] = None
+        self.load_ms: Dict[str, float] = {}
+        # model key -> max abs error of the in-memory compile against sklearn
+        self.compile_errors: Dict[str, float] = {}
+        self.loaded_at: Optional[str] = None
+        self.error: Optional[str] = None
+        self.version, self.fingerprint = read_version(models_dir)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.models_dir, name)
+
+    @property
+    def loaded(self) -> bool:
+        return self._pipelines is not None
+
+    def load(self) -> "ModelSet":
+        if self._pipelines is not None:
+            return self
+        with self._lock:
+            if self._pipelines is not None:
+                return self
+            try:
+                self._load()
+            except Exception as exc:
+                self.error = str(exc)
+                raise
+        return self
+
+    def _load(self) -> None:
+        started = time.perf_counter()
+        plans: Dict[str, FeaturePlan] = {}
+        pipelines: Dict[str, InferencePipeline] = {}
+        scalers: Dict[str, Any] = {}
+
+        for key, (model_file, scaler_file, features_file) in MODEL_FILES.items():
+            model_started = time.perf_counter()
+            model = self._load_model(key, model_file)
+            scalers[key] = load_optional(self.path(scaler_file))
+            if features_file not in plans:
+                plans[features_file] = FeaturePlan.from_file(self.path(features_file))
+            pipelines[key] = InferencePipeline(model, plans[features_file], scalers[key], f"{key}_model")
+            self.load_ms[key] = round((time.perf_counter() - model_started) * 1000, 1)
+
+        self._encoders = Encoders.load(self.path("label_encoders.pkl"), reference_scaler=scalers["revenue"])
+        self.load_ms["total"] = round((time.perf_counter() - started) * 1000, 1)
+        self.loaded_at = datetime.utcnow().isoformat()
+        self.error = None
+        # Published last so readers never see a half-built set
+        self._pipelines = pipelines
+
+    def _load_model(self, key: str, model_file: str):
+        if key not in self.compiled and "all" not in self.compiled:
+            self.backends[key] = "sklearn"
+            return joblib.load(self.path(model_file), mmap_mode=self.mmap_mode)
+
+        # Prefer exported arrays (see tree_export.py); otherwise compile the pickle in memory
+        compiled_dir = self.path(model_file.replace(".pkl", ".compiled"))
+        if os.path.isdir(compiled_dir):
+            self.backends[key] = "compiled"
+            return CompiledEnsemble.load(compiled_dir, mmap_mode=self.mmap_mode)
+        model = joblib.load(self.path(model_file))
+        compiled = CompiledEnsemble.from_sklearn(model)
+        error = max_abs_error(model, compiled, rows=COMPILE_CHECK_ROWS)
+        self.compile_errors[key] = error
+        if not error <= COMPILE_TOLERANCE:
+            self.backends[key] = "sklearn"
+            return model
+        self.backends[key] = "compiled_from_pickle"
+        return compiled
+
+    def pipeline(self, key: str) -> InferencePipeline:
+        return self.load()._pipelines[key]
+
+    @property
+    def encoders(self) -> Encoders:
+        return self.load()._encoders
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "model_version": self.version,
+            "models_loaded": self.loaded,
+            "models_dir": self.models_dir,
+            "mmap": self.mmap_mode is not None,
+            "backends": dict(self.backends),
+            "compile_max_abs_error": dict(self.compile_errors),
+            "loaded_at": self.loaded_at,
+            "load_time_ms": dict(self.load_ms),
+            "error": self.error,
+        }
+
+
+def read_version(models_dir: str) -> Tuple[str, Optional[str]]:
+    """
+    Returns (version, fingerprint) for a models directory.
+
+    The fingerprint is a hash of metadata.json and changes on every rewrite;
+    the version is its "version" field, falling back to the fingerprint.
+    """
+    try:
+        with open(os.path.join(models_dir, METADATA_FILE), "rb") as f:
+            raw = f.read()
+    except OSError:
+        return "unversioned", None
+
+    fingerprint = hashlib.sha1(raw).hexdigest()[:12]
+    try:
+        metadata = json.loads(raw)
+    except ValueError:
+        metadata = None
+    if isinstance(metadata, dict):
+        for key in ("version", "model_version", "trained_at"):
+            if metadata.get(key):
+                return str(metadata[key]), fingerprint
+    return fingerprint, fingerprint
+
+
+def _natural_key(text: str) -> Tuple[Tuple[int, int, str], ...]:
+    # digit runs compare as numbers, so v10 sorts after v9 and 1.10 after 1.9
+    return tuple((0, int(part), "") if part.isdigit() else (1, 0, part.lower()) for part in re.findall(r"\d+|\D+", text))
+
+
+def _version_order(models_dir: str) -> tuple:
+    """Sort key for a version directory: metadata version, then trained_at, then metadata.json mtime."""
+    path = os.path.join(models_dir, METADATA_FILE)
+    try:
+        with open(path, "rb") as f:
+            metadata = json.loads(f.read())
+        mtime = os.path.getmtime(path)
+    except (OSError, ValueError):
+        metadata, mtime = None, 0.0
+    if not isinstance(metadata, dict):
+        metadata = {}
+    version = metadata.get("version") or metadata.get("model_version") or os.path.basename(models_dir)
+    return _natural_key(str(version)), str(metadata.get("trained_at") or ""), mtime
+
+
+def resolve_models_dir() -> str:
+    """Newest version directory when PRICE_API_MODEL_VERSIONS_DIR is set, else MODELS_DIR."""
+    if MODEL_VERSIONS_DIR and os.path.isdir(MODEL_VERSIONS_DIR):
+        candidates = [
+            entry.path
+            for entry in os.scandir(MODEL_VERSIONS_DIR)
+            if entry.is_dir() and os.path.exists(os.path.join(entry.path, METADATA_FILE))
+        ]
+        if candidates:
+            return max(candidates, key=_version_order)
+    return MODELS_DIR
+
+
+class ModelStore:
+    """Holds the current ModelSet and swaps in new versions in the background."""
+
+    def __init__(
+        self,
+        warmup: Optional[Callable[[ModelSet], None]] = None,
+        watch_interval: float = MODEL_WATCH_INTERVAL_SEC,
+    ):
+        self._current = ModelSet(resolve_models_dir())
+        self._warmup = warmup
+        self._watch_interval = watch_interval
+        self._swap_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.swapped_at: Optional[str] = None
+        self.reload_error: Optional[str] = None
+        # (models_dir, fingerprint) of the last version that failed to load
+        self._failed: Optional[Tuple[str, Optional[str]]] = None
+
+    def current(self) -> ModelSet:
+        # A single reference read: callers keep this set for the whole request
+        return self._current
+
+    def start_watching(self) -> None:
+        if self._watch_interval <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="model-watcher", daemon=True)
+        self._thread.start()
+
+    def stop_watching(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self._watch_interval)
+            self._thread = None
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self._watch_interval):
+            try:
+                self.reload_if_changed()
+            except Exception:
+                # reload_if_changed records the failure; keep watching
+                continue
+
+    def reload_if_changed(self) -> bool:
+        models_dir = resolve_models_dir()
+        current = self._current
+        _, fingerprint = read_version(models_dir)
+        if models_dir == current.models_dir and fingerprint == current.fingerprint:
+            return False
+        if (models_dir, fingerprint) == self._failed:
+            return False
+        return self.reload(models_dir)
+
+    def reload(self, models_dir: Optional[str] = None) -> bool:
+        """Loads and warms a new set off the request path, then swaps it in."""
+        with self._swap_lock:
+            candidate = ModelSet(
+                models_dir or resolve_models_dir(),
+                mmap=self._current.mmap_mode is not None,
+                compiled=self._current.compiled,
+            )
+            try:
+                candidate.load()
+                if self._warmup is not None:
+                    self._warmup(candidate)
+            except Exception as exc:
+                self.reload_error = f"{candidate.version}: {exc}"
+                self._failed = (candidate.models_dir, candidate.fingerprint)
+                raise
+            self._current = candidate
+            self.swapped_at = datetime.utcnow().isoformat()
+            self.reload_error = None
+            self._failed = None
+            return True
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            **self._current.status(),
+            "watching": self._thread is not None,
+            "swapped_at": self.swapped_at,
+            "reload_error": self.reload_error,
+        }
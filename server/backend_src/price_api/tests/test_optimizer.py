@@ -0,0 +1,74 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from feature_plan import MarketColumns, TimeContext  # noqa: E402
+
+
+class PricePipeline:
+    """Stands in for InferencePipeline: one column (the candidate price) and a chosen response curve."""
+
+    plan = SimpleNamespace(width=1)
+
+    def __init__(self, response):
+        self.response = response
+
+    def base_rows(self, market, ctx):
+        return None
+
+    def fill_candidates(self, base, market, grid, out):
+        out[:, 0] = grid.ravel()
+
+    def predict(self, matrix):
+        return self.response(matrix[:, 0])
+
+
+def _market(avg=100.0, low=90.0, high=110.0, cost=40.0):
+    req = main.PricingRequest(
+        product_id="p",
+        avg_competitor_price=avg,
+        min_competitor_price=low,
+        max_competitor_price=high,
+        cost_per_unit=cost,
+    )
+    return MarketColumns.from_requests([req])
+
+
+CTX = TimeContext(day_of_week=2, month=6, month_year_encoded=0.0)
+
+
+def test_flat_response_returns_anchor_price():
+    market = _market()
+    anchors = main.anchor_prices(market, main.REVENUE_ANCHOR_MULTIPLIER)
+    prices, values = main.optimize_prices(PricePipeline(lambda p: np.full(len(p), 7.0)), market, CTX, anchors=anchors)
+    assert prices[0] == 105.0
+    assert values[0] == 7.0
+
+
+def test_flat_response_is_not_the_band_floor():
+    market = _market()
+    floors, _ = main._search_bounds(market)
+    anchors = main.anchor_prices(market, main.PROFIT_ANCHOR_MULTIPLIER)
+    prices, _ = main.optimize_prices(PricePipeline(lambda p: np.zeros(len(p))), market, CTX, anchors=anchors)
+    assert prices[0] > floors[0]
+    assert abs(prices[0] - 110.0) < 1e-9
+
+
+def test_peaked_response_still_finds_the_peak():
+    market = _market()
+    anchors = main.anchor_prices(market, main.REVENUE_ANCHOR_MULTIPLIER)
+    prices, _ = main.optimize_prices(PricePipeline(lambda p: -(p - 95.0) ** 2), market, CTX, anchors=anchors)
+    assert abs(prices[0] - 95.0) < 0.5
+
+
+def test_plateau_ties_break_toward_anchor():
+    market = _market()
+    anchors = main.anchor_prices(market, main.REVENUE_ANCHOR_MULTIPLIER)
+    # best value on a plateau from the floor up to 120; the anchor (105) sits on it
+    prices, _ = main.optimize_prices(PricePipeline(lambda p: np.where(p <= 120.0, 10.0, 5.0)), market, CTX, anchors=anchors)
+    assert abs(prices[0] - 105.0) < 1.0
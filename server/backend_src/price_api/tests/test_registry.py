@@ -0,0 +1,34 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import registry  # noqa: E402
+
+
+def _version_dir(root, name, metadata, mtime=None):
+    path = root / name
+    path.mkdir()
+    (path / registry.METADATA_FILE).write_text(json.dumps(metadata))
+    if mtime is not None:
+        os.utime(path / registry.METADATA_FILE, (mtime, mtime))
+    return str(path)
+
+
+def test_resolve_models_dir_compares_versions_numerically(tmp_path, monkeypatch):
+    monkeypatch.setattr(registry, "MODEL_VERSIONS_DIR", str(tmp_path))
+    _version_dir(tmp_path, "v9", {"version": "v9"})
+    newest = _version_dir(tmp_path, "v10", {"version": "v10"})
+
+    assert registry.resolve_models_dir() == newest
+
+
+def test_resolve_models_dir_falls_back_to_trained_at_then_mtime(tmp_path, monkeypatch):
+    monkeypatch.setattr(registry, "MODEL_VERSIONS_DIR", str(tmp_path))
+    _version_dir(tmp_path, "b", {"version": "prod", "trained_at": "2024-01-01T00:00:00"}, mtime=2000)
+    trained_later = _version_dir(tmp_path, "a", {"version": "prod", "trained_at": "2024-06-01T00:00:00"}, mtime=1000)
+    assert registry.resolve_models_dir() == trained_later
+
+    touched_later = _version_dir(tmp_path, "c", {"version": "prod", "trained_at": "2024-06-01T00:00:00"}, mtime=3000)
+    assert registry.resolve_models_dir() == touched_later
@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pytest
+from pydantic import ValidationError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+VALID = {
+    "product_id": "p1",
+    "avg_competitor_price": 100.0,
+    "min_competitor_price": 90.0,
+    "max_competitor_price": 110.0,
+    "cost_per_unit": 60.0,
+}
+
+
+@pytest.mark.parametrize("field", ["avg_competitor_price", "min_competitor_price", "max_competitor_price", "cost_per_unit"])
+@pytest.mark.parametrize("value", [0, -5.0])
+def test_pricing_request_rejects_non_positive_prices(field, value):
+    with pytest.raises(ValidationError):
+        main.PricingRequest(**dict(VALID, **{field: value}))
+
+
+def test_pricing_request_accepts_positive_prices():
+    assert main.PricingRequest(**VALID).cost_per_unit == 60.0
+
+
+def test_cache_key_changes_with_model_fingerprint():
+    req = main.PricingRequest(**VALID)
+    ctx = main.TimeContext(day_of_week=1, month=6, month_year_encoded=0.0)
+    assert main.cache_key(req, "abc123", ctx) != main.cache_key(req, "def456", ctx)
@@ -0,0 +1,57 @@
+import os
+import sys
+
+import joblib
+import numpy as np
+import pytest
+from sklearn.ensemble import GradientBoostingRegressor, RandomForestRegressor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import registry  # noqa: E402
+from tree_eval import CompiledEnsemble  # noqa: E402
+
+
+def _fitted(model):
+    rng = np.random.default_rng(0)
+    X = rng.standard_normal((400, 6))
+    y = 3 * X[:, 0] + 2 * np.sin(X[:, 1]) + X[:, 2] * X[:, 3] + 0.1 * rng.standard_normal(400) + 50
+    return model.fit(X, y)
+
+
+MODELS = [
+    GradientBoostingRegressor(n_estimators=100, max_depth=3, learning_rate=0.1, random_state=0),
+    RandomForestRegressor(n_estimators=30, max_depth=8, random_state=0, n_jobs=1),
+]
+
+
+@pytest.mark.parametrize("model", MODELS, ids=lambda m: type(m).__name__)
+def test_compiled_ensemble_matches_sklearn(model, tmp_path):
+    model = _fitted(model)
+    # more rows than one ROW_CHUNK, so chunked evaluation is covered too
+    probe = np.random.default_rng(1).standard_normal((1000, 6)) * 2.0
+    expected = model.predict(probe)
+
+    compiled = CompiledEnsemble.from_sklearn(model)
+    np.testing.assert_allclose(compiled.predict(probe), expected, rtol=0, atol=1e-9)
+
+    compiled.save(str(tmp_path / "compiled"))
+    loaded = CompiledEnsemble.load(str(tmp_path / "compiled"), mmap_mode="r")
+    np.testing.assert_allclose(loaded.predict(probe), expected, rtol=0, atol=1e-9)
+
+
+def test_in_memory_compile_falls_back_to_sklearn_when_outputs_differ(tmp_path, monkeypatch):
+    model = _fitted(MODELS[0])
+    joblib.dump(model, tmp_path / "revenue_model.pkl")
+    models = registry.ModelSet(str(tmp_path), mmap=False, compiled=frozenset({"all"}))
+
+    assert isinstance(models._load_model("revenue", "revenue_model.pkl"), CompiledEnsemble)
+    assert models.backends["revenue"] == "compiled_from_pickle"
+
+    # e.g. a sklearn upgrade changed what from_sklearn reads out of the model
+    monkeypatch.setattr(registry, "max_abs_error", lambda *args, **kwargs: 0.5)
+    served = models._load_model("revenue", "revenue_model.pkl")
+
+    assert isinstance(served, GradientBoostingRegressor)
+    assert models.backends["revenue"] == "sklearn"
+    assert models.status()["compile_max_abs_error"] == {"revenue": 0.5}
@@ -0,0 +1,53 @@
+"""
+Exports the pickled tree ensembles to array-backed artifacts for tree_eval.
+
+Usage: python tree_export.py [models_dir] [--tolerance 1e-6]
+
+Writes <name>_model.compiled/ next to each <name>_model.pkl, after checking
+that the compiled evaluator reproduces the sklearn predictions on random
+probe rows.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+
+import joblib
+
+from registry import MODEL_FILES, MODELS_DIR
+from tree_eval import CompiledEnsemble, max_abs_error
+
+PROBE_ROWS = 2000
+
+
+def compiled_dir(models_dir: str, model_file: str) -> str:
+    return os.path.join(models_dir, model_file.replace(".pkl", ".compiled"))
+
+
+def export_models(models_dir: str, tolerance: float) -> int:
+    failures = 0
+    for key, (model_file, _, _) in MODEL_FILES.items():
+        model = joblib.load(os.path.join(models_dir, model_file))
+        compiled = CompiledEnsemble.from_sklearn(model)
+        error = max_abs_error(model, compiled, rows=PROBE_ROWS)
+        if error > tolerance:
+            print(f"{key}: max abs error {error:.3g} > {tolerance:g}, not exported", file=sys.stderr)
+            failures += 1
+            continue
+        target = compiled_dir(models_dir, model_file)
+        compiled.save(target)
+        print(f"{key}: {compiled.n_trees} trees, {len(compiled.value)} nodes, max abs error {error:.3g} -> {target}")
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("models_dir", nargs="?", default=MODELS_DIR)
+    parser.add_argument("--tolerance", type=float, default=1e-6)
+    args = parser.parse_args()
+    return 1 if export_models(args.models_dir, args.tolerance) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
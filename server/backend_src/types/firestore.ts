@@ -1,4 +1,4 @@
-export type ScrapeJobStatus = "queued" | "running" | "succeeded" | "failed";
+export type ScrapeJobStatus = "queued" | "running" | "succeeded" | "failed" | "dead_letter";
 
 export interface ScrapeJobDoc {
   jobId: string;
@@ -11,6 +11,8 @@ export interface ScrapeJobDoc {
   retryAt?: unknown;
   lastError?: string | null;
   snapshotId?: string;
+  leasedBy?: string;
+  leaseExpiresAt?: FirebaseFirestore.Timestamp | null;
   createdAt: FirebaseFirestore.Timestamp | null;
   updatedAt: FirebaseFirestore.Timestamp | null;
 }
@@ -29,7 +31,7 @@ export interface CompetitorEntry {
   scrapedAt: FirebaseFirestore.Timestamp;
 }
 
-export type PricingStatus = "pending" | "processing" | "completed" | "failed";
+export type PricingStatus = "scraping" | "pending" | "processing" | "completed" | "failed";
 
 export interface CompetitorSnapshotDoc {
   snapshotId: string;
@@ -1,7 +1,51 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Dict, List, Optional
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from logging_utils import info, warn
+
+
+# Resource types aborted before they hit the network unless a domain overrides them.
+# Stylesheets stay on: some price selectors depend on rendered visibility.
+DEFAULT_BLOCKED_RESOURCE_TYPES: Tuple[str, ...] = ("image", "media", "font")
+# Substrings of request URLs (analytics, ads, session replay) that never carry a price
+DEFAULT_BLOCKED_URL_PATTERNS: Tuple[str, ...] = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "googlesyndication.com",
+    "doubleclick.net",
+    "adservice.google.",
+    "connect.facebook.net",
+    "facebook.com/tr",
+    "bat.bing.com",
+    "hotjar.com",
+    "fullstory.com",
+    "clarity.ms",
+    "scorecardresearch.com",
+    "criteo.",
+    "taboola.com",
+    "outbrain.com",
+    "amazon-adsystem.com",
+    "newrelic.com",
+    "nr-data.net",
+    "segment.io",
+    "optimizely.com",
+)
+BLOCK_RESOURCES = os.getenv("SCRAPER_BLOCK_RESOURCES", "1") not in ("0", "false", "False")
+# Navigation wait for domains that don't set one: "networkidle" | "load" | "domcontentloaded"
+DEFAULT_WAIT_UNTIL = os.getenv("SCRAPER_WAIT_UNTIL", "networkidle")
+
+# Per-domain configs live in this file (.json, or .yaml/.yml with PyYAML installed)
+DOMAINS_FILE = os.getenv("SCRAPER_DOMAINS_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "domains.json"))
+# How often lookups check the file for changes; negative disables reloading
+DOMAINS_RELOAD_SEC = float(os.getenv("SCRAPER_DOMAINS_RELOAD_SEC", "5"))
+# Hostnames remembered per index; cleared wholesale when full
+LOOKUP_CACHE_SIZE = 10_000
 
 
 @dataclass
@@ -10,33 +54,196 @@ class DomainConfig:
     price_selectors: List[str]
     consent_selectors: List[str]
     wait_selector: Optional[str] = None
+    # None = DEFAULT_WAIT_UNTIL; "domcontentloaded" relies on wait_selector for SPA prices
+    wait_until: Optional[str] = None
+    # None = DEFAULT_BLOCKED_RESOURCE_TYPES; [] disables type blocking for the domain
+    blocked_resource_types: Optional[List[str]] = None
+    # appended to DEFAULT_BLOCKED_URL_PATTERNS
+    blocked_url_patterns: List[str] = field(default_factory=list)
+    # URL substrings that must load even if a default pattern matches them
+    allowed_url_patterns: List[str] = field(default_factory=list)
+    # price only exists after client-side rendering: skip the static HTTP tier
+    js_only: bool = False
+
+    def navigation_wait(self) -> str:
+        return self.wait_until or DEFAULT_WAIT_UNTIL
+
+    def should_block(self, resource_type: str, url: str) -> bool:
+        return _should_block(
+            resource_type,
+            url,
+            self.blocked_resource_types if self.blocked_resource_types is not None else DEFAULT_BLOCKED_RESOURCE_TYPES,
+            self.blocked_url_patterns,
+            self.allowed_url_patterns,
+        )
+
+
+_CONFIG = "\0config"
+
+
+class DomainIndex:
+    """
+    Immutable snapshot of the registry: a trie keyed by reversed hostname
+    labels (com -> amazon -> www) plus a per-hostname lookup cache. A key
+    matches the host itself and every subdomain; the longest match wins.
+    """
+
+    def __init__(self, configs: Dict[str, DomainConfig]):
+        self.size = len(configs)
+        self._root: Dict[str, Any] = {}
+        for key, cfg in configs.items():
+            node = self._root
+            for label in reversed(_normalize_key(key).split(".")):
+                node = node.setdefault(label, {})
+            node[_CONFIG] = cfg
+        self._cache: Dict[str, Optional[DomainConfig]] = {}
+
+    def lookup(self, hostname: str) -> Optional[DomainConfig]:
+        try:
+            return self._cache[hostname]
+        except KeyError:
+            pass
+        found = None
+        node = self._root
+        for label in reversed(_normalize_host(hostname).split(".")):
+            node = node.get(label)
+            if node is None:
+                break
+            found = node.get(_CONFIG, found)
+        if len(self._cache) >= LOOKUP_CACHE_SIZE:
+            self._cache.clear()
+        self._cache[hostname] = found
+        return found
+
+
+def _normalize_host(hostname: str) -> str:
+    host = hostname.lower().rstrip(".")
+    if ":" in host and not host.startswith("["):
+        host = host.split(":", 1)[0]
+    return host
+
+
+def _normalize_key(key: str) -> str:
+    key = _normalize_host(key)
+    # "www.shop.com" and "*.shop.com" both mean shop.com and its subdomains
+    for prefix in ("*.", "www."):
+        if key.startswith(prefix):
+            key = key[len(prefix):]
+    return key
 
 
-DOMAIN_CONFIGS: Dict[str, DomainConfig] = {
-    # Example configs – extend as needed
-    "www.amazon.com": DomainConfig(
-        name="amazon",
-        price_selectors=["span.a-offscreen", "span.a-price-whole"],
-        consent_selectors=["#sp-cc-accept", "input#sp-cc-accept"],
-        wait_selector="span.a-offscreen",
-    ),
-    "www.bestbuy.com": DomainConfig(
-        name="bestbuy",
-        price_selectors=["div.priceView-hero-price span"],
-        consent_selectors=["button#onetrust-accept-btn-handler"],
-        wait_selector="div.priceView-hero-price",
-    ),
-}
+def _read_file(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError as exc:
+                raise RuntimeError("PyYAML is required for a YAML domain registry; install pyyaml or use JSON") from exc
+            return yaml.safe_load(f) or {}
+        return json.load(f)
+
+
+def load_domain_configs(path: str) -> Dict[str, DomainConfig]:
+    raw = _read_file(path)
+    entries = raw.get("domains", raw) if isinstance(raw, dict) else None
+    if not isinstance(entries, dict):
+        raise ValueError(f"{path}: expected a mapping of domain -> config")
+    configs: Dict[str, DomainConfig] = {}
+    for key, fields in entries.items():
+        try:
+            configs[key] = DomainConfig(**fields)
+        except TypeError as exc:
+            raise ValueError(f"{path}: bad config for {key}: {exc}") from exc
+    return configs
+
+
+class DomainRegistry:
+    """File-backed domain configs; rebuilt and swapped in whole when the file changes."""
+
+    def __init__(self, path: str = DOMAINS_FILE, check_interval: float = DOMAINS_RELOAD_SEC):
+        self.path = path
+        self.check_interval = check_interval
+        self._index = DomainIndex({})
+        self._stamp: Optional[Tuple[float, int]] = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self.reload()
+
+    def _file_stamp(self) -> Optional[Tuple[float, int]]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime, st.st_size
+
+    def reload(self) -> bool:
+        """Re-reads the file if it changed. A bad file keeps the previous index."""
+        with self._lock:
+            stamp = self._file_stamp()
+            if stamp == self._stamp:
+                return False
+            if stamp is None:
+                warn("domains", "registry_missing", path=self.path)
+                index = DomainIndex({})
+            else:
+                try:
+                    index = DomainIndex(load_domain_configs(self.path))
+                except Exception as exc:  # noqa: BLE001
+                    warn("domains", "registry_reload_failed", path=self.path, error=str(exc))
+                    # don't retry the same broken file on every check
+                    self._stamp = stamp
+                    return False
+            # single reference swap: readers see the old index or the new one, never a mix
+            self._index = index
+            self._stamp = stamp
+            info("domains", "registry_loaded", path=self.path, domains=index.size)
+            return True
+
+    def get(self, hostname: str) -> Optional[DomainConfig]:
+        if self.check_interval >= 0:
+            now = time.monotonic()
+            if now >= self._next_check:
+                self._next_check = now + self.check_interval
+                self.reload()
+        return self._index.lookup(hostname)
+
+
+registry = DomainRegistry()
 
 
 def get_domain_config(hostname: str) -> Optional[DomainConfig]:
-    if hostname in DOMAIN_CONFIGS:
-        return DOMAIN_CONFIGS[hostname]
-    # fallback: try without subdomain
-    parts = hostname.split(".")
-    if len(parts) > 2:
-        root = ".".join(parts[-2:])
-        for key, cfg in DOMAIN_CONFIGS.items():
-            if key.endswith(root):
-                return cfg
-    return None
+    return registry.get(hostname)
+
+
+def _should_block(
+    resource_type: str,
+    url: str,
+    resource_types: Sequence[str],
+    extra_patterns: List[str],
+    allowed_patterns: List[str],
+) -> bool:
+    # the page itself is never blocked, only what it pulls in
+    if resource_type == "document":
+        return False
+    if any(pattern in url for pattern in allowed_patterns):
+        return False
+    if resource_type in resource_types:
+        return True
+    return any(pattern in url for pattern in DEFAULT_BLOCKED_URL_PATTERNS) or any(
+        pattern in url for pattern in extra_patterns
+    )
+
+
+def should_block_request(hostname: str, resource_type: str, url: str) -> bool:
+    """Routing decision for a subresource of a page on `hostname`."""
+    if not BLOCK_RESOURCES:
+        return False
+    cfg = get_domain_config(hostname)
+    if cfg is not None:
+        return cfg.should_block(resource_type, url)
+    return _should_block(resource_type, url, DEFAULT_BLOCKED_RESOURCE_TYPES, [], [])
+
+
+def navigation_wait(hostname: str) -> str:
+    cfg = get_domain_config(hostname)
+    return cfg.navigation_wait() if cfg else DEFAULT_WAIT_UNTIL
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional
+
+
+HOST_RATE_PER_SEC = float(os.getenv("SCRAPER_HOST_RATE_PER_SEC", "2"))
+HOST_BURST = float(os.getenv("SCRAPER_HOST_BURST", "2"))
+# Floor for the adaptive rate after repeated blocks
+HOST_MIN_RATE_PER_SEC = float(os.getenv("SCRAPER_HOST_MIN_RATE_PER_SEC", "0.1"))
+
+BREAKER_WINDOW = int(os.getenv("SCRAPER_BREAKER_WINDOW", "20"))
+BREAKER_MIN_SAMPLES = int(os.getenv("SCRAPER_BREAKER_MIN_SAMPLES", "5"))
+BREAKER_BLOCKED_RATIO = float(os.getenv("SCRAPER_BREAKER_BLOCKED_RATIO", "0.5"))
+BREAKER_COOLDOWN_SEC = float(os.getenv("SCRAPER_BREAKER_COOLDOWN_SEC", "60"))
+BREAKER_MAX_COOLDOWN_SEC = float(os.getenv("SCRAPER_BREAKER_MAX_COOLDOWN_SEC", "900"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class TokenBucket:
+    """Async token bucket whose refill rate can be lowered and restored at runtime."""
+
+    def __init__(self, rate: float = HOST_RATE_PER_SEC, burst: float = HOST_BURST, min_rate: float = HOST_MIN_RATE_PER_SEC):
+        self.base_rate = max(rate, 1e-3)
+        self.rate = self.base_rate
+        self.min_rate = min(max(min_rate, 1e-3), self.base_rate)
+        self.burst = max(burst, 1.0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, abort: Optional[Callable[[], bool]] = None) -> bool:
+        """Waits for a token; returns False early if `abort()` turns true while waiting."""
+        while True:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            if abort is not None and abort():
+                return False
+            # short naps so a lowered rate or an abort is noticed promptly
+            await asyncio.sleep(min((1 - self._tokens) / self.rate, 1.0))
+
+    def slow_down(self) -> None:
+        # multiplicative decrease on a block ...
+        self.rate = max(self.min_rate, self.rate / 2)
+
+    def speed_up(self) -> None:
+        # ... additive increase back towards the configured rate on success
+        self.rate = min(self.base_rate, self.rate + self.base_rate / 10)
+
+
+class CircuitBreaker:
+    """Opens when the blocked share of recent outcomes crosses a threshold; probes one URL at a time to close."""
+
+    def __init__(
+        self,
+        window: int = BREAKER_WINDOW,
+        min_samples: int = BREAKER_MIN_SAMPLES,
+        blocked_ratio: float = BREAKER_BLOCKED_RATIO,
+        cooldown_sec: float = BREAKER_COOLDOWN_SEC,
+        max_cooldown_sec: float = BREAKER_MAX_COOLDOWN_SEC,
+    ):
+        self.min_samples = max(min_samples, 1)
+        self.blocked_ratio = blocked_ratio
+        self.base_cooldown = cooldown_sec
+        self.max_cooldown = max_cooldown_sec
+        self.cooldown = cooldown_sec
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probe_inflight = False
+        self.times_opened = 0
+        self._outcomes: Deque[bool] = deque(maxlen=max(window, self.min_samples))
+
+    @property
+    def blocked_rate(self) -> float:
+        return sum(self._outcomes) / len(self._outcomes) if self._outcomes else 0.0
+
+    def admit(self) -> bool:
+        """True if a request may go out; marks it as the probe when half-open."""
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            if self.probe_inflight:
+                return False
+            self.probe_inflight = True
+        return True
+
+    def release_probe(self) -> None:
+        self.probe_inflight = False
+
+    def record(self, blocked: bool) -> None:
+        if self.state == HALF_OPEN:
+            self.probe_inflight = False
+            if blocked:
+                self._open(backoff=True)
+            else:
+                self.state = CLOSED
+                self.cooldown = self.base_cooldown
+                self._outcomes.clear()
+            return
+        self._outcomes.append(blocked)
+        if (
+            self.state == CLOSED
+            and len(self._outcomes) >= self.min_samples
+            and self.blocked_rate >= self.blocked_ratio
+        ):
+            self._open(backoff=False)
+
+    def _open(self, backoff: bool) -> None:
+        if backoff:
+            self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+
+    def retry_in(self) -> Optional[float]:
+        if self.state != OPEN:
+            return None
+        return max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
+
+
+class HostState:
+    def __init__(self, per_host: int):
+        self.semaphore = asyncio.Semaphore(per_host)
+        self.bucket = TokenBucket()
+        self.breaker = CircuitBreaker()
+        self.requests = 0
+        self.blocked = 0
+        self.short_circuited = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        retry_in = self.breaker.retry_in()
+        return {
+            "circuit": self.breaker.state,
+            "ratePerSec": round(self.bucket.rate, 3),
+            "blockedRate": round(self.breaker.blocked_rate, 3),
+            "requests": self.requests,
+            "blocked": self.blocked,
+            "shortCircuited": self.short_circuited,
+            "timesOpened": self.breaker.times_opened,
+            "retryInSec": round(retry_in, 1) if retry_in is not None else None,
+        }
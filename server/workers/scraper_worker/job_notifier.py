@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from typing import Any, Optional
+
+from google.cloud import firestore
+
+from job_queue import SCRAPE_JOBS_COLLECTION, get_client
+from logging_utils import info, warn
+
+
+LISTENER_ENABLED = os.getenv("SCRAPER_JOB_LISTENER", "1") not in ("0", "false", "False")
+# Only the head of the queue is watched; a job entering it is what matters
+LISTENER_WINDOW = int(os.getenv("SCRAPER_LISTENER_WINDOW", "50"))
+# Seconds between attempts to re-open a dropped listener
+LISTENER_RETRY_SEC = float(os.getenv("SCRAPER_LISTENER_RETRY_SEC", "30"))
+
+
+class JobNotifier:
+    """Pushes a wakeup into an asyncio queue whenever the set of queued jobs changes."""
+
+    def __init__(self, client: Optional[firestore.Client] = None, window: int = LISTENER_WINDOW, retry_sec: float = LISTENER_RETRY_SEC):
+        self._client = client
+        self.window = max(window, 1)
+        self.retry_sec = retry_sec
+        # maxsize 1: a burst of events collapses into a single pending wakeup
+        self.wakeups: "asyncio.Queue[None]" = asyncio.Queue(maxsize=1)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._watch: Any = None
+        self._synced = False
+        self._last_attempt = 0.0
+        self.events = 0
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        self._subscribe()
+
+    def _subscribe(self) -> None:
+        self._last_attempt = time.monotonic()
+        self._synced = False
+        client = self._client or get_client()
+        query = (
+            client.collection(SCRAPE_JOBS_COLLECTION)
+            .where("status", "==", "queued")
+            .order_by("priority", direction=firestore.Query.DESCENDING)
+            .order_by("createdAt")
+            .limit(self.window)
+        )
+        try:
+            self._watch = query.on_snapshot(self._on_snapshot)
+            info("queue", "job_listener_started", window=self.window)
+        except Exception as exc:  # noqa: BLE001
+            self._watch = None
+            warn("queue", "job_listener_failed", error=str(exc))
+
+    def _on_snapshot(self, docs, changes, read_time) -> None:
+        # runs on the Firestore watch thread
+        first = not self._synced
+        self._synced = True
+        if not changes and not first:
+            return
+        self.events += 1
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._push)
+
+    def _push(self) -> None:
+        try:
+            self.wakeups.put_nowait(None)
+        except asyncio.QueueFull:
+            pass
+
+    @property
+    def listening(self) -> bool:
+        """True once the listener has delivered its first snapshot and is still streaming."""
+        return self._watch is not None and self._synced and bool(getattr(self._watch, "is_active", True))
+
+    def maintain(self) -> None:
+        """Re-opens a dropped listener, at most once per retry_sec."""
+        if self._loop is None or self.listening:
+            return
+        # also covers a listener still waiting for its initial snapshot
+        if time.monotonic() - self._last_attempt < self.retry_sec:
+            return
+        warn("queue", "job_listener_down", retrying=True)
+        self.stop()
+        self._subscribe()
+
+    async def wait(self) -> None:
+        """Returns on the next wakeup, or as soon as the listener drops so the caller can fall back to polling."""
+        while self.listening:
+            try:
+                await asyncio.wait_for(self.wakeups.get(), timeout=1.0)
+                return
+            except asyncio.TimeoutError:
+                continue
+
+    def stop(self) -> None:
+        if self._watch is not None:
+            try:
+                self._watch.unsubscribe()
+            except Exception:  # noqa: BLE001
+                pass
+        self._watch = None
+        self._synced = False
@@ -1,8 +1,12 @@
 from __future__ import annotations
 
 import os
+import random
+import socket
+import threading
 from dataclasses import dataclass
-from typing import List, Optional
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
 
 from google.cloud import firestore
 
@@ -11,6 +15,22 @@ from logging_utils import info, warn
 
 SCRAPE_JOBS_COLLECTION = os.getenv("SCRAPE_JOBS_COLLECTION", "scrapeJobs")
 SNAPSHOTS_COLLECTION = os.getenv("SNAPSHOTS_COLLECTION", "competitorSnapshots")
+# Queued jobs read per lease query page for each slot requested; extra rows absorb jobs still in retryAt cool-off
+LEASE_OVERFETCH = int(os.getenv("SCRAPER_LEASE_OVERFETCH", "3"))
+# Most queued rows one lease call pages through looking for ready jobs
+LEASE_SCAN_LIMIT = int(os.getenv("SCRAPER_LEASE_SCAN_LIMIT", "1000"))
+# Firestore caps a batch at 500 writes
+BATCH_MAX_WRITES = 500
+
+# A running job whose lease isn't renewed within this window is presumed lost
+LEASE_TTL_SEC = float(os.getenv("SCRAPER_LEASE_TTL_SEC", "120"))
+MAX_ATTEMPTS = int(os.getenv("SCRAPER_MAX_ATTEMPTS", "3"))
+RETRY_BASE_SEC = float(os.getenv("SCRAPER_RETRY_BASE_SEC", "30"))
+RETRY_MAX_SEC = float(os.getenv("SCRAPER_RETRY_MAX_SEC", "3600"))
+# Terminal status once MAX_ATTEMPTS is used up
+DEAD_LETTER_STATUS = "dead_letter"
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
 
 
 @dataclass
@@ -19,62 +39,410 @@ class ScrapeJob:
     product_id: str
     urls: List[str]
     fx_rates: dict
+    # includes the current try
+    attempts: int = 1
+
+
+_client: Optional[firestore.Client] = None
+_client_lock = threading.Lock()
+# the reaper's one-off pass over running jobs left without a lease has run in this process
+_legacy_leases_stamped = False
 
 
 def get_client() -> firestore.Client:
-    return firestore.Client()
+    """Process-wide client: one gRPC channel and one credential refresh for every call."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                # honours FIRESTORE_EMULATOR_HOST like any other client
+                _client = firestore.Client()
+    return _client
 
 
-def lease_next_job() -> Optional[ScrapeJob]:
-    client = get_client()
-    jobs_ref = client.collection(SCRAPE_JOBS_COLLECTION)
+def set_client(client: Any) -> None:
+    """Swap in another client (emulator-backed or an in-memory fake)."""
+    global _client
+    with _client_lock:
+        _client = client
+
+
+def retry_delay_sec(attempts: int) -> float:
+    """Exponential backoff with +-20% jitter so retried jobs don't come back in lockstep."""
+    delay = min(RETRY_BASE_SEC * (2 ** max(attempts - 1, 0)), RETRY_MAX_SEC)
+    return delay * random.uniform(0.8, 1.2)
+
 
-    # very simple lease: first queued job
-    docs = (
+def _lease_fields(attempts: int, now: datetime) -> Dict[str, Any]:
+    return {
+        "status": "running",
+        "attempts": attempts,
+        "leasedBy": WORKER_ID,
+        "leasedAt": now,
+        "leaseExpiresAt": now + timedelta(seconds=LEASE_TTL_SEC),
+        "updatedAt": firestore.SERVER_TIMESTAMP,
+    }
+
+
+def _retry_fields(attempts: int, reason: str, now: datetime) -> Dict[str, Any]:
+    """Back to the queue with a cool-off, or dead-lettered once attempts run out."""
+    if attempts >= MAX_ATTEMPTS:
+        return {"status": DEAD_LETTER_STATUS, "lastError": reason, "leaseExpiresAt": None, "updatedAt": firestore.SERVER_TIMESTAMP}
+    return {
+        "status": "queued",
+        "lastError": reason,
+        "retryAt": now + timedelta(seconds=retry_delay_sec(attempts)),
+        "leaseExpiresAt": None,
+        "updatedAt": firestore.SERVER_TIMESTAMP,
+    }
+
+
+def _ready(data: Dict[str, Any], now: datetime) -> bool:
+    retry_at = data.get("retryAt")
+    return retry_at is None or retry_at <= now
+
+
+def _ready_candidates(jobs_ref: Any, n: int, now: datetime) -> List[Any]:
+    """
+    First n queued jobs out of cool-off, in priority/createdAt order.
+
+    retryAt can't share a range filter with the priority ordering, so cool-offs
+    are skipped here. A retried job keeps its createdAt and stays near the head
+    of the order, so pages are read until n ready jobs turn up rather than
+    letting a run of cooling-off jobs hide everything behind them.
+    """
+    query = (
         jobs_ref.where("status", "==", "queued")
+        .order_by("priority", direction=firestore.Query.DESCENDING)
         .order_by("createdAt")
-        .limit(1)
-        .stream()
     )
+    page_size = n * max(LEASE_OVERFETCH, 1)
+    candidates: List[Any] = []
+    scanned = 0
+    last = None
+    while len(candidates) < n and scanned < LEASE_SCAN_LIMIT:
+        page = query.start_after(last) if last is not None else query
+        docs = list(page.limit(page_size).stream())
+        scanned += len(docs)
+        candidates.extend(doc.reference for doc in docs if _ready(doc.to_dict() or {}, now))
+        if len(docs) < page_size:
+            break
+        last = docs[-1]
+    if scanned >= LEASE_SCAN_LIMIT and len(candidates) < n:
+        warn("queue", "lease_scan_limit_reached", scanned=scanned, ready=len(candidates))
+    return candidates[:n]
 
-    doc_list = list(docs)
-    if not doc_list:
-        return None
 
-    doc = doc_list[0]
+def lease_jobs(n: int, client: Optional[firestore.Client] = None) -> List[ScrapeJob]:
+    """Claims up to n queued jobs (highest priority, then oldest) in a single transaction."""
+    if n <= 0:
+        return []
+    client = client or get_client()
+    jobs_ref = client.collection(SCRAPE_JOBS_COLLECTION)
+    now = datetime.now(timezone.utc)
+
+    candidates = _ready_candidates(jobs_ref, n, now)
+    if not candidates:
+        return []
 
     @firestore.transactional
-    def _tx(tx: firestore.Transaction):
-        snap = doc.reference.get(transaction=tx)
-        data = snap.to_dict()
-        if data.get("status") != "queued":
-            return None
-        tx.update(doc.reference, {"status": "running", "attempts": data.get("attempts", 0) + 1})
-        return data
-
-    tx = client.transaction()
-    snap = _tx(tx)
-    if not snap:
-        return None
-
-    info("queue", "leased_job", job_id=doc.id, product_id=snap.get("productId"))
-    return ScrapeJob(
-        job_id=doc.id,
-        product_id=snap.get("productId"),
-        urls=list(snap.get("urls", [])),
-        fx_rates=dict(snap.get("fxRates", {})),
-    )
+    def _tx(tx: firestore.Transaction) -> List[Tuple[str, Dict[str, Any]]]:
+        claimed = []
+        # all reads happen before the first write, as transactions require
+        for snap in tx.get_all(candidates):
+            data = snap.to_dict() or {}
+            if data.get("status") != "queued" or not _ready(data, now):
+                # taken by another worker since the query
+                continue
+            claimed.append((snap.id, data))
+        for job_id, data in claimed:
+            data["attempts"] = data.get("attempts", 0) + 1
+            tx.update(jobs_ref.document(job_id), _lease_fields(data["attempts"], now))
+        return claimed
+
+    claimed = _tx(client.transaction())
+    jobs = []
+    for job_id, data in claimed:
+        info("queue", "leased_job", job_id=job_id, product_id=data.get("productId"))
+        jobs.append(
+            ScrapeJob(
+                job_id=job_id,
+                product_id=data.get("productId"),
+                urls=list(data.get("urls", [])),
+                fx_rates=dict(data.get("fxRates", {})),
+                attempts=data["attempts"],
+            )
+        )
+    return jobs
+
+
+def lease_next_job() -> Optional[ScrapeJob]:
+    jobs = lease_jobs(1)
+    return jobs[0] if jobs else None
+
+
+def _success_update(snapshot_id: str) -> Dict[str, Any]:
+    return {"status": "succeeded", "snapshotId": snapshot_id, "leaseExpiresAt": None, "updatedAt": firestore.SERVER_TIMESTAMP}
+
+
+def _failure_update(job: ScrapeJob, reason: str) -> Dict[str, Any]:
+    return _retry_fields(job.attempts, reason, datetime.now(timezone.utc))
 
 
-def complete_job_success(job: ScrapeJob, snapshot_id: str) -> None:
+def _owned(data: Dict[str, Any]) -> bool:
+    """This worker still holds the job: not reaped and re-leased elsewhere, not finished by someone else."""
+    return data.get("status") == "running" and data.get("leasedBy") == WORKER_ID
+
+
+def complete_job_success(job: ScrapeJob, snapshot_id: str) -> bool:
+    """False when the lease was lost and nothing was written."""
     client = get_client()
     ref = client.collection(SCRAPE_JOBS_COLLECTION).document(job.job_id)
-    ref.update({"status": "succeeded", "snapshotId": snapshot_id})
-    info("queue", "job_succeeded", job_id=job.job_id, snapshot_id=snapshot_id)
+    completion = _Completion(job.job_id, "job_succeeded", {"snapshot_id": snapshot_id}, [("update", ref, _success_update(snapshot_id))])
+    written, lost = _commit_owned(client, [completion])
+    _log_completions(written, lost)
+    return bool(written)
 
 
-def complete_job_failure(job: ScrapeJob, reason: str) -> None:
+def complete_job_failure(job: ScrapeJob, reason: str) -> bool:
+    """False when the lease was lost and nothing was written."""
     client = get_client()
     ref = client.collection(SCRAPE_JOBS_COLLECTION).document(job.job_id)
-    ref.update({"status": "failed", "lastError": reason})
-    warn("queue", "job_failed", job_id=job.job_id, reason=reason)
+    update = _failure_update(job, reason)
+    fields = {"reason": reason, "attempts": job.attempts, "next_status": update["status"]}
+    written, lost = _commit_owned(client, [_Completion(job.job_id, "job_failed", fields, [("update", ref, update)])])
+    _log_completions(written, lost)
+    return bool(written)
+
+
+@dataclass
+class _Completion:
+    job_id: str
+    message: str
+    fields: Dict[str, Any]
+    # (kind, ref, fields) with kind "set" or "update"
+    writes: List[Tuple[str, Any, Dict[str, Any]]]
+
+
+def _commit_owned(client: firestore.Client, completions: List[_Completion]) -> Tuple[List[_Completion], List[_Completion]]:
+    """
+    Writes the completions of jobs this worker still holds, in one
+    transaction; the rest are skipped so a worker whose lease was reaped
+    can't overwrite the job's new owner. Returns (written, lost).
+    """
+    jobs_ref = client.collection(SCRAPE_JOBS_COLLECTION)
+
+    @firestore.transactional
+    def _tx(tx: firestore.Transaction) -> Tuple[List[_Completion], List[_Completion]]:
+        snaps = tx.get_all([jobs_ref.document(c.job_id) for c in completions])
+        owned = {snap.id for snap in snaps if _owned(snap.to_dict() or {})}
+        written, lost = [], []
+        for completion in completions:
+            if completion.job_id not in owned:
+                lost.append(completion)
+                continue
+            for kind, ref, fields in completion.writes:
+                if kind == "set":
+                    tx.set(ref, fields)
+                else:
+                    tx.update(ref, fields)
+            written.append(completion)
+        return written, lost
+
+    return _tx(client.transaction())
+
+
+def _log_completions(written: List[_Completion], lost: List[_Completion]) -> None:
+    for completion in written:
+        log = info if completion.message == "job_succeeded" else warn
+        log("queue", completion.message, job_id=completion.job_id, **completion.fields)
+    for completion in lost:
+        warn("queue", "lease_lost", job_id=completion.job_id, dropped=completion.message)
+
+
+class CompletionBatcher:
+    """
+    Collects snapshot writes and job status updates from finished jobs and
+    commits them as one transaction per flush. A snapshot and its job update
+    always land together, so a job never reads succeeded without its
+    snapshot, and only jobs this worker still holds are written.
+    """
+
+    def __init__(self, client: Optional[firestore.Client] = None, max_writes: int = BATCH_MAX_WRITES):
+        self._client = client
+        self.max_writes = min(max(max_writes, 2), BATCH_MAX_WRITES)
+        self._pending: List[_Completion] = []
+        self._lock = threading.Lock()
+        # completions skipped because another worker had taken the job over
+        self.lost = 0
+
+    @property
+    def client(self) -> firestore.Client:
+        return self._client or get_client()
+
+    @property
+    def pending_writes(self) -> int:
+        with self._lock:
+            return sum(len(c.writes) for c in self._pending)
+
+    def _job_ref(self, job: ScrapeJob) -> Any:
+        return self.client.collection(SCRAPE_JOBS_COLLECTION).document(job.job_id)
+
+    def add_success(self, job: ScrapeJob, snapshot_ref: Any, snapshot_payload: Optional[Dict[str, Any]]) -> None:
+        """snapshot_payload=None when the snapshot was already written (streaming mode)."""
+        writes = [("update", self._job_ref(job), _success_update(snapshot_ref.id))]
+        if snapshot_payload is not None:
+            writes.insert(0, ("set", snapshot_ref, snapshot_payload))
+        with self._lock:
+            self._pending.append(_Completion(job.job_id, "job_succeeded", {"snapshot_id": snapshot_ref.id}, writes))
+
+    def add_failure(self, job: ScrapeJob, reason: str) -> None:
+        update = _failure_update(job, reason)
+        writes = [("update", self._job_ref(job), update)]
+        fields = {"reason": reason, "attempts": job.attempts, "next_status": update["status"]}
+        with self._lock:
+            self._pending.append(_Completion(job.job_id, "job_failed", fields, writes))
+
+    def _chunks(self, completions: List[_Completion]) -> List[List[_Completion]]:
+        chunks: List[List[_Completion]] = [[]]
+        size = 0
+        for completion in completions:
+            if size and size + len(completion.writes) > self.max_writes:
+                chunks.append([])
+                size = 0
+            chunks[-1].append(completion)
+            size += len(completion.writes)
+        return chunks
+
+    def flush(self) -> int:
+        """Commits everything pending; returns the number of writes sent. Blocking."""
+        with self._lock:
+            completions, self._pending = self._pending, []
+        if not completions:
+            return 0
+
+        written = 0
+        chunks = self._chunks(completions)
+        for i, chunk in enumerate(chunks):
+            try:
+                done, lost = _commit_owned(self.client, chunk)
+            except Exception:
+                # keep what didn't land for the next flush, ahead of newer completions
+                with self._lock:
+                    self._pending[:0] = [c for rest in chunks[i:] for c in rest]
+                raise
+            written += sum(len(c.writes) for c in done)
+            self.lost += len(lost)
+            _log_completions(done, lost)
+        return written
+
+
+
+def _renew_chunk(client: firestore.Client, job_ids: List[str], expires: datetime) -> List[str]:
+    jobs_ref = client.collection(SCRAPE_JOBS_COLLECTION)
+
+    @firestore.transactional
+    def _tx(tx: firestore.Transaction) -> List[str]:
+        snaps = tx.get_all([jobs_ref.document(job_id) for job_id in job_ids])
+        owned = {snap.id for snap in snaps if _owned(snap.to_dict() or {})}
+        for job_id in owned:
+            tx.update(jobs_ref.document(job_id), {"leaseExpiresAt": expires})
+        return [job_id for job_id in job_ids if job_id not in owned]
+
+    return _tx(client.transaction())
+
+
+def renew_leases(job_ids: List[str], client: Optional[firestore.Client] = None) -> List[str]:
+    """
+    Heartbeat: pushes leaseExpiresAt forward for every job this worker still
+    holds. Returns the ids it no longer holds (reaped and re-leased, or
+    finished elsewhere) so the caller can stop working on them.
+    """
+    if not job_ids:
+        return []
+    client = client or get_client()
+    expires = datetime.now(timezone.utc) + timedelta(seconds=LEASE_TTL_SEC)
+    lost: List[str] = []
+    for start in range(0, len(job_ids), BATCH_MAX_WRITES):
+        lost.extend(_renew_chunk(client, job_ids[start:start + BATCH_MAX_WRITES], expires))
+    return lost
+
+
+def _stamp_chunk(client: firestore.Client, refs: List[Any]) -> int:
+    @firestore.transactional
+    def _tx(tx: firestore.Transaction) -> int:
+        stamps = []
+        for snap in tx.get_all(refs):
+            data = snap.to_dict() or {}
+            # finished, or leased by a current worker, since the scan
+            if data.get("status") != "running" or "leaseExpiresAt" in data:
+                continue
+            since = data.get("leasedAt") or data.get("createdAt") or datetime.now(timezone.utc)
+            stamps.append((snap.reference, since + timedelta(seconds=LEASE_TTL_SEC)))
+        for ref, expires in stamps:
+            tx.update(ref, {"leaseExpiresAt": expires})
+        return len(stamps)
+
+    return _tx(client.transaction())
+
+
+def stamp_legacy_leases(client: Optional[firestore.Client] = None, page_size: int = 200) -> int:
+    """
+    Jobs marked running by workers that predate leases have no
+    leaseExpiresAt, which the reaper's range query never matches, so they
+    would stay running forever. Gives each one a lease that ends
+    LEASE_TTL_SEC after it was leased (or created); the reaper then treats
+    it like any other. Returns how many were stamped.
+    """
+    client = client or get_client()
+    # equality filter only, paged by document id: no composite index needed
+    query = client.collection(SCRAPE_JOBS_COLLECTION).where("status", "==", "running").limit(page_size)
+    stamped = 0
+    last = None
+    while True:
+        docs = list((query.start_after(last) if last is not None else query).stream())
+        legacy = [doc.reference for doc in docs if "leaseExpiresAt" not in (doc.to_dict() or {})]
+        if legacy:
+            stamped += _stamp_chunk(client, legacy)
+        if len(docs) < page_size:
+            break
+        last = docs[-1]
+    if stamped:
+        warn("queue", "legacy_leases_stamped", jobs=stamped)
+    return stamped
+
+
+def reap_expired_leases(limit: int = 50, client: Optional[firestore.Client] = None) -> int:
+    """Re-queues (or dead-letters) running jobs whose worker stopped heartbeating. Safe to run from every worker."""
+    global _legacy_leases_stamped
+    client = client or get_client()
+    if not _legacy_leases_stamped:
+        stamp_legacy_leases(client)
+        _legacy_leases_stamped = True
+    jobs_ref = client.collection(SCRAPE_JOBS_COLLECTION)
+    now = datetime.now(timezone.utc)
+    expired = [
+        doc.reference
+        for doc in jobs_ref.where("status", "==", "running").where("leaseExpiresAt", "<", now).limit(limit).stream()
+    ]
+    if not expired:
+        return 0
+
+    @firestore.transactional
+    def _tx(tx: firestore.Transaction) -> List[Tuple[str, Dict[str, Any]]]:
+        reaped = []
+        for snap in tx.get_all(expired):
+            data = snap.to_dict() or {}
+            lease_expires = data.get("leaseExpiresAt")
+            # renewed or finished since the query
+            if data.get("status") != "running" or lease_expires is None or lease_expires >= now:
+                continue
+            reaped.append((snap.id, data))
+        for job_id, data in reaped:
+            tx.update(jobs_ref.document(job_id), _retry_fields(data.get("attempts", 0), "lease_expired", now))
+        return reaped
+
+    reaped = _tx(client.transaction())
+    for job_id, data in reaped:
+        warn("queue", "lease_expired", job_id=job_id, leased_by=data.get("leasedBy"), attempts=data.get("attempts", 0))
+    return len(reaped)
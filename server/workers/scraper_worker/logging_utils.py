@@ -1,27 +1,204 @@
+"""
+Structured JSON-lines logging. Records are queued by the caller and written
+to stdout in batches by a background thread, so a log call on the event loop
+never waits on stdout. A full queue drops records and reports how many in a
+`log_dropped` record; chatty messages can be sampled via SCRAPER_LOG_SAMPLE.
+"""
 from __future__ import annotations
 
+import atexit
 import json
+import os
+import queue
 import sys
+import threading
 from datetime import datetime, timezone
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# "0" writes synchronously from the caller, as before
+LOG_ASYNC = os.getenv("SCRAPER_LOG_ASYNC", "1") not in ("0", "false", "False")
+# Records waiting for the writer thread; beyond this they are dropped and counted
+LOG_BUFFER = int(os.getenv("SCRAPER_LOG_BUFFER", "10000"))
+# Longest a record waits before the writer flushes a partial batch
+LOG_FLUSH_SEC = float(os.getenv("SCRAPER_LOG_FLUSH_SEC", "0.2"))
+LOG_BATCH_MAX = 500
+# Share of records kept per message, "msg=rate,..."; error-level records are never sampled out
+LOG_SAMPLE = os.getenv("SCRAPER_LOG_SAMPLE", "clicked_consent=0.1,scrape_failed=0.5")
+
+
+def _parse_sample(spec: str) -> Dict[str, float]:
+    rates: Dict[str, float] = {}
+    for part in spec.split(","):
+        name, _, rate = part.strip().partition("=")
+        if not name or not rate:
+            continue
+        try:
+            rates[name] = min(max(float(rate), 0.0), 1.0)
+        except ValueError:
+            continue
+    return rates
 
 
 def _now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
-def log(level: str, scope: str, message: str, **fields: Any) -> None:
+def _entry(ts: str, level: str, scope: str, message: str, fields: Dict[str, Any]) -> Dict[str, Any]:
     entry: Dict[str, Any] = {
-        "ts": _now_iso(),
+        "ts": ts,
         "level": level,
         "scope": scope,
         "msg": message,
     }
     if fields:
         entry.update(fields)
-    json.dump(entry, sys.stdout)
-    sys.stdout.write("\n")
-    sys.stdout.flush()
+    return entry
+
+
+def _write(lines: List[str]) -> None:
+    try:
+        sys.stdout.write("".join(lines))
+        sys.stdout.flush()
+    except (OSError, ValueError):
+        # stdout closed or a broken pipe; nothing useful left to do with the records
+        pass
+
+
+def _serialize(entry: Dict[str, Any]) -> str:
+    # default=str: a stray datetime or exception in fields must not kill the writer thread
+    return json.dumps(entry, default=str) + "\n"
+
+
+_Record = Tuple[str, str, str, str, Dict[str, Any]]
+
+
+class LogWriter:
+    def __init__(self, buffer: int = LOG_BUFFER, flush_sec: float = LOG_FLUSH_SEC, sample: Optional[Dict[str, float]] = None):
+        self._queue: "queue.Queue[Optional[_Record]]" = queue.Queue(maxsize=max(buffer, 1))
+        self.flush_sec = flush_sec
+        self.sample = _parse_sample(LOG_SAMPLE) if sample is None else sample
+        self._seen: Dict[str, int] = {}
+        self._counts_lock = threading.Lock()
+        self.dropped = 0
+        self.sampled_out = 0
+        self._reported_dropped = 0
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def _keep(self, level: str, message: str) -> Tuple[bool, Optional[float]]:
+        rate = self.sample.get(message)
+        if rate is None or rate >= 1.0 or level == "error":
+            return True, None
+        with self._counts_lock:
+            seen = self._seen.get(message, 0) + 1
+            self._seen[message] = seen
+            # deterministic stride: `rate` of the records, spread evenly, starting with the first
+            offset = 1.0 - rate
+            keep = int(seen * rate + offset) > int((seen - 1) * rate + offset)
+            if not keep:
+                self.sampled_out += 1
+        return keep, rate
+
+    def submit(self, level: str, scope: str, message: str, fields: Dict[str, Any]) -> None:
+        keep, rate = self._keep(level, message)
+        if not keep:
+            return
+        if rate is not None:
+            fields["sample_rate"] = rate
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((_now_iso(), level, scope, message, fields))
+        except queue.Full:
+            with self._counts_lock:
+                self.dropped += 1
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                self._thread.start()
+
+    def _drain(self, first: Optional[_Record]) -> Tuple[List[str], bool]:
+        """Serializes `first` plus whatever else is queued, up to LOG_BATCH_MAX. Second value: close() was called."""
+        lines: List[str] = []
+        stop = False
+        if first is not None:
+            lines.append(_serialize(_entry(*first)))
+        while len(lines) < LOG_BATCH_MAX:
+            try:
+                record = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if record is None:
+                stop = True
+                continue
+            lines.append(_serialize(_entry(*record)))
+        with self._counts_lock:
+            dropped = self.dropped - self._reported_dropped
+            self._reported_dropped = self.dropped
+        if dropped:
+            lines.append(_serialize(_entry(_now_iso(), "warn", "logging", "log_dropped", {"dropped": dropped, "buffer": self._queue.maxsize})))
+        return lines, stop
+
+    def _run(self) -> None:
+        while True:
+            closing = False
+            try:
+                first = self._queue.get(timeout=self.flush_sec)
+                # None is close()'s sentinel; still drain what was queued before it
+                closing = first is None
+            except queue.Empty:
+                # idle: only wake up to report drops
+                if self.dropped == self._reported_dropped:
+                    continue
+                first = None
+            lines, stop = self._drain(first)
+            if lines:
+                _write(lines)
+            if closing or stop:
+                return
+
+    def stats(self) -> Dict[str, int]:
+        return {"queued": self._queue.qsize(), "dropped": self.dropped, "sampledOut": self.sampled_out}
+
+    def close(self, timeout: float = 2.0) -> None:
+        """Writes out everything queued so far and stops the thread. Called at exit."""
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        thread.join(timeout)
+
+
+_writer = LogWriter()
+atexit.register(_writer.close)
+
+
+def log_stats() -> Dict[str, int]:
+    return _writer.stats()
+
+
+def close_logs() -> None:
+    """Writes out queued records and stops the writer thread; a later log call starts it again."""
+    _writer.close()
+
+
+def log(level: str, scope: str, message: str, **fields: Any) -> None:
+    if LOG_ASYNC:
+        _writer.submit(level, scope, message, fields)
+        return
+    keep, rate = _writer._keep(level, message)
+    if not keep:
+        return
+    if rate is not None:
+        fields["sample_rate"] = rate
+    _write([_serialize(_entry(_now_iso(), level, scope, message, fields))])
 
 
 def info(scope: str, message: str, **fields: Any) -> None:
@@ -0,0 +1,205 @@
+"""
+In-process scrape metrics: per-host, per-stage latency histograms and
+status/fallback counters, served in Prometheus text format from a local
+HTTP endpoint and summarized into each snapshot's `stats.stages`.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from logging_utils import info, warn
+
+
+# 0 disables the endpoint; supervisor.py hands each child base + index
+METRICS_PORT = int(os.getenv("SCRAPER_METRICS_PORT", "9464"))
+METRICS_HOST = os.getenv("SCRAPER_METRICS_HOST", "127.0.0.1")
+# Upper bounds in seconds; navigation dominates, so the tail goes out to the page timeout
+STAGE_BUCKETS_SEC = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self) -> None:
+        self.counts = [0] * len(STAGE_BUCKETS_SEC)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(STAGE_BUCKETS_SEC):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self._histograms: Dict[str, Dict[_Labels, Histogram]] = {}
+        self._counters: Dict[str, Dict[_Labels, float]] = {}
+        self._help: Dict[str, str] = {}
+        # observations come from the event loop, scrapes of /metrics from the server thread
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, text: str) -> None:
+        self._help[name] = text
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = Histogram()
+            hist.observe(value)
+
+    def inc(self, name: str, amount: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def render(self) -> str:
+        """Prometheus text exposition format (0.0.4)."""
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# HELP {name} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# HELP {name} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, hist in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(STAGE_BUCKETS_SEC, hist.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(labels + (('le', _format_value(bound)),))} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {hist.count}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(hist.sum)}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: _Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+metrics = Metrics()
+metrics.describe("scraper_stage_duration_seconds", "Time spent per scrape stage, by hostname")
+metrics.describe("scraper_results_total", "Competitor results by hostname, status and tier")
+metrics.describe("scraper_fallbacks_total", "Fallback paths taken: static miss to browser, selectors miss to body text")
+metrics.describe("scraper_job_stage_duration_seconds", "Time spent per job stage: scraping all URLs, snapshot writes")
+metrics.describe("scraper_jobs_total", "Jobs processed by outcome")
+
+
+class StageTimer:
+    """Accumulates wall time per named stage for one URL or job."""
+
+    def __init__(self) -> None:
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def record(self, hostname: str) -> None:
+        """Feeds every stage into the per-host histograms."""
+        for name, seconds in self.stages.items():
+            metrics.observe("scraper_stage_duration_seconds", seconds, host=hostname or "unknown", stage=name)
+
+    def record_job(self, outcome: str) -> None:
+        for name, seconds in self.stages.items():
+            metrics.observe("scraper_job_stage_duration_seconds", seconds, stage=name)
+        metrics.inc("scraper_jobs_total", outcome=outcome)
+
+    def as_ms(self) -> Dict[str, int]:
+        return {name: int(seconds * 1000) for name, seconds in self.stages.items()}
+
+
+def _result_host(result: Dict[str, Any]) -> str:
+    # failed navigations leave hostname empty; fall back to the requested URL's host
+    return result.get("hostname") or urlsplit(result.get("url") or "").hostname or "unknown"
+
+
+def record_result(result: Dict[str, Any]) -> None:
+    metrics.inc("scraper_results_total", host=_result_host(result), status=result["status"], tier=result.get("tier") or "none")
+
+
+def record_fallback(hostname: str, kind: str) -> None:
+    metrics.inc("scraper_fallbacks_total", host=hostname or "unknown", kind=kind)
+
+
+def summarize_stages(results: Iterable[Dict[str, Any]], job_timer: Optional[StageTimer] = None) -> Dict[str, Any]:
+    """Snapshot `stats.stages`: per-URL stage count/total/max, stage time per host, and the job's own stages."""
+    stages: Dict[str, Dict[str, int]] = {}
+    by_host: Dict[str, Dict[str, int]] = {}
+    for result in results:
+        host = _result_host(result)
+        for name, ms in (result.get("stageMs") or {}).items():
+            entry = stages.setdefault(name, {"count": 0, "totalMs": 0, "maxMs": 0})
+            entry["count"] += 1
+            entry["totalMs"] += ms
+            entry["maxMs"] = max(entry["maxMs"], ms)
+            host_stages = by_host.setdefault(host, {})
+            host_stages[name] = host_stages.get(name, 0) + ms
+    return {"byStage": stages, "byHost": by_host, "job": job_timer.as_ms() if job_timer else {}}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:  # noqa: N802
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        # scrapes every few seconds would drown the worker's own logs
+        pass
+
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = METRICS_HOST) -> Optional[ThreadingHTTPServer]:
+    """Serves /metrics from a daemon thread; None when disabled or the port is taken."""
+    if port <= 0:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), _Handler)
+    except OSError as exc:
+        warn("metrics", "metrics_server_failed", host=host, port=port, error=str(exc))
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    info("metrics", "metrics_server_started", host=host, port=port)
+    return server
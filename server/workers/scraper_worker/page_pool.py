@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+
+from playwright.async_api import Browser, BrowserContext, Page, Route
+
+from domains import BLOCK_RESOURCES, should_block_request
+from host_limits import CLOSED, HALF_OPEN, OPEN, CircuitOpenError, HostState
+from logging_utils import info, warn
+
+
+POOL_SIZE = int(os.getenv("SCRAPER_PAGE_POOL_SIZE", "4"))
+CONTEXT_COUNT = int(os.getenv("SCRAPER_BROWSER_CONTEXTS", "2"))
+PER_HOST_CONCURRENCY = int(os.getenv("SCRAPER_PER_HOST_CONCURRENCY", "2"))
+HOST_DELAY_MS = int(os.getenv("SCRAPER_HOST_DELAY_MS", "500"))
+
+
+def url_hostname(url: str) -> str:
+    return (urlparse(url).hostname or "").lower()
+
+
+class HostLimiter:
+    """Per-hostname politeness shared by every page: concurrency cap, adaptive token bucket and circuit breaker."""
+
+    def __init__(self, per_host: int = PER_HOST_CONCURRENCY, delay_ms: int = HOST_DELAY_MS):
+        self.per_host = max(per_host, 1)
+        self.delay_ms = delay_ms
+        self._hosts: Dict[str, HostState] = {}
+
+    def _state(self, hostname: str) -> HostState:
+        state = self._hosts.get(hostname)
+        if state is None:
+            state = self._hosts[hostname] = HostState(self.per_host)
+        return state
+
+    @asynccontextmanager
+    async def slot(self, hostname: str) -> AsyncIterator[None]:
+        """Raises CircuitOpenError instead of waiting when the host's circuit is open."""
+        state = self._state(hostname)
+        if not state.breaker.admit():
+            state.short_circuited += 1
+            raise CircuitOpenError(hostname)
+        is_probe = state.breaker.state == HALF_OPEN
+        # circuit opened while this URL queued for a token or a slot
+        tripped = (lambda: state.breaker.state != CLOSED) if not is_probe else (lambda: False)
+        try:
+            if not await state.bucket.acquire(abort=tripped):
+                state.short_circuited += 1
+                raise CircuitOpenError(hostname)
+            async with state.semaphore:
+                if tripped():
+                    state.short_circuited += 1
+                    raise CircuitOpenError(hostname)
+                if self.delay_ms > 0:
+                    # same politeness pause the sequential loop used before each URL
+                    await asyncio.sleep(self.delay_ms / 1000)
+                state.requests += 1
+                yield
+        finally:
+            if is_probe:
+                # a probe that ended without an outcome (cancelled, crashed) must not wedge the circuit
+                state.breaker.release_probe()
+
+    def record(self, hostname: str, status: str) -> None:
+        state = self._state(hostname)
+        blocked = status == "blocked"
+        if blocked:
+            state.blocked += 1
+            state.bucket.slow_down()
+        elif status == "succeeded":
+            state.bucket.speed_up()
+        else:
+            # timeouts and missing prices say nothing about bot protection
+            return
+        was = state.breaker.state
+        state.breaker.record(blocked)
+        if state.breaker.state != was:
+            log = warn if state.breaker.state == OPEN else info
+            log("scraper", "circuit_" + state.breaker.state, hostname=hostname, blocked_rate=round(state.breaker.blocked_rate, 3))
+
+    def snapshot(self, hostnames: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, Any]]:
+        names = self._hosts.keys() if hostnames is None else [h for h in hostnames if h in self._hosts]
+        return {name: self._hosts[name].snapshot() for name in names}
+
+
+class PagePool:
+    """Fixed set of pages spread over a few browser contexts, reused across URLs and jobs."""
+
+    def __init__(
+        self,
+        browser: Browser,
+        user_agent: str,
+        size: int = POOL_SIZE,
+        contexts: int = CONTEXT_COUNT,
+        host_limiter: Optional[HostLimiter] = None,
+    ):
+        self.browser = browser
+        self.user_agent = user_agent
+        self.size = max(size, 1)
+        self.context_count = max(min(contexts, self.size), 1)
+        self.hosts = host_limiter or HostLimiter()
+        self._contexts: List[BrowserContext] = []
+        self._page_context: Dict[int, BrowserContext] = {}
+        # page id -> hostname of the URL it was checked out for; routing follows the site the
+        # page is being sent to, not whatever frame (about:blank, an iframe) a request came from
+        self._page_target: Dict[int, str] = {}
+        self._idle: "asyncio.Queue[Page]" = asyncio.Queue()
+        # URLs currently waiting for a free page
+        self.waiters = 0
+        self.blocked_requests = 0
+
+    async def start(self) -> None:
+        for _ in range(self.context_count):
+            context = await self.browser.new_context(user_agent=self.user_agent)
+            if BLOCK_RESOURCES:
+                # one handler per context; the decision follows the site each page was checked out for
+                await context.route("**/*", self._route)
+            self._contexts.append(context)
+        for i in range(self.size):
+            context = self._contexts[i % self.context_count]
+            await self._idle.put(await self._new_page(context))
+        info("scraper", "page_pool_started", pages=self.size, contexts=self.context_count)
+
+    def _request_hostname(self, request: Any) -> str:
+        try:
+            page = request.frame.page
+        except Exception:  # noqa: BLE001
+            # service worker requests have no frame
+            return url_hostname(request.url)
+        return self._page_target.get(id(page)) or url_hostname(page.url) or url_hostname(request.url)
+
+    async def _route(self, route: Route) -> None:
+        request = route.request
+        hostname = self._request_hostname(request)
+        if should_block_request(hostname, request.resource_type, request.url):
+            self.blocked_requests += 1
+            await route.abort("blockedbyclient")
+        else:
+            await route.continue_()
+
+    async def _new_page(self, context: BrowserContext) -> Page:
+        page = await context.new_page()
+        self._page_context[id(page)] = context
+        return page
+
+    async def _reset(self, page: Page) -> Page:
+        self._page_target.pop(id(page), None)
+        try:
+            await page.goto("about:blank")
+            return page
+        except Exception as exc:  # noqa: BLE001
+            # crashed or wedged page: replace it in the same context
+            warn("scraper", "page_reset_failed", error=str(exc))
+            context = self._page_context.pop(id(page), self._contexts[0])
+            try:
+                await page.close()
+            except Exception:  # noqa: BLE001
+                pass
+            return await self._new_page(context)
+
+    @asynccontextmanager
+    async def page(self, url: Optional[str] = None) -> AsyncIterator[Page]:
+        """A free page; `url` is the page it will load, whose domain rules then route its requests."""
+        self.waiters += 1
+        try:
+            page = await self._idle.get()
+        finally:
+            self.waiters -= 1
+        if url:
+            self._page_target[id(page)] = url_hostname(url)
+        try:
+            yield page
+        finally:
+            await self._idle.put(await self._reset(page))
+
+    @property
+    def contexts(self) -> List[BrowserContext]:
+        return list(self._contexts)
+
+    @property
+    def idle_pages(self) -> int:
+        return self._idle.qsize()
+
+    async def close(self) -> None:
+        for context in self._contexts:
+            try:
+                await context.close()
+            except Exception:  # noqa: BLE001
+                continue
+        self._contexts.clear()
+        self._page_context.clear()
+        self._page_target.clear()
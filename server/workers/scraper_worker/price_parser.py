@@ -1,41 +1,215 @@
 from __future__ import annotations
 
 import re
-from typing import Optional, Tuple
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
 
 
 CURRENCY_SYMBOLS = {
+    "US$": "USD",
+    "C$": "CAD",
+    "CA$": "CAD",
+    "A$": "AUD",
+    "AU$": "AUD",
+    "R$": "BRL",
     "$": "USD",
     "€": "EUR",
     "£": "GBP",
+    "¥": "JPY",
+    "₹": "INR",
+    "₩": "KRW",
+    "zł": "PLN",
 }
+ISO_CODES = (
+    "USD", "EUR", "GBP", "JPY", "CAD", "AUD", "CHF", "SEK", "NOK", "DKK",
+    "PLN", "CZK", "INR", "CNY", "MXN", "BRL", "KRW", "NZD", "SGD", "HKD",
+)
 
+MIN_PRICE = 0.0
+MAX_PRICE = 1_000_000
+# Marker-backed candidates collected before the scan stops; body-text fallbacks can be hundreds of KB
+MAX_MARKED_CANDIDATES = 32
 
-def extract_price_and_currency(text: str) -> Tuple[Optional[float], Optional[str]]:
-    if not text:
-        return None, None
 
-    currency = None
-    for symbol, code in CURRENCY_SYMBOLS.items():
-        if symbol in text:
-            currency = code
-            break
+# Indian lakh grouping (1,00,000.50), grouped thousands (1,234.56 / 1.234,56 / 1 234,56 / 1'234.56)
+# or a plain run of digits
+_NUMBER = r"\d{1,2}(?:,\d{2})+,\d{3}(?:\.\d{1,2})?(?!\d)|\d{1,3}(?:[.,'\u00a0\u202f ]\d{3})+(?:[.,]\d{1,2})?(?!\d)|\d+(?:[.,]\d{1,2})?(?!\d)"
+_NUMBER_RE = re.compile(_NUMBER)
+_NUMBER_AFTER_RE = re.compile(rf"\s?({_NUMBER})")
+_NUMBER_BEFORE_RE = re.compile(rf"(?<![\d.,])({_NUMBER})\s?$")
+# Alternation of plain literals: the regex engine can jump between marker characters
+# instead of trying every branch at every position of a long body text
+_MARKER_RE = re.compile("|".join(re.escape(m) for m in sorted([*CURRENCY_SYMBOLS, *ISO_CODES], key=len, reverse=True)))
+# Symbols written after the amount in most locales; others look right first
+_SUFFIX_FIRST = frozenset({"€", "zł"}) | frozenset(ISO_CODES)
+# Widest number the before-marker lookup needs to see ("1,000,000.00" plus spacing)
+_LOOKBACK = 24
+
+_ISO_SET = frozenset(ISO_CODES)
+# Currencies whose locales write 1.234,56; the rest group with "," and use "." for decimals
+_DECIMAL_COMMA = frozenset({"EUR", "PLN", "BRL", "CZK", "SEK", "NOK", "DKK"})
+_GROUP_SEPARATORS = "'\u00a0\u202f "
+_SEPARATORS = ".," + _GROUP_SEPARATORS
+
+
+@dataclass
+class PriceCandidate:
+    amount: float
+    currency: Optional[str]
+    score: float
+    start: int
+    text: str
 
-    # find first number-like token
-    match = re.search(r"([0-9]{1,3}(?:[,\s][0-9]{3})*(?:\.[0-9]{1,2})?|[0-9]+(?:\.[0-9]{1,2})?)", text)
-    if not match:
-        return None, currency
 
-    numeric = match.group(1).replace(",", "").replace(" ", "")
+def parse_amount(token: str, currency: Optional[str] = None) -> Optional[float]:
+    """
+    Reads a number in US (1,234.56), European (1.234,56) or Indian
+    (1,00,000.50) notation. A lone "." or "," before exactly three digits
+    only groups thousands when the currency's locale groups with it
+    ("$1,234", "1.234 €"); otherwise it is read as a decimal mark, so
+    ambiguous input never comes out 1000x too high.
+    """
+    token = token.strip()
+    for sep in _GROUP_SEPARATORS:
+        token = token.replace(sep, "")
+    last_dot, last_comma = token.rfind("."), token.rfind(",")
+    if last_dot >= 0 and last_comma >= 0:
+        # both present: whichever comes last is the decimal mark
+        decimal = "." if last_dot > last_comma else ","
+    elif last_dot >= 0 or last_comma >= 0:
+        sep = "." if last_dot >= 0 else ","
+        position = token.rfind(sep)
+        if token.count(sep) > 1:
+            # 1.234.567 / 1,00,000: only ever grouping
+            decimal = None
+        elif len(token) - position - 1 == 3 and token[:position] not in ("", "0") and _groups_with(sep, currency):
+            decimal = None
+        else:
+            decimal = sep
+    else:
+        decimal = None
+    if decimal is None:
+        token = token.replace(".", "").replace(",", "")
+    else:
+        grouping = "," if decimal == "." else "."
+        token = token.replace(grouping, "").replace(decimal, ".")
     try:
-        value = float(numeric)
+        return float(token)
     except ValueError:
-        return None, currency
+        return None
+
+
+def _groups_with(sep: str, currency: Optional[str]) -> bool:
+    if currency is None:
+        return False
+    return sep == ("." if currency.upper() in _DECIMAL_COMMA else ",")
+
+
+def _marker_currency(text: str, start: int, end: int) -> Optional[str]:
+    marker = text[start:end]
+    if marker in _ISO_SET:
+        # whole words only: "EUR" yes, "EUROPE" / "PEUR" no
+        if (start > 0 and text[start - 1].isalpha()) or (end < len(text) and text[end].isalpha()):
+            return None
+        return marker
+    if len(marker) > 1 and start > 0 and text[start - 1].isalnum():
+        # letter-led symbols need a boundary: "ABC$5" is dollars, not Canadian dollars
+        return CURRENCY_SYMBOLS.get(marker[-1])
+    return CURRENCY_SYMBOLS.get(marker)
+
+
+def _score(text: str, token: str, start: int, end: int, marked: bool) -> float:
+    score = 4.0 if marked else 0.0
+    if token[-2:-1] in (".", ",") or token[-3:-2] in (".", ","):
+        # has cents
+        score += 1.0
+    if len(token) > 4 and any(sep in token for sep in _SEPARATORS):
+        score += 0.5
+    if end < len(text) and text[end] == "%":
+        score -= 5.0
+    # product prices tend to come before related-item carousels and footers
+    return score - 0.5 * start / len(text)
+
+
+def _candidate(text: str, token: str, start: int, end: int, currency: Optional[str]) -> Optional[PriceCandidate]:
+    amount = parse_amount(token, currency)
+    if amount is None or amount <= MIN_PRICE or amount > MAX_PRICE:
+        return None
+    return PriceCandidate(amount, currency, _score(text, token, start, end, currency is not None), start, text[start:end])
+
+
+def find_price_candidates(text: str, limit: int = MAX_MARKED_CANDIDATES) -> List[PriceCandidate]:
+    """
+    Candidates sorted best first. One pass over `text` for currency markers,
+    reading the number on either side of each; bare numbers are only
+    considered when the text has no usable marker at all.
+    """
+    if not text:
+        return []
+    candidates: List[PriceCandidate] = []
+    used_until = 0
+    for marker in _MARKER_RE.finditer(text):
+        m_start, m_end = marker.span()
+        currency = _marker_currency(text, m_start, m_end)
+        if currency is None:
+            continue
+        lookups = ("before", "after") if marker.group(0) in _SUFFIX_FIRST else ("after", "before")
+        found = None
+        for side in lookups:
+            if side == "after":
+                number = _NUMBER_AFTER_RE.match(text, m_end)
+                if number is not None:
+                    found = (number.group(1), number.start(1), number.end(1))
+            else:
+                window_start = max(used_until, m_start - _LOOKBACK)
+                number = _NUMBER_BEFORE_RE.search(text, window_start, m_start)
+                if number is not None:
+                    found = (number.group(1), number.start(1), number.end(1))
+            if found is not None:
+                break
+        if found is None:
+            continue
+        token, n_start, n_end = found
+        candidate = _candidate(text, token, n_start, n_end, currency)
+        if candidate is None:
+            continue
+        used_until = n_end
+        candidates.append(candidate)
+        if limit and len(candidates) >= limit:
+            break
+
+    if not candidates:
+        for number in _NUMBER_RE.finditer(text):
+            candidate = _candidate(text, number.group(0), number.start(), number.end(), None)
+            if candidate is not None:
+                candidates.append(candidate)
+                if limit and len(candidates) >= limit:
+                    break
+    candidates.sort(key=lambda c: c.score, reverse=True)
+    return candidates
+
+
+def extract_price_and_currency(text: str) -> Tuple[Optional[float], Optional[str]]:
+    candidates = find_price_candidates(text)
+    if not candidates:
+        return None, None
+    best = candidates[0]
+    return best.amount, best.currency
 
-    if value <= 0 or value > 1_000_000:
-        return None, currency
 
-    return value, currency
+def extract_prices_batch(texts: Iterable[str]) -> List[Tuple[Optional[float], Optional[str]]]:
+    """
+    Best (amount, currency) per text, in input order. Identical texts, e.g.
+    the same listing scraped for several products, are parsed once.
+    """
+    parsed: Dict[str, Tuple[Optional[float], Optional[str]]] = {}
+    results = []
+    for text in texts:
+        found = parsed.get(text)
+        if found is None:
+            found = parsed[text] = extract_price_and_currency(text)
+        results.append(found)
+    return results
 
 
 def normalize_to_usd(amount: Optional[float], currency: Optional[str], fx_rates: dict[str, float]) -> Optional[float]:
@@ -0,0 +1,112 @@
+"""
+Micro-benchmark for price_parser.
+
+Builds body-text fixtures of a few sizes that look like the
+`page.inner_text("body")` fallback (navigation, reviews, carousels of other
+products, footer), then times extract_price_and_currency against the
+previous first-number implementation, plus the batch API. Also reports how
+often each picks the expected product price.
+
+Usage:
+    python price_parser_bench.py [--sizes 2000,50000,500000] [--repeat 20] [--seed 7]
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import re
+import time
+from typing import Callable, List, Optional, Tuple
+
+from price_parser import extract_price_and_currency, extract_prices_batch
+
+FILLER = (
+    "Home Deals Electronics Computers Sign in Account & Lists Returns & Orders Cart 0 items "
+    "Customer reviews 4.6 out of 5 stars 12,431 global ratings 5 star 78% 4 star 12% "
+    "Frequently bought together Free delivery Tuesday, order within 3 hrs 12 mins "
+    "Ships from and sold by Example Store. Model 2024 Edition, 256 GB, 8 GB RAM "
+)
+PRICE_FORMATS = [
+    ("${:,.2f}", "USD", lambda v: v),
+    ("{:,.2f} €", "EUR", lambda v: v),
+    ("EUR {}", "EUR", lambda v: f"{v:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")),
+    ("£{:,.2f}", "GBP", lambda v: v),
+    ("{} zł", "PLN", lambda v: f"{v:,.2f}".replace(",", " ").replace(".", ",")),
+]
+
+
+def legacy_extract(text: str) -> Tuple[Optional[float], Optional[str]]:
+    """The pre-engine implementation, kept here as the baseline."""
+    if not text:
+        return None, None
+    currency = None
+    for symbol, code in {"$": "USD", "€": "EUR", "£": "GBP"}.items():
+        if symbol in text:
+            currency = code
+            break
+    match = re.search(r"([0-9]{1,3}(?:[,\s][0-9]{3})*(?:\.[0-9]{1,2})?|[0-9]+(?:\.[0-9]{1,2})?)", text)
+    if not match:
+        return None, currency
+    try:
+        value = float(match.group(1).replace(",", "").replace(" ", ""))
+    except ValueError:
+        return None, currency
+    if value <= 0 or value > 1_000_000:
+        return None, currency
+    return value, currency
+
+
+def build_fixture(size: int, rng: random.Random) -> Tuple[str, float, str]:
+    value = round(rng.uniform(5, 5000), 2)
+    template, currency, render = rng.choice(PRICE_FORMATS)
+    price = template.format(render(value))
+    head = FILLER * max(1, size // (len(FILLER) * 10))
+    parts = [head, f"Price: {price} ", "List price was 20% higher. "]
+    while sum(len(p) for p in parts) < size:
+        other = round(rng.uniform(5, 5000), 2)
+        parts.append(f"{FILLER} Customers also viewed ${other:,.2f} ")
+    return "".join(parts)[: max(size, len(head) + 64)], value, currency
+
+
+def time_call(fn: Callable[[], object], repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def accuracy(extract: Callable[[str], Tuple[Optional[float], Optional[str]]], fixtures: List[Tuple[str, float, str]]) -> float:
+    hits = 0
+    for text, value, currency in fixtures:
+        amount, found = extract(text)
+        if amount is not None and abs(amount - value) < 0.005 and found == currency:
+            hits += 1
+    return hits / len(fixtures)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="price_parser micro-benchmark")
+    parser.add_argument("--sizes", default="2000,50000,500000", help="fixture sizes in characters")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--fixtures", type=int, default=50, help="fixtures per size for accuracy and batch timing")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'size':>8} {'legacy ms':>10} {'engine ms':>10} {'batch ms/text':>14} {'legacy acc':>11} {'engine acc':>11}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        fixtures = [build_fixture(size, rng) for _ in range(args.fixtures)]
+        text = fixtures[0][0]
+        legacy_ms = time_call(lambda: legacy_extract(text), args.repeat)
+        engine_ms = time_call(lambda: extract_price_and_currency(text), args.repeat)
+        texts = [f[0] for f in fixtures]
+        batch_ms = time_call(lambda: extract_prices_batch(texts), max(args.repeat // 5, 1)) / len(texts)
+        print(
+            f"{size:>8} {legacy_ms:>10.3f} {engine_ms:>10.3f} {batch_ms:>14.3f} "
+            f"{accuracy(legacy_extract, fixtures):>11.2f} {accuracy(extract_price_and_currency, fixtures):>11.2f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
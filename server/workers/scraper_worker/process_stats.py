@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import json
+import os
+import time
+from typing import Any, Dict, Optional
+
+
+def _read_ppid_and_rss(pid: str, page_kb: int) -> Optional[tuple]:
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            stat = f.read()
+        with open(f"/proc/{pid}/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    # comm may contain spaces; fields after the closing paren are fixed
+    ppid = int(stat.rsplit(")", 1)[1].split()[1])
+    return ppid, resident_pages * page_kb
+
+
+def process_tree_rss_mb(root_pid: Optional[int] = None) -> Optional[float]:
+    """RSS of a process and all its descendants (Linux /proc); None where unavailable."""
+    if not os.path.isdir("/proc"):
+        return None
+    root = root_pid or os.getpid()
+    page_kb = os.sysconf("SC_PAGE_SIZE") // 1024
+    children: Dict[int, list] = {}
+    rss_kb: Dict[int, int] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        parsed = _read_ppid_and_rss(entry, page_kb)
+        if parsed is None:
+            continue
+        ppid, rss = parsed
+        rss_kb[int(entry)] = rss
+        children.setdefault(ppid, []).append(int(entry))
+
+    total, stack = 0, [root]
+    while stack:
+        pid = stack.pop()
+        total += rss_kb.get(pid, 0)
+        stack.extend(children.get(pid, []))
+    return total / 1024
+
+
+def write_stats(path: str, stats: Dict[str, Any]) -> None:
+    """Atomically replaces a per-process stats file (read by the supervisor)."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({**stats, "pid": os.getpid(), "updatedAt": time.time()}, f)
+    os.replace(tmp, path)
+
+
+def read_stats(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
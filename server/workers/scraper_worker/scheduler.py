@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from job_notifier import JobNotifier
+from job_queue import ScrapeJob
+from logging_utils import info, warn
+from page_pool import PagePool
+from process_stats import process_tree_rss_mb
+
+
+MAX_CONCURRENT_JOBS = int(os.getenv("SCRAPER_MAX_CONCURRENT_JOBS", "2"))
+# 0 disables the memory check; counts this process plus its browser children
+MAX_RSS_MB = float(os.getenv("SCRAPER_MAX_RSS_MB", "0"))
+# The reading walks /proc, so it is reused for this long between scheduler ticks
+RSS_CHECK_SEC = float(os.getenv("SCRAPER_RSS_CHECK_SEC", "2"))
+# Lease at most this many jobs, then drain and exit so a supervisor can recycle the process; 0 = unlimited
+MAX_JOBS_PER_PROCESS = int(os.getenv("SCRAPER_MAX_JOBS_PER_PROCESS", "0"))
+# Idle polling without a listener: starts at the minimum and doubles on every empty lease
+POLL_MIN_SEC = float(os.getenv("SCRAPER_POLL_MIN_SEC", "0.5"))
+POLL_MAX_SEC = float(os.getenv("SCRAPER_POLL_MAX_SEC", "15"))
+# With a live listener, still re-query this often: retryAt cool-offs expire without any document change
+LISTENER_SAFETY_POLL_SEC = float(os.getenv("SCRAPER_LISTENER_SAFETY_POLL_SEC", "30"))
+
+
+class JobScheduler:
+    """Keeps up to max_jobs scrape jobs in flight on one shared page pool."""
+
+    def __init__(
+        self,
+        pool: PagePool,
+        process: Callable[[PagePool, ScrapeJob], Awaitable[None]],
+        lease: Callable[[int], List[ScrapeJob]],
+        poll_interval: float,
+        max_jobs: int = MAX_CONCURRENT_JOBS,
+        max_rss_mb: float = MAX_RSS_MB,
+        max_jobs_total: int = MAX_JOBS_PER_PROCESS,
+        notifier: Optional[JobNotifier] = None,
+    ):
+        self.pool = pool
+        self.process = process
+        self.lease = lease
+        self.max_jobs = max(max_jobs, 1)
+        self.max_rss_mb = max_rss_mb
+        self.poll_interval = poll_interval
+        self.max_jobs_total = max_jobs_total
+        self.notifier = notifier
+        self._empty_leases = 0
+        self._rss_mb: Optional[float] = None
+        self._rss_checked_at = float("-inf")
+        # task -> job id, so the lease heartbeat knows what this process holds
+        self._inflight: Dict[asyncio.Task, str] = {}
+        self._stopping = asyncio.Event()
+        self._slot_freed = asyncio.Event()
+        self.jobs_started = 0
+        self.jobs_finished = 0
+        self.jobs_failed = 0
+        self.urls_started = 0
+        self._started_at = time.monotonic()
+
+    def request_stop(self) -> None:
+        if not self._stopping.is_set():
+            info("scheduler", "drain_requested", inflight=len(self._inflight))
+            self._stopping.set()
+
+    @property
+    def stopping(self) -> bool:
+        return self._stopping.is_set()
+
+    def inflight_job_ids(self) -> List[str]:
+        return list(self._inflight.values())
+
+    def abandon(self, job_id: str) -> bool:
+        """Cancels the job's task, e.g. once another worker holds its lease. False when it isn't running here."""
+        for task, inflight_id in self._inflight.items():
+            if inflight_id == job_id:
+                task.cancel()
+                return True
+        return False
+
+    async def _over_memory(self) -> bool:
+        now = time.monotonic()
+        if now - self._rss_checked_at >= RSS_CHECK_SEC:
+            self._rss_checked_at = now
+            # in a thread: walking /proc on a busy host would stall every scrape coroutine
+            self._rss_mb = await asyncio.to_thread(process_tree_rss_mb)
+        return self._rss_mb is not None and self._rss_mb > self.max_rss_mb
+
+    async def _backpressure_reason(self) -> Optional[str]:
+        if len(self._inflight) >= self.max_jobs:
+            return "max_jobs"
+        # every page busy and URLs already queued for one: another job would only wait
+        if self._inflight and self.pool.waiters > 0:
+            return "pages_busy"
+        if self.max_rss_mb > 0 and self._inflight and await self._over_memory():
+            return "memory"
+        return None
+
+    def _on_done(self, task: asyncio.Task) -> None:
+        self._inflight.pop(task, None)
+        self.jobs_finished += 1
+        self._slot_freed.set()
+        if not task.cancelled() and task.exception() is not None:
+            self.jobs_failed += 1
+            warn("scheduler", "job_task_failed", error=str(task.exception()))
+
+    async def _wait(self, timeout: float, wake_on_jobs: bool = False) -> None:
+        """Sleeps until a job finishes, a stop is requested, new jobs are pushed (if asked) or the timeout passes."""
+        self._slot_freed.clear()
+        waiters = [asyncio.ensure_future(self._slot_freed.wait()), asyncio.ensure_future(self._stopping.wait())]
+        if wake_on_jobs and self.notifier is not None and self.notifier.listening:
+            waiters.append(asyncio.ensure_future(self.notifier.wait()))
+        try:
+            await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+
+    def _idle_timeout(self) -> float:
+        if self.notifier is not None:
+            self.notifier.maintain()
+            if self.notifier.listening:
+                return LISTENER_SAFETY_POLL_SEC
+        # listener off or dropped: exponential backoff while the queue stays empty
+        timeout = min(POLL_MIN_SEC * (2 ** min(self._empty_leases, 16)), POLL_MAX_SEC)
+        self._empty_leases += 1
+        return timeout
+
+    def _start(self, job: ScrapeJob) -> None:
+        self.jobs_started += 1
+        self.urls_started += len(job.urls)
+        task = asyncio.create_task(self.process(self.pool, job), name=f"job-{job.job_id}")
+        self._inflight[task] = job.job_id
+        task.add_done_callback(self._on_done)
+
+    async def run(self) -> None:
+        while not self.stopping:
+            reason = await self._backpressure_reason()
+            if reason is not None:
+                # page/memory pressure clears without a job finishing, so recheck sooner
+                await self._wait(self.poll_interval if reason == "max_jobs" else min(self.poll_interval, 0.5))
+                continue
+
+            # claim every free slot in one round trip
+            wanted = self.max_jobs - len(self._inflight)
+            if self.max_jobs_total:
+                wanted = min(wanted, self.max_jobs_total - self.jobs_started)
+            # Firestore client is blocking; keep it off the event loop
+            jobs = await asyncio.to_thread(self.lease, wanted)
+            if not jobs:
+                await self._wait(self._idle_timeout(), wake_on_jobs=True)
+                continue
+            self._empty_leases = 0
+
+            for job in jobs:
+                self._start(job)
+            if self.max_jobs_total and self.jobs_started >= self.max_jobs_total:
+                info("scheduler", "job_limit_reached", jobs_started=self.jobs_started)
+                self._stopping.set()
+
+        if self._inflight:
+            info("scheduler", "draining", inflight=len(self._inflight))
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        info("scheduler", "drained", jobs_started=self.jobs_started, jobs_finished=self.jobs_finished)
+
+    def stats(self) -> dict:
+        uptime = time.monotonic() - self._started_at
+        return {
+            "jobsStarted": self.jobs_started,
+            "jobsFinished": self.jobs_finished,
+            "jobsFailed": self.jobs_failed,
+            "urlsStarted": self.urls_started,
+            "inflight": len(self._inflight),
+            "blockedRequests": self.pool.blocked_requests,
+            "uptimeSec": round(uptime, 1),
+            "jobsPerMin": round(self.jobs_finished / uptime * 60, 2) if uptime > 0 else 0.0,
+            "stopping": self.stopping,
+        }
@@ -0,0 +1,210 @@
+"""
+Per-domain browser session cache. After a consent banner is accepted (or a
+page scrapes cleanly) the cookies and localStorage Playwright reports for
+that domain are written to `.storage/sessions/<domain>.json`; later pages on
+the domain, in this process or after a restart, start with that state so
+banners and bot checks don't come back on every visit. Sessions expire
+after SCRAPER_SESSION_TTL_SEC and are dropped as soon as the domain blocks.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import re
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from playwright.async_api import BrowserContext
+
+from logging_utils import info, warn
+
+
+SESSION_CACHE_ENABLED = os.getenv("SCRAPER_SESSION_CACHE", "1") not in ("0", "false", "False")
+SESSION_DIR = os.getenv(
+    "SCRAPER_SESSION_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".storage", "sessions"),
+)
+SESSION_TTL_SEC = float(os.getenv("SCRAPER_SESSION_TTL_SEC", str(6 * 3600)))
+
+
+def session_key(hostname: str) -> str:
+    """www.amazon.com and amazon.com share a session; other subdomains get their own."""
+    host = hostname.lower().split(":", 1)[0].rstrip(".")
+    return host[4:] if host.startswith("www.") else host
+
+
+def _cookie_matches(cookie: Dict[str, Any], key: str) -> bool:
+    domain = (cookie.get("domain") or "").lstrip(".").lower()
+    # cookies set on the parent domain apply here too
+    return bool(domain) and (key == domain or key.endswith("." + domain) or domain.endswith("." + key))
+
+
+def _origin_matches(origin: Dict[str, Any], key: str) -> bool:
+    host = session_key(re.sub(r"^[a-z]+://", "", origin.get("origin", "")))
+    return host == key or host.endswith("." + key)
+
+
+@dataclass
+class DomainSession:
+    key: str
+    saved_at: float
+    # a consent banner was accepted under these cookies
+    consent: bool = False
+    cookies: List[Dict[str, Any]] = field(default_factory=list)
+    origins: List[Dict[str, Any]] = field(default_factory=list)
+
+    def expired(self, ttl_sec: float, now: Optional[float] = None) -> bool:
+        return (now or time.time()) - self.saved_at >= ttl_sec
+
+
+def _local_storage_script(origins: List[Dict[str, Any]]) -> str:
+    entries = {o["origin"]: {item["name"]: item["value"] for item in o.get("localStorage", [])} for o in origins}
+    # init scripts can't be removed from a context, so only fill keys the page doesn't already have
+    return (
+        "(() => { const saved = " + json.dumps(entries) + ";"
+        " const items = saved[location.origin]; if (!items) return;"
+        " try { for (const [k, v] of Object.entries(items)) { if (localStorage.getItem(k) === null) localStorage.setItem(k, v); } }"
+        " catch (e) {} })();"
+    )
+
+
+class SessionCache:
+    def __init__(self, directory: str = SESSION_DIR, ttl_sec: float = SESSION_TTL_SEC):
+        self.directory = directory
+        self.ttl_sec = ttl_sec
+        # None caches "nothing on disk" so misses don't hit the filesystem every URL
+        self._sessions: Dict[str, Optional[DomainSession]] = {}
+        self._versions: Dict[str, int] = {}
+        # context id -> session key -> version already applied to it
+        self._applied: Dict[int, Dict[str, int]] = {}
+        # context id -> session keys with a localStorage init script installed. Init scripts
+        # can't be removed and pooled contexts live as long as the process, so each
+        # domain gets one; the context's own localStorage carries later changes.
+        self._scripted: Dict[int, Set[str]] = {}
+        self.hits = 0
+        self.saves = 0
+        self.expirations = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, re.sub(r"[^a-z0-9.-]", "_", key) + ".json")
+
+    def _load(self, key: str) -> Optional[DomainSession]:
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                return DomainSession(**json.load(f))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, TypeError) as exc:
+            warn("session", "session_load_failed", domain=key, error=str(exc))
+            return None
+
+    def _write(self, session: DomainSession) -> None:
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        path = self._path(session.key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(asdict(session), f)
+        # readers (other fleet processes) see the old file or the new one, never half of one
+        os.replace(tmp, path)
+
+    def _remove(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+        except OSError as exc:
+            warn("session", "session_remove_failed", domain=key, error=str(exc))
+
+    def get(self, hostname: str) -> Optional[DomainSession]:
+        key = session_key(hostname)
+        if key not in self._sessions:
+            self._sessions[key] = self._load(key)
+            self._versions[key] = self._versions.get(key, 0) + 1
+        session = self._sessions[key]
+        if session is not None and session.expired(self.ttl_sec):
+            self._drop(key)
+            self.expirations += 1
+            info("session", "session_expired", domain=key, reason="ttl")
+            return None
+        return session
+
+    def consent_known(self, hostname: str) -> bool:
+        session = self.get(hostname)
+        return session is not None and session.consent
+
+    async def apply(self, context: BrowserContext, hostname: str) -> bool:
+        """
+        Loads the domain's saved cookies into the context once per saved
+        version, and its localStorage once per context. True when a session was used.
+        """
+        session = self.get(hostname)
+        if session is None:
+            return False
+        key = session.key
+        applied = self._applied.setdefault(id(context), {})
+        version = self._versions.get(key, 0)
+        if applied.get(key) != version:
+            if session.cookies:
+                await context.add_cookies(session.cookies)
+            scripted = self._scripted.setdefault(id(context), set())
+            if session.origins and key not in scripted:
+                await context.add_init_script(script=_local_storage_script(session.origins))
+                scripted.add(key)
+            applied[key] = version
+        self.hits += 1
+        return True
+
+    async def save(self, context: BrowserContext, hostname: str, consent: bool) -> None:
+        key = session_key(hostname)
+        previous = self._sessions.get(key)
+        state = await context.storage_state()
+        session = DomainSession(
+            key=key,
+            saved_at=time.time(),
+            consent=consent or bool(previous and previous.consent),
+            cookies=[c for c in state.get("cookies", []) if _cookie_matches(c, key)],
+            origins=[o for o in state.get("origins", []) if _origin_matches(o, key)],
+        )
+        try:
+            await asyncio.to_thread(self._write, session)
+        except OSError as exc:
+            warn("session", "session_save_failed", domain=key, error=str(exc))
+            return
+        self._sessions[key] = session
+        self._versions[key] = self._versions.get(key, 0) + 1
+        # this context already holds the state it just saved, localStorage included
+        self._applied.setdefault(id(context), {})[key] = self._versions[key]
+        self._scripted.setdefault(id(context), set()).add(key)
+        self.saves += 1
+        info("session", "session_saved", domain=key, consent=session.consent, cookies=len(session.cookies))
+
+    def _drop(self, key: str) -> None:
+        self._sessions[key] = None
+        self._versions[key] = self._versions.get(key, 0) + 1
+        self._remove(key)
+
+    async def invalidate(self, hostname: str, contexts: Iterable[BrowserContext], reason: str) -> None:
+        """Forgets the domain's session and clears its cookies from live contexts, e.g. after a block."""
+        key = session_key(hostname)
+        had_session = self._sessions.get(key) is not None
+        self._drop(key)
+        pattern = re.compile(rf"(^|\.){re.escape(key)}$")
+        for context in contexts:
+            self._applied.get(id(context), {}).pop(key, None)
+            try:
+                await context.clear_cookies(domain=pattern)
+            except Exception as exc:  # noqa: BLE001
+                warn("session", "session_clear_failed", domain=key, error=str(exc))
+        if had_session:
+            self.expirations += 1
+            info("session", "session_expired", domain=key, reason=reason)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "sessions": sum(1 for s in self._sessions.values() if s is not None),
+            "hits": self.hits,
+            "saves": self.saves,
+            "expirations": self.expirations,
+        }
@@ -0,0 +1,142 @@
+"""
+Streaming snapshot mode: the competitorSnapshots document is created as soon
+as a job starts (pricingStatus "scraping"), competitor results are appended
+with ArrayUnion as they finish, and the snapshot is handed to the pricing
+worker (pricingStatus "pending") once a quorum of URLs has a price or the
+deadline passes, instead of waiting for the slowest page.
+"""
+from __future__ import annotations
+
+import asyncio
+import math
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from google.cloud import firestore
+
+from job_queue import ScrapeJob
+from logging_utils import info, warn
+
+
+STREAM_SNAPSHOTS = os.getenv("SCRAPER_STREAM_SNAPSHOTS", "0") in ("1", "true", "True")
+# Share of a job's URLs that must have a price before pricing may start
+SNAPSHOT_QUORUM = float(os.getenv("SCRAPER_SNAPSHOT_QUORUM", "0.5"))
+# After this long, any snapshot with at least one price is released to pricing
+SNAPSHOT_DEADLINE_SEC = float(os.getenv("SCRAPER_SNAPSHOT_DEADLINE_SEC", "45"))
+SNAPSHOT_FLUSH_SEC = float(os.getenv("SCRAPER_SNAPSHOT_FLUSH_SEC", "1"))
+
+
+class SnapshotStream:
+    def __init__(
+        self,
+        snapshot_ref: Any,
+        job: ScrapeJob,
+        quorum: float = SNAPSHOT_QUORUM,
+        deadline_sec: float = SNAPSHOT_DEADLINE_SEC,
+        flush_sec: float = SNAPSHOT_FLUSH_SEC,
+    ):
+        self.ref = snapshot_ref
+        self.job = job
+        self.quorum_count = max(1, math.ceil(len(job.urls) * min(max(quorum, 0.0), 1.0)))
+        self.deadline = time.monotonic() + deadline_sec
+        self.flush_sec = flush_sec
+        self.released = False
+        self.successes = 0
+        self.completed = 0
+        self._pending: List[Dict[str, Any]] = []
+        self._wake = asyncio.Event()
+        self._closing = False
+        self._runner: Optional[asyncio.Task] = None
+
+    async def open(self) -> None:
+        payload: Dict[str, Any] = {
+            "snapshotId": self.ref.id,
+            "productId": self.job.product_id,
+            "jobId": self.job.job_id,
+            "scrapedAt": datetime.now(timezone.utc),
+            "scrapeLatencyMs": None,
+            "competitors": [],
+            "stats": {"urlCount": len(self.job.urls), "completedCount": 0, "successCount": 0},
+            "pricingStatus": "scraping",
+            "lastError": None,
+        }
+        await asyncio.to_thread(self.ref.set, payload)
+        self._runner = asyncio.create_task(self._run(), name=f"snapshot-{self.ref.id}")
+
+    def add(self, result: Dict[str, Any]) -> None:
+        self._pending.append(result)
+        self.completed += 1
+        if result["status"] == "succeeded":
+            self.successes += 1
+            if not self.released and self.successes == self.quorum_count:
+                # don't wait for the next tick to hand over to pricing
+                self._wake.set()
+
+    def _ready_for_pricing(self) -> bool:
+        if self.successes >= self.quorum_count:
+            return True
+        return self.successes > 0 and time.monotonic() >= self.deadline
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_sec)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if self._closing:
+                return
+            try:
+                await self._flush()
+            except Exception as exc:  # noqa: BLE001
+                warn("scraper", "snapshot_flush_failed", snapshot_id=self.ref.id, error=str(exc))
+
+    async def _flush(self, final: Optional[Dict[str, Any]] = None) -> None:
+        results, self._pending = self._pending, []
+        update: Dict[str, Any] = {}
+        if results:
+            update["competitors"] = firestore.ArrayUnion(results)
+            if final is None:
+                update["stats.completedCount"] = firestore.Increment(len(results))
+                update["stats.successCount"] = firestore.Increment(sum(1 for r in results if r["status"] == "succeeded"))
+        releasing = not self.released and (self._ready_for_pricing() or final is not None)
+        if releasing:
+            update["pricingStatus"] = "pending"
+        if final:
+            update.update(final)
+        if not update:
+            return
+        try:
+            await asyncio.to_thread(self.ref.update, update)
+        except Exception:
+            # retry these results on the next flush, ahead of newer ones
+            self._pending[:0] = results
+            raise
+        if releasing:
+            self.released = True
+            info("scraper", "snapshot_released", snapshot_id=self.ref.id, job_id=self.job.job_id, successes=self.successes, completed=self.completed, urls=len(self.job.urls))
+
+    async def _stop_runner(self) -> None:
+        self._closing = True
+        self._wake.set()
+        if self._runner is not None:
+            await self._runner
+
+    async def close(self, stats: Dict[str, Any], latency_ms: int) -> None:
+        """Writes the remaining results and final stats; releases to pricing if the quorum never did."""
+        await self._stop_runner()
+        stats = dict(stats, urlCount=len(self.job.urls), completedCount=self.completed)
+        await self._flush({"stats": stats, "scrapeLatencyMs": latency_ms})
+
+    async def abort(self, reason: str) -> None:
+        """Job failed mid-scrape: keep what was scraped, but don't hand an unreleased snapshot to pricing."""
+        await self._stop_runner()
+        update: Dict[str, Any] = {"lastError": reason}
+        if self._pending:
+            update["competitors"] = firestore.ArrayUnion(self._pending)
+            self._pending = []
+        if not self.released:
+            update["pricingStatus"] = "failed"
+        await asyncio.to_thread(self.ref.update, update)
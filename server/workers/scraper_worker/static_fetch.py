@@ -0,0 +1,241 @@
+"""
+Static-HTML tier: fetch the page over plain HTTP and read the price from
+server-rendered markup (JSON-LD offers, schema.org microdata, OpenGraph
+product tags, then the domain's price_selectors). Only when this misses
+does the worker spend a browser page on the URL.
+"""
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import httpx
+from selectolax.lexbor import LexborHTMLParser
+
+from domains import DomainConfig
+from logging_utils import warn
+from price_parser import parse_amount
+
+
+STATIC_FETCH_ENABLED = os.getenv("SCRAPER_STATIC_FETCH", "1") not in ("0", "false", "False")
+STATIC_TIMEOUT_SEC = float(os.getenv("SCRAPER_STATIC_TIMEOUT_SEC", "10"))
+STATIC_MAX_CONNECTIONS = int(os.getenv("SCRAPER_STATIC_MAX_CONNECTIONS", "20"))
+# Pages larger than this are left to the browser rather than parsed
+STATIC_MAX_BYTES = int(os.getenv("SCRAPER_STATIC_MAX_BYTES", str(4 * 1024 * 1024)))
+# After this many static attempts with no hit, a host goes straight to the browser
+STATIC_MIN_SAMPLES = int(os.getenv("SCRAPER_STATIC_MIN_SAMPLES", "20"))
+# ...except every Nth URL, in case the site starts server-rendering prices; 0 = never re-probe
+STATIC_REPROBE_EVERY = int(os.getenv("SCRAPER_STATIC_REPROBE_EVERY", "50"))
+
+
+@dataclass
+class StaticPrice:
+    raw_text: str
+    # set when the markup carries a machine-readable number (JSON-LD, microdata)
+    amount: Optional[float]
+    currency: Optional[str]
+    source: str
+
+
+class TierStats:
+    """Per-hostname counts of which tier produced each result."""
+
+    def __init__(self) -> None:
+        self._hosts: Dict[str, Dict[str, int]] = {}
+
+    def record(self, hostname: str, tier: str, static_attempted: bool) -> None:
+        counts = self._hosts.get(hostname)
+        if counts is None:
+            counts = self._hosts[hostname] = {"static": 0, "browser": 0, "staticAttempts": 0, "staticSkipped": 0}
+        counts[tier] += 1
+        if static_attempted:
+            counts["staticAttempts"] += 1
+
+    def static_worthwhile(self, hostname: str) -> bool:
+        """Called once per URL; a host written off after STATIC_MIN_SAMPLES misses is re-probed every STATIC_REPROBE_EVERY URLs."""
+        counts = self._hosts.get(hostname)
+        if counts is None or counts["staticAttempts"] < STATIC_MIN_SAMPLES or counts["static"] > 0:
+            return True
+        counts["staticSkipped"] += 1
+        return STATIC_REPROBE_EVERY > 0 and counts["staticSkipped"] % STATIC_REPROBE_EVERY == 0
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        out: Dict[str, Dict[str, Any]] = {}
+        for hostname, counts in self._hosts.items():
+            total = counts["static"] + counts["browser"]
+            out[hostname] = dict(counts, staticHitRate=round(counts["static"] / total, 3) if total else 0.0)
+        return out
+
+
+tier_stats = TierStats()
+
+
+class StaticFetcher:
+    """Keep-alive HTTP client shared by every job in the process."""
+
+    def __init__(self, user_agent: str, timeout: float = STATIC_TIMEOUT_SEC, max_connections: int = STATIC_MAX_CONNECTIONS):
+        self._client = httpx.AsyncClient(
+            headers={
+                "User-Agent": user_agent,
+                "Accept": "text/html,application/xhtml+xml;q=0.9,*/*;q=0.8",
+                "Accept-Language": "en-US,en;q=0.9",
+            },
+            follow_redirects=True,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    async def fetch(self, url: str) -> Optional[Tuple[str, str]]:
+        """Returns (final_url, html), or None if the response isn't a usable HTML page."""
+        try:
+            async with self._client.stream("GET", url) as response:
+                if response.status_code != 200:
+                    return None
+                if "html" not in response.headers.get("content-type", "html"):
+                    return None
+                body = bytearray()
+                async for chunk in response.aiter_bytes():
+                    body.extend(chunk)
+                    if len(body) > STATIC_MAX_BYTES:
+                        return None
+                return str(response.url), body.decode(response.encoding or "utf-8", errors="replace")
+        except httpx.HTTPError as exc:
+            warn("scraper", "static_fetch_failed", url=url, error=type(exc).__name__)
+            return None
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+def _to_amount(value: Any) -> Optional[float]:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, str):
+        # JSON-LD from European shops sometimes carries "1.234,56"
+        return parse_amount(value)
+    return None
+
+
+def _walk_offers(node: Any) -> Iterator[Dict[str, Any]]:
+    if isinstance(node, list):
+        for item in node:
+            yield from _walk_offers(item)
+        return
+    if not isinstance(node, dict):
+        return
+    if "price" in node or "lowPrice" in node:
+        yield node
+    for key in ("offers", "@graph", "mainEntity", "itemListElement"):
+        if key in node:
+            yield from _walk_offers(node[key])
+
+
+def _is_product(node: Dict[str, Any]) -> bool:
+    types = node.get("@type")
+    # "Product", "schema:Product", "https://schema.org/Product", or a list of them
+    for name in types if isinstance(types, list) else [types]:
+        if isinstance(name, str) and name.rsplit("/", 1)[-1].rsplit(":", 1)[-1] == "Product":
+            return True
+    return False
+
+
+def _product_nodes(node: Any) -> Iterator[Dict[str, Any]]:
+    """The page's own Product nodes; itemListElement (related products, carousels) is not searched."""
+    if isinstance(node, list):
+        for item in node:
+            yield from _product_nodes(item)
+        return
+    if not isinstance(node, dict):
+        return
+    if _is_product(node):
+        yield node
+    for key in ("@graph", "mainEntity"):
+        if key in node:
+            yield from _product_nodes(node[key])
+
+
+def _offer_price(offers: Iterator[Dict[str, Any]]) -> Optional[StaticPrice]:
+    for offer in offers:
+        raw = offer.get("price", offer.get("lowPrice"))
+        if raw is None or raw == "":
+            continue
+        return StaticPrice(str(raw), _to_amount(raw), offer.get("priceCurrency"), "json_ld")
+    return None
+
+
+def _from_json_ld(tree: LexborHTMLParser) -> Optional[StaticPrice]:
+    documents = []
+    for script in tree.css("script[type='application/ld+json']"):
+        try:
+            documents.append(json.loads(script.text(deep=True), strict=False))
+        except ValueError:
+            continue
+    # offers on the page's Product win over any other offer, e.g. in a related-products list
+    for data in documents:
+        for product in _product_nodes(data):
+            found = _offer_price(_walk_offers(product.get("offers")))
+            if found is not None:
+                return found
+    for data in documents:
+        found = _offer_price(_walk_offers(data))
+        if found is not None:
+            return found
+    return None
+
+
+def _from_microdata(tree: LexborHTMLParser) -> Optional[StaticPrice]:
+    for price_sel, currency_sel, source in (
+        ("[itemprop='price']", "[itemprop='priceCurrency']", "microdata"),
+        ("meta[property='product:price:amount']", "meta[property='product:price:currency']", "open_graph"),
+    ):
+        node = tree.css_first(price_sel)
+        if node is None:
+            continue
+        raw = node.attributes.get("content") or node.text(strip=True)
+        if not raw:
+            continue
+        currency_node = tree.css_first(currency_sel)
+        currency = None
+        if currency_node is not None:
+            currency = currency_node.attributes.get("content") or currency_node.text(strip=True) or None
+        return StaticPrice(raw, _to_amount(raw), currency, source)
+    return None
+
+
+def _from_selectors(tree: LexborHTMLParser, cfg: DomainConfig) -> Optional[StaticPrice]:
+    for selector in cfg.price_selectors:
+        node = tree.css_first(selector)
+        if node is None:
+            continue
+        raw = node.attributes.get("content") or node.text(strip=True)
+        if raw:
+            # free text: leave amount/currency to the price parser, as for browser results
+            return StaticPrice(raw, None, None, "selector")
+    return None
+
+
+def extract_static_price(html: str, cfg: Optional[DomainConfig]) -> Optional[StaticPrice]:
+    tree = LexborHTMLParser(html)
+    found = _from_json_ld(tree) or _from_microdata(tree)
+    if found is None and cfg is not None:
+        found = _from_selectors(tree, cfg)
+    return found
+
+
+_fetcher: Optional[StaticFetcher] = None
+
+
+def get_static_fetcher(user_agent: str) -> StaticFetcher:
+    global _fetcher
+    if _fetcher is None:
+        _fetcher = StaticFetcher(user_agent)
+    return _fetcher
+
+
+async def close_static_fetcher() -> None:
+    global _fetcher
+    if _fetcher is not None:
+        await _fetcher.close()
+        _fetcher = None
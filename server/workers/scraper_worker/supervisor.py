@@ -0,0 +1,183 @@
+"""
+Runs a fleet of scraper worker processes on one machine.
+
+Each child is a plain `python worker.py` with its own browser and lease
+loop; they share nothing but Firestore. The supervisor restarts children
+that crash, asks children whose process tree grows past
+SCRAPER_CHILD_MAX_RSS_MB to drain (SIGTERM, then SIGKILL after a grace
+period), and lets children recycle themselves after
+SCRAPER_MAX_JOBS_PER_PROCESS jobs. Per-child throughput stats are read
+from files the children publish and logged as fleet totals.
+
+Usage: python supervisor.py
+"""
+from __future__ import annotations
+
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from logging_utils import error, info, warn
+from metrics import METRICS_PORT
+from process_stats import process_tree_rss_mb, read_stats, write_stats
+
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "worker.py")
+
+PROCESS_COUNT = int(os.getenv("SCRAPER_PROCESSES", str(os.cpu_count() or 1)))
+CHILD_MAX_RSS_MB = float(os.getenv("SCRAPER_CHILD_MAX_RSS_MB", "0"))
+DRAIN_GRACE_SEC = float(os.getenv("SCRAPER_DRAIN_GRACE_SEC", "120"))
+CHECK_INTERVAL_SEC = float(os.getenv("SCRAPER_SUPERVISOR_CHECK_SEC", "5"))
+STATS_LOG_INTERVAL_SEC = float(os.getenv("SCRAPER_SUPERVISOR_STATS_SEC", "60"))
+MAX_RESTART_BACKOFF_SEC = 60.0
+# A child that lived at least this long resets its crash backoff
+STABLE_UPTIME_SEC = 60.0
+
+COUNTERS = ("jobsStarted", "jobsFinished", "jobsFailed", "urlsStarted")
+
+
+@dataclass
+class Child:
+    index: int
+    generation: int = 0
+    proc: Optional[subprocess.Popen] = None
+    started_at: float = 0.0
+    draining_since: Optional[float] = None
+    crashes: int = 0
+    restart_at: float = 0.0
+    stats_file: str = ""
+    # counters from this slot's previous generations
+    retired: Dict[str, float] = field(default_factory=dict)
+
+
+class Supervisor:
+    def __init__(
+        self,
+        processes: int = PROCESS_COUNT,
+        max_rss_mb: float = CHILD_MAX_RSS_MB,
+        stats_dir: Optional[str] = None,
+    ):
+        self.max_rss_mb = max_rss_mb
+        self.stats_dir = stats_dir or tempfile.mkdtemp(prefix="scraper_fleet_")
+        self.children: List[Child] = [Child(index=i) for i in range(max(processes, 1))]
+        self.stopping = False
+        self._last_stats_log = time.monotonic()
+
+    def spawn(self, child: Child) -> None:
+        child.generation += 1
+        child.stats_file = os.path.join(self.stats_dir, f"worker-{child.index}-{child.generation}.json")
+        env = dict(os.environ)
+        env.update({
+            "SCRAPER_WORKER_INDEX": str(child.index),
+            "SCRAPER_STATS_FILE": child.stats_file,
+        })
+        if METRICS_PORT > 0:
+            # one /metrics port per child: base, base + 1, ...
+            env["SCRAPER_METRICS_PORT"] = str(METRICS_PORT + child.index)
+        child.proc = subprocess.Popen([sys.executable, WORKER_SCRIPT], env=env)
+        child.started_at = time.monotonic()
+        child.draining_since = None
+        info("supervisor", "child_started", index=child.index, pid=child.proc.pid, generation=child.generation)
+
+    def _retire_stats(self, child: Child) -> None:
+        stats = read_stats(child.stats_file) or {}
+        for key in COUNTERS:
+            child.retired[key] = child.retired.get(key, 0) + stats.get(key, 0)
+
+    def _drain(self, child: Child, reason: str, **fields) -> None:
+        if child.proc is None or child.draining_since is not None:
+            return
+        warn("supervisor", "child_draining", index=child.index, pid=child.proc.pid, reason=reason, **fields)
+        child.proc.send_signal(signal.SIGTERM)
+        child.draining_since = time.monotonic()
+
+    def check(self) -> None:
+        now = time.monotonic()
+        for child in self.children:
+            if child.proc is None:
+                if not self.stopping and now >= child.restart_at:
+                    self.spawn(child)
+                continue
+
+            code = child.proc.poll()
+            if code is not None:
+                self._retire_stats(child)
+                uptime = now - child.started_at
+                if code == 0 or child.draining_since is not None:
+                    info("supervisor", "child_exited", index=child.index, code=code, uptime_sec=round(uptime, 1))
+                    child.crashes = 0
+                    child.restart_at = now
+                else:
+                    child.crashes = 0 if uptime >= STABLE_UPTIME_SEC else child.crashes + 1
+                    backoff = min(2 ** child.crashes, MAX_RESTART_BACKOFF_SEC) if child.crashes else 0
+                    error("supervisor", "child_crashed", index=child.index, code=code, restart_in_sec=backoff)
+                    child.restart_at = now + backoff
+                child.proc = None
+                continue
+
+            if child.draining_since is not None:
+                if now - child.draining_since > DRAIN_GRACE_SEC:
+                    warn("supervisor", "child_killed", index=child.index, pid=child.proc.pid)
+                    child.proc.kill()
+                continue
+
+            if self.max_rss_mb > 0:
+                rss = process_tree_rss_mb(child.proc.pid)
+                if rss is not None and rss > self.max_rss_mb:
+                    self._drain(child, "rss_limit", rss_mb=round(rss, 1))
+
+    def fleet_stats(self) -> Dict[str, float]:
+        totals: Dict[str, float] = {key: 0 for key in COUNTERS}
+        totals.update({"jobsPerMin": 0.0, "inflight": 0, "liveProcesses": 0})
+        for child in self.children:
+            for key in COUNTERS:
+                totals[key] += child.retired.get(key, 0)
+            if child.proc is None:
+                continue
+            totals["liveProcesses"] += 1
+            stats = read_stats(child.stats_file) or {}
+            for key in COUNTERS:
+                totals[key] += stats.get(key, 0)
+            totals["jobsPerMin"] += stats.get("jobsPerMin", 0.0)
+            totals["inflight"] += stats.get("inflight", 0)
+        totals["jobsPerMin"] = round(totals["jobsPerMin"], 2)
+        return totals
+
+    def _log_stats(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._last_stats_log < STATS_LOG_INTERVAL_SEC:
+            return
+        self._last_stats_log = now
+        stats = self.fleet_stats()
+        write_stats(os.path.join(self.stats_dir, "fleet.json"), stats)
+        info("supervisor", "fleet_stats", **stats)
+
+    def request_stop(self, *_args) -> None:
+        if self.stopping:
+            return
+        self.stopping = True
+        info("supervisor", "stopping", children=sum(1 for c in self.children if c.proc is not None))
+        for child in self.children:
+            self._drain(child, "shutdown")
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+        info("supervisor", "started", processes=len(self.children), stats_dir=self.stats_dir)
+        while True:
+            self.check()
+            self._log_stats()
+            if self.stopping and all(child.proc is None for child in self.children):
+                break
+            time.sleep(CHECK_INTERVAL_SEC if not self.stopping else min(CHECK_INTERVAL_SEC, 1.0))
+        self._log_stats(force=True)
+        info("supervisor", "stopped")
+
+
+if __name__ == "__main__":
+    Supervisor().run()
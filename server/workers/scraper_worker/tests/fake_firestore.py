@@ -0,0 +1,176 @@
+"""
+In-memory stand-in for the sync Firestore client, covering what job_queue
+uses: where/order_by/limit/start_after queries, batches, transactions run
+through firestore.transactional, SERVER_TIMESTAMP and Increment.
+Install it with job_queue.set_client(FakeClient()).
+"""
+from __future__ import annotations
+
+import copy
+import itertools
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from google.cloud import firestore
+
+_ids = itertools.count(1)
+
+_OPS: Dict[str, Callable[[Any, Any], bool]] = {
+    "==": lambda a, b: a == b,
+    "<": lambda a, b: a is not None and a < b,
+    "<=": lambda a, b: a is not None and a <= b,
+    ">": lambda a, b: a is not None and a > b,
+    "in": lambda a, b: a in b,
+}
+
+
+def _apply(doc: Dict[str, Any], fields: Dict[str, Any]) -> None:
+    for key, value in fields.items():
+        if value is firestore.SERVER_TIMESTAMP:
+            value = datetime.now(timezone.utc)
+        elif type(value).__name__ == "Increment":
+            value = (doc.get(key) or 0) + value.value
+        doc[key] = value
+
+
+class Snapshot:
+    def __init__(self, ref: "DocRef", data: Optional[Dict[str, Any]]):
+        self.reference = ref
+        self.id = ref.id
+        self._data = data
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return copy.deepcopy(self._data)
+
+
+class DocRef:
+    def __init__(self, db: "FakeClient", collection: str, doc_id: str):
+        self.db = db
+        self.collection = collection
+        self.id = doc_id
+
+    def get(self, transaction: Any = None) -> Snapshot:
+        return Snapshot(self, copy.deepcopy(self.db.data[self.collection].get(self.id)))
+
+    def set(self, fields: Dict[str, Any], merge: bool = False) -> None:
+        doc = self.db.data[self.collection].get(self.id, {}) if merge else {}
+        _apply(doc, fields)
+        self.db.data[self.collection][self.id] = doc
+
+    def update(self, fields: Dict[str, Any]) -> None:
+        if self.id not in self.db.data[self.collection]:
+            raise KeyError(f"no document {self.collection}/{self.id}")
+        _apply(self.db.data[self.collection][self.id], fields)
+
+
+class Query:
+    def __init__(self, db: "FakeClient", collection: str, filters=(), orders=(), limit_to=None, after=None):
+        self.db = db
+        self.collection = collection
+        self.filters: List[Tuple[str, str, Any]] = list(filters)
+        self.orders: List[Tuple[str, str]] = list(orders)
+        self.limit_to: Optional[int] = limit_to
+        self.after: Optional[Snapshot] = after
+
+    def _copy(self, **changes: Any) -> "Query":
+        args = dict(filters=self.filters, orders=self.orders, limit_to=self.limit_to, after=self.after)
+        args.update(changes)
+        return Query(self.db, self.collection, **args)
+
+    def where(self, field: str, op: str, value: Any) -> "Query":
+        return self._copy(filters=self.filters + [(field, op, value)])
+
+    def order_by(self, field: str, direction: str = "ASCENDING") -> "Query":
+        return self._copy(orders=self.orders + [(field, direction)])
+
+    def limit(self, n: int) -> "Query":
+        return self._copy(limit_to=n)
+
+    def start_after(self, snapshot: Snapshot) -> "Query":
+        return self._copy(after=snapshot)
+
+    def stream(self):
+        self.db.queries += 1
+        rows = [
+            (doc_id, doc)
+            for doc_id, doc in self.db.data[self.collection].items()
+            if all(field in doc and _OPS[op](doc[field], value) for field, op, value in self.filters)
+        ]
+        # stable sorts from the last key to the first give a multi-key order
+        for field, direction in reversed(self.orders):
+            rows = [row for row in rows if field in row[1]]
+            rows.sort(key=lambda row: row[1][field], reverse=direction == firestore.Query.DESCENDING)
+        if self.after is not None:
+            ids = [doc_id for doc_id, _ in rows]
+            rows = rows[ids.index(self.after.id) + 1:] if self.after.id in ids else []
+        if self.limit_to:
+            rows = rows[: self.limit_to]
+        return iter([Snapshot(DocRef(self.db, self.collection, doc_id), copy.deepcopy(doc)) for doc_id, doc in rows])
+
+
+class Collection(Query):
+    def document(self, doc_id: Optional[str] = None) -> DocRef:
+        return DocRef(self.db, self.collection, doc_id or f"doc{next(_ids)}")
+
+
+class Batch:
+    def __init__(self, db: "FakeClient"):
+        self.db = db
+        self._ops: List[Callable[[], None]] = []
+
+    def set(self, ref: DocRef, fields: Dict[str, Any], merge: bool = False) -> None:
+        self._ops.append(lambda: ref.set(fields, merge=merge))
+
+    def update(self, ref: DocRef, fields: Dict[str, Any]) -> None:
+        self._ops.append(lambda: ref.update(fields))
+
+    def commit(self) -> None:
+        self.db.commits += 1
+        for op in self._ops:
+            op()
+        self._ops = []
+
+
+class Transaction(Batch):
+    """Enough of firestore.Transaction for the @firestore.transactional decorator."""
+
+    _read_only = False
+    _max_attempts = 1
+    _id = b"fake"
+
+    def _clean_up(self) -> None:
+        self._ops = []
+
+    def _begin(self, retry_id: Any = None) -> None:
+        pass
+
+    def _commit(self) -> List[Any]:
+        self.commit()
+        return []
+
+    def _rollback(self) -> None:
+        self._ops = []
+
+    def get_all(self, refs: List[DocRef]) -> List[Snapshot]:
+        return [ref.get() for ref in refs]
+
+
+class FakeClient:
+    def __init__(self) -> None:
+        self.data: Dict[str, Dict[str, Dict[str, Any]]] = defaultdict(dict)
+        self.queries = 0
+        self.commits = 0
+
+    def collection(self, name: str) -> Collection:
+        return Collection(self, name)
+
+    def batch(self) -> Batch:
+        return Batch(self)
+
+    def transaction(self, **_: Any) -> Transaction:
+        return Transaction(self)
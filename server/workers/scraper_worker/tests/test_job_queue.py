@@ -0,0 +1,165 @@
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import job_queue  # noqa: E402
+from fake_firestore import FakeClient  # noqa: E402
+from job_queue import SCRAPE_JOBS_COLLECTION  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    fake = FakeClient()
+    job_queue.set_client(fake)
+    yield fake
+    job_queue.set_client(None)
+
+
+def _queue(client, job_id, minutes_ago, priority=0, retry_in_sec=None, **fields):
+    now = datetime.now(timezone.utc)
+    doc = {
+        "status": "queued",
+        "productId": f"product-{job_id}",
+        "urls": ["https://example.com/item"],
+        "fxRates": {},
+        "priority": priority,
+        "createdAt": now - timedelta(minutes=minutes_ago),
+    }
+    if retry_in_sec is not None:
+        doc["retryAt"] = now + timedelta(seconds=retry_in_sec)
+    doc.update(fields)
+    client.data[SCRAPE_JOBS_COLLECTION][job_id] = doc
+
+
+def _job(client, job_id):
+    return client.data[SCRAPE_JOBS_COLLECTION][job_id]
+
+
+def test_lease_jobs_claims_highest_priority_then_oldest(client):
+    _queue(client, "old", minutes_ago=30)
+    _queue(client, "new", minutes_ago=1)
+    _queue(client, "urgent", minutes_ago=0, priority=5)
+
+    jobs = job_queue.lease_jobs(2)
+
+    assert [job.job_id for job in jobs] == ["urgent", "old"]
+    assert _job(client, "urgent")["status"] == "running"
+    assert _job(client, "urgent")["leasedBy"] == job_queue.WORKER_ID
+    assert _job(client, "new")["status"] == "queued"
+
+
+def test_lease_jobs_pages_past_cooling_off_jobs(client, monkeypatch):
+    monkeypatch.setattr(job_queue, "LEASE_OVERFETCH", 3)
+    # more cooling-off jobs at the head of the order than one page holds
+    for i in range(10):
+        _queue(client, f"retry-{i}", minutes_ago=60 - i, retry_in_sec=3600, attempts=1)
+    _queue(client, "ready-a", minutes_ago=5)
+    _queue(client, "ready-b", minutes_ago=4)
+
+    jobs = job_queue.lease_jobs(2)
+
+    assert [job.job_id for job in jobs] == ["ready-a", "ready-b"]
+    assert all(_job(client, f"retry-{i}")["status"] == "queued" for i in range(10))
+
+
+def test_lease_jobs_takes_retries_once_cool_off_ends(client):
+    _queue(client, "cooling", minutes_ago=10, retry_in_sec=600, attempts=1)
+    _queue(client, "due", minutes_ago=9, retry_in_sec=-1, attempts=1)
+
+    jobs = job_queue.lease_jobs(2)
+
+    assert [job.job_id for job in jobs] == ["due"]
+    assert jobs[0].attempts == 2
+
+
+def test_lease_jobs_respects_scan_limit(client, monkeypatch):
+    monkeypatch.setattr(job_queue, "LEASE_OVERFETCH", 1)
+    monkeypatch.setattr(job_queue, "LEASE_SCAN_LIMIT", 4)
+    for i in range(6):
+        _queue(client, f"retry-{i}", minutes_ago=60 - i, retry_in_sec=3600, attempts=1)
+    _queue(client, "ready", minutes_ago=1)
+
+    assert job_queue.lease_jobs(1) == []
+    assert client.queries == 4
+
+
+def test_failed_completion_requeues_with_backoff_then_dead_letters(client):
+    _queue(client, "job", minutes_ago=1)
+    batcher = job_queue.CompletionBatcher()
+
+    job = job_queue.lease_jobs(1)[0]
+    batcher.add_failure(job, "timeout")
+    batcher.flush()
+    assert _job(client, "job")["status"] == "queued"
+    assert _job(client, "job")["retryAt"] > datetime.now(timezone.utc)
+
+    job.attempts = job_queue.MAX_ATTEMPTS
+    _job(client, "job")["status"] = "running"
+    batcher.add_failure(job, "timeout")
+    batcher.flush()
+    assert _job(client, "job")["status"] == job_queue.DEAD_LETTER_STATUS
+
+
+def test_renew_leases_skips_jobs_taken_over_by_another_worker(client):
+    _queue(client, "mine", minutes_ago=2)
+    _queue(client, "taken", minutes_ago=1)
+    job_queue.lease_jobs(2)
+    before = _job(client, "taken")["leaseExpiresAt"]
+    _job(client, "taken")["leasedBy"] = "other-worker"
+
+    lost = job_queue.renew_leases(["mine", "taken"])
+
+    assert lost == ["taken"]
+    assert _job(client, "taken")["leaseExpiresAt"] == before
+    assert _job(client, "mine")["leaseExpiresAt"] > before
+
+
+def test_flush_drops_completions_for_lost_leases(client):
+    _queue(client, "mine", minutes_ago=2)
+    _queue(client, "taken", minutes_ago=1)
+    mine, taken = job_queue.lease_jobs(2)
+    _job(client, "taken")["leasedBy"] = "other-worker"
+    batcher = job_queue.CompletionBatcher()
+    jobs_ref = client.collection(SCRAPE_JOBS_COLLECTION)
+
+    batcher.add_success(mine, jobs_ref.document("snap-mine"), None)
+    batcher.add_failure(taken, "timeout")
+    batcher.flush()
+
+    assert _job(client, "mine")["status"] == "succeeded"
+    assert _job(client, "taken")["status"] == "running"
+    assert _job(client, "taken")["leasedBy"] == "other-worker"
+    assert batcher.lost == 1
+    assert batcher.pending_writes == 0
+
+
+def test_reaper_requeues_running_jobs_that_predate_leases(client, monkeypatch):
+    monkeypatch.setattr(job_queue, "_legacy_leases_stamped", False)
+    # marked running by a worker without leases: no leasedBy / leasedAt / leaseExpiresAt
+    _queue(client, "stuck", minutes_ago=120, status="running", attempts=1)
+    _queue(client, "recent", minutes_ago=0, status="running", attempts=1)
+    _queue(client, "leased", minutes_ago=120)
+    job_queue.lease_jobs(1)
+    leased_until = _job(client, "leased")["leaseExpiresAt"]
+
+    assert job_queue.reap_expired_leases() == 1
+
+    assert _job(client, "stuck")["status"] == "queued"
+    assert _job(client, "stuck")["lastError"] == "lease_expired"
+    # still inside its lease window: stamped, left to the next passes
+    assert _job(client, "recent")["status"] == "running"
+    assert _job(client, "recent")["leaseExpiresAt"] > datetime.now(timezone.utc)
+    assert _job(client, "leased")["leaseExpiresAt"] == leased_until
+
+
+def test_legacy_lease_pass_pages_through_running_jobs(client):
+    for i in range(5):
+        _queue(client, f"stuck-{i}", minutes_ago=120, status="running", attempts=1)
+
+    assert job_queue.stamp_legacy_leases(page_size=2) == 5
+    assert job_queue.stamp_legacy_leases(page_size=2) == 0
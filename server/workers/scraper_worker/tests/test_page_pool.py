@@ -0,0 +1,77 @@
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import page_pool  # noqa: E402
+from page_pool import PagePool  # noqa: E402
+
+
+class FakePage:
+    def __init__(self):
+        self.url = "about:blank"
+
+    async def goto(self, url, **_):
+        self.url = url
+
+
+class FakeRoute:
+    def __init__(self, frame, resource_type, url):
+        self.request = SimpleNamespace(frame=frame, resource_type=resource_type, url=url)
+        self.outcome = None
+
+    async def abort(self, reason):
+        self.outcome = "aborted"
+
+    async def continue_(self):
+        self.outcome = "continued"
+
+
+def _route_hosts(monkeypatch):
+    seen = []
+
+    def should_block(hostname, resource_type, url):
+        seen.append(hostname)
+        return hostname == "shop.example" and resource_type == "image"
+
+    monkeypatch.setattr(page_pool, "should_block_request", should_block)
+    return seen
+
+
+def test_navigation_from_a_blank_page_routes_by_the_target_host(monkeypatch):
+    seen = _route_hosts(monkeypatch)
+    pool = PagePool(browser=None, user_agent="test")
+    page = FakePage()
+
+    async def run():
+        await pool._idle.put(page)
+        async with pool.page("https://shop.example/item/1") as checked_out:
+            # the main navigation still comes from about:blank, the iframe's image from an ad host
+            navigation = FakeRoute(SimpleNamespace(url="about:blank", page=checked_out), "document", "https://shop.example/item/1")
+            iframe_image = FakeRoute(SimpleNamespace(url="https://ads.example/frame", page=checked_out), "image", "https://ads.example/pixel.png")
+            await pool._route(navigation)
+            await pool._route(iframe_image)
+        return navigation, iframe_image
+
+    navigation, iframe_image = asyncio.run(run())
+
+    assert seen == ["shop.example", "shop.example"]
+    assert navigation.outcome == "continued"
+    assert iframe_image.outcome == "aborted"
+    assert pool._page_target == {}
+
+
+def test_requests_without_a_frame_route_by_their_own_host(monkeypatch):
+    seen = _route_hosts(monkeypatch)
+    pool = PagePool(browser=None, user_agent="test")
+
+    class NoFrame:
+        @property
+        def page(self):
+            raise RuntimeError("service worker")
+
+    asyncio.run(pool._route(FakeRoute(NoFrame(), "fetch", "https://sw.example/api")))
+
+    assert seen == ["sw.example"]
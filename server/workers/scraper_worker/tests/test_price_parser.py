@@ -0,0 +1,74 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from price_parser import extract_price_and_currency, extract_prices_batch  # noqa: E402
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("Model ABC$5.99 today", (5.99, "USD")),
+        ("Price: C$12.50", (12.5, "CAD")),
+        ("(CA$1,299.00)", (1299.0, "CAD")),
+        ("SKU XAU$40", (40.0, "USD")),
+        ("Total 1 234,56 zł", (1234.56, "PLN")),
+    ],
+)
+def test_multi_character_symbols_need_a_boundary(text, expected):
+    assert extract_price_and_currency(text) == expected
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        # a lone separator before three digits, with nothing to say which locale it is
+        ("1.234", (1.234, None)),
+        ("1,234", (1.234, None)),
+        ("0,500", (0.5, None)),
+        # the currency's locale decides
+        ("$1,234", (1234.0, "USD")),
+        ("$1.234", (1.234, "USD")),
+        ("1.234 €", (1234.0, "EUR")),
+        ("1,234 €", (1.234, "EUR")),
+        # more than one group, or both separators, is never ambiguous
+        ("1.000.000", (1000000.0, None)),
+        ("$1,234.50", (1234.5, "USD")),
+    ],
+)
+def test_ambiguous_thousands_separator_takes_the_conservative_reading(text, expected):
+    assert extract_price_and_currency(text) == expected
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("Preis: 1.234,56 €", (1234.56, "EUR")),
+        ("EUR 12.999,00", (12999.0, "EUR")),
+        ("1 234,56 zł", (1234.56, "PLN")),
+        ("CHF 1'234.50", (1234.5, "CHF")),
+    ],
+)
+def test_european_formats(text, expected):
+    assert extract_price_and_currency(text) == expected
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("$1,00,000", (100000.0, "USD")),
+        ("₹1,00,000", (100000.0, "INR")),
+        ("₹ 9,34,567.50", (934567.5, "INR")),
+        ("INR 2,50,000", (250000.0, "INR")),
+    ],
+)
+def test_indian_lakh_grouping(text, expected):
+    assert extract_price_and_currency(text) == expected
+
+
+def test_batch_keeps_input_order_and_repeats():
+    texts = ["£12.50", "no price here", "£12.50", "1.234 €"]
+    assert extract_prices_batch(texts) == [(12.5, "GBP"), (None, None), (12.5, "GBP"), (1234.0, "EUR")]
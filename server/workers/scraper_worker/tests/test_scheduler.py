@@ -0,0 +1,33 @@
+import asyncio
+import os
+import sys
+import threading
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scheduler  # noqa: E402
+from scheduler import JobScheduler  # noqa: E402
+
+
+def test_memory_check_runs_off_the_event_loop_and_is_throttled(monkeypatch):
+    readings = []
+
+    def rss_mb():
+        readings.append(threading.get_ident())
+        return 900.0
+
+    monkeypatch.setattr(scheduler, "process_tree_rss_mb", rss_mb)
+    monkeypatch.setattr(scheduler, "RSS_CHECK_SEC", 60.0)
+
+    async def run():
+        jobs = JobScheduler(SimpleNamespace(waiters=0), process=None, lease=None, poll_interval=1.0, max_jobs=4, max_rss_mb=512)
+        jobs._inflight[object()] = "job-1"
+        reasons = [await jobs._backpressure_reason() for _ in range(3)]
+        return reasons, threading.get_ident()
+
+    reasons, loop_thread = asyncio.run(run())
+
+    assert reasons == ["memory"] * 3
+    assert len(readings) == 1
+    assert readings[0] != loop_thread
@@ -0,0 +1,59 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session_cache import SessionCache  # noqa: E402
+
+
+class FakeContext:
+    def __init__(self, state):
+        self.state = state
+        self.cookie_calls = 0
+        self.init_scripts = []
+
+    async def add_cookies(self, cookies):
+        self.cookie_calls += 1
+
+    async def add_init_script(self, script):
+        self.init_scripts.append(script)
+
+    async def storage_state(self):
+        return self.state
+
+
+def _state(token):
+    return {
+        "cookies": [{"name": "sid", "value": token, "domain": ".example.com", "path": "/"}],
+        "origins": [{"origin": "https://www.example.com", "localStorage": [{"name": "consent", "value": token}]}],
+    }
+
+
+def test_apply_installs_one_local_storage_script_per_context_and_domain(tmp_path):
+    async def run():
+        cache = SessionCache(directory=str(tmp_path))
+        pooled = FakeContext(_state("a"))
+        for token in ("v1", "v2", "v3"):
+            # another context keeps saving newer versions of the session
+            await cache.save(FakeContext(_state(token)), "www.example.com", consent=True)
+            assert await cache.apply(pooled, "www.example.com")
+            await cache.apply(pooled, "www.example.com")
+        return pooled
+
+    pooled = asyncio.run(run())
+    assert pooled.cookie_calls == 3
+    assert len(pooled.init_scripts) == 1
+
+
+def test_saving_context_gets_no_init_script(tmp_path):
+    async def run():
+        cache = SessionCache(directory=str(tmp_path))
+        context = FakeContext(_state("a"))
+        await cache.save(context, "example.com", consent=False)
+        await cache.apply(context, "example.com")
+        return context
+
+    context = asyncio.run(run())
+    assert context.init_scripts == []
+    assert context.cookie_calls == 0
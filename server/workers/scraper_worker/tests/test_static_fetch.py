@@ -0,0 +1,53 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import static_fetch  # noqa: E402
+from static_fetch import TierStats, extract_static_price  # noqa: E402
+
+
+def _page(*documents):
+    scripts = "".join(f'<script type="application/ld+json">{json.dumps(doc)}</script>' for doc in documents)
+    return f"<html><head>{scripts}</head><body></body></html>"
+
+
+def test_json_ld_prefers_the_product_offer_over_related_items():
+    related = {
+        "@type": "ItemList",
+        "itemListElement": [{"@type": "Product", "name": "Cable", "offers": {"price": "9.99", "priceCurrency": "USD"}}],
+    }
+    product = {
+        "@context": "https://schema.org",
+        "@graph": [
+            {"@type": "BreadcrumbList", "itemListElement": [{"@type": "ListItem", "position": 1}]},
+            {"@type": ["Product", "Thing"], "name": "Laptop", "offers": [{"@type": "Offer", "price": 1299, "priceCurrency": "USD"}]},
+        ],
+    }
+
+    found = extract_static_price(_page(related, product), None)
+
+    assert found.amount == 1299.0
+    assert found.source == "json_ld"
+
+
+def test_json_ld_falls_back_to_any_offer_without_a_product_node():
+    found = extract_static_price(_page({"@type": "Offer", "price": "24.50", "priceCurrency": "EUR"}), None)
+
+    assert found.amount == 24.5
+    assert found.currency == "EUR"
+
+
+def test_static_tier_reprobes_hosts_that_never_hit(monkeypatch):
+    monkeypatch.setattr(static_fetch, "STATIC_MIN_SAMPLES", 3)
+    monkeypatch.setattr(static_fetch, "STATIC_REPROBE_EVERY", 4)
+    stats = TierStats()
+    for _ in range(3):
+        stats.record("shop.example", "browser", static_attempted=True)
+
+    decisions = [stats.static_worthwhile("shop.example") for _ in range(8)]
+
+    assert decisions == [False, False, False, True, False, False, False, True]
+    stats.record("shop.example", "static", static_attempted=True)
+    assert stats.static_worthwhile("shop.example")
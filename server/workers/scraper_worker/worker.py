@@ -2,17 +2,27 @@ from __future__ import annotations
 
 import asyncio
 import os
+import signal
 import time
 from datetime import datetime, timezone
-from typing import Any, Dict, List
+from typing import Any, Callable, Dict, List, Optional
 
 from google.cloud import firestore
-from playwright.async_api import async_playwright, Browser, Page
+from playwright.async_api import async_playwright, Page
 
-from domains import get_domain_config
-from logging_utils import error, info, warn
+from domains import get_domain_config, navigation_wait
+from logging_utils import close_logs, error, info, log_stats, warn
+from metrics import StageTimer, record_fallback, record_result, start_metrics_server, summarize_stages
+from host_limits import CircuitOpenError
+from page_pool import PagePool, url_hostname
 from price_parser import extract_price_and_currency, normalize_to_usd
-from job_queue import SCRAPE_JOBS_COLLECTION, SNAPSHOTS_COLLECTION, ScrapeJob, complete_job_failure, complete_job_success, lease_next_job, get_client
+from process_stats import write_stats
+from snapshot_stream import STREAM_SNAPSHOTS, SnapshotStream
+from static_fetch import STATIC_FETCH_ENABLED, close_static_fetcher, extract_static_price, get_static_fetcher, tier_stats
+from scheduler import JobScheduler
+from session_cache import SESSION_CACHE_ENABLED, SessionCache
+from job_notifier import LISTENER_ENABLED, JobNotifier
+from job_queue import SCRAPE_JOBS_COLLECTION, SNAPSHOTS_COLLECTION, LEASE_TTL_SEC, CompletionBatcher, ScrapeJob, get_client, lease_jobs, reap_expired_leases, renew_leases
 
 
 USER_AGENT = os.getenv(
@@ -22,9 +32,21 @@ USER_AGENT = os.getenv(
 
 MAX_TIMEOUT_MS = int(os.getenv("SCRAPER_TIMEOUT_MS", "30000"))
 POLL_INTERVAL_SEC = float(os.getenv("SCRAPER_POLL_INTERVAL_SEC", "5"))
+# Set by supervisor.py: where this process publishes its throughput stats
+STATS_FILE = os.getenv("SCRAPER_STATS_FILE", "")
+STATS_INTERVAL_SEC = float(os.getenv("SCRAPER_STATS_INTERVAL_SEC", "10"))
+# Finished jobs are committed together at most this long after they finish
+COMPLETION_FLUSH_SEC = float(os.getenv("SCRAPER_COMPLETION_FLUSH_SEC", "1"))
+# Renew held leases well inside the TTL so one slow round trip doesn't lose a job
+HEARTBEAT_SEC = float(os.getenv("SCRAPER_HEARTBEAT_SEC", str(LEASE_TTL_SEC / 3)))
+REAPER_INTERVAL_SEC = float(os.getenv("SCRAPER_REAPER_INTERVAL_SEC", "60"))
 
+completions = CompletionBatcher()
+sessions = SessionCache()
 
-async def ensure_consent(page: Page, hostname: str) -> None:
+
+async def ensure_consent(page: Page, hostname: str) -> bool:
+    """Clicks the first consent button found; True when one was clicked."""
     cfg = get_domain_config(hostname)
     selectors = (cfg.consent_selectors if cfg else []) + [
         "button#onetrust-accept-btn-handler",
@@ -37,24 +59,36 @@ async def ensure_consent(page: Page, hostname: str) -> None:
                 await btn.click()
                 await page.wait_for_timeout(500)
                 info("scraper", "clicked_consent", hostname=hostname, selector=selector)
-                return
+                return True
         except Exception:
             continue
+    return False
 
 
-async def extract_price_for_url(page: Page, url: str, fx_rates: dict) -> Dict[str, Any]:
+async def extract_price_for_url(page: Page, url: str, fx_rates: dict, timer: Optional[StageTimer] = None) -> Dict[str, Any]:
     start = time.time()
+    timer = timer or StageTimer()
     try:
-        await page.goto(url, wait_until="networkidle", timeout=MAX_TIMEOUT_MS)
+        if SESSION_CACHE_ENABLED:
+            # saved cookies have to be in the context before the first request goes out
+            with timer.stage("session_apply"):
+                await sessions.apply(page.context, url_hostname(url))
+        # domains with a wait_selector can skip networkidle and wait for the price element instead
+        with timer.stage("goto"):
+            await page.goto(url, wait_until=navigation_wait(url_hostname(url)), timeout=MAX_TIMEOUT_MS)
         hostname = page.url.split("//", 1)[-1].split("/", 1)[0]
-        await ensure_consent(page, hostname)
+        clicked_consent = False
+        if not (SESSION_CACHE_ENABLED and sessions.consent_known(hostname)):
+            with timer.stage("consent"):
+                clicked_consent = await ensure_consent(page, hostname)
 
         cfg = get_domain_config(hostname)
         raw_text = None
 
         if cfg and cfg.wait_selector:
             try:
-                await page.wait_for_selector(cfg.wait_selector, timeout=MAX_TIMEOUT_MS // 2)
+                with timer.stage("wait_selector"):
+                    await page.wait_for_selector(cfg.wait_selector, timeout=MAX_TIMEOUT_MS // 2)
             except Exception:
                 warn("scraper", "wait_selector_timeout", hostname=hostname, selector=cfg.wait_selector)
 
@@ -65,24 +99,32 @@ async def extract_price_for_url(page: Page, url: str, fx_rates: dict) -> Dict[st
             "[data-test='price']",
         ]
 
-        for selector in selectors:
-            el = await page.query_selector(selector)
-            if el:
-                raw_text = await el.get_attribute("content") or await el.inner_text()
-                if raw_text:
-                    break
+        with timer.stage("selectors"):
+            for selector in selectors:
+                el = await page.query_selector(selector)
+                if el:
+                    raw_text = await el.get_attribute("content") or await el.inner_text()
+                    if raw_text:
+                        break
 
         if not raw_text:
             # last resort: look for $xx.xx in whole text
-            body = await page.inner_text("body")
+            record_fallback(hostname, "body_text")
+            with timer.stage("body_text"):
+                body = await page.inner_text("body")
             raw_text = body
 
-        amount, currency = extract_price_and_currency(raw_text or "")
-        usd = normalize_to_usd(amount, currency, fx_rates)
+        with timer.stage("parse"):
+            amount, currency = extract_price_and_currency(raw_text or "")
+            usd = normalize_to_usd(amount, currency, fx_rates)
 
         status = "succeeded" if usd is not None else "failed"
         error_reason = None if usd is not None else "no_price_found"
 
+        if SESSION_CACHE_ENABLED and (clicked_consent or (status == "succeeded" and sessions.get(hostname) is None)):
+            with timer.stage("session_save"):
+                await sessions.save(page.context, hostname, consent=clicked_consent)
+
         return {
             "hostname": hostname,
             "url": page.url,
@@ -93,6 +135,8 @@ async def extract_price_for_url(page: Page, url: str, fx_rates: dict) -> Dict[st
             "errorReason": error_reason,
             "scrapedAt": datetime.now(timezone.utc),
             "latencyMs": int((time.time() - start) * 1000),
+            "tier": "browser",
+            "stageMs": timer.as_ms(),
         }
     except Exception as exc:  # noqa: BLE001
         reason = "timeout" if "Timeout" in str(exc) else "bot_protection"
@@ -108,77 +152,302 @@ async def extract_price_for_url(page: Page, url: str, fx_rates: dict) -> Dict[st
             "errorReason": reason,
             "scrapedAt": datetime.now(timezone.utc),
             "latencyMs": int((time.time() - start) * 1000),
+            "tier": "browser",
+            "stageMs": timer.as_ms(),
         }
 
 
-async def process_job(browser: Browser, job: ScrapeJob) -> None:
-    client = get_client()
-    info("scraper", "processing_job", job_id=job.job_id, product_id=job.product_id, url_count=len(job.urls))
+async def extract_price_static(url: str, fx_rates: dict, timer: Optional[StageTimer] = None) -> Optional[Dict[str, Any]]:
+    """Plain-HTTP attempt; None means the browser has to take the URL."""
     start = time.time()
+    timer = timer or StageTimer()
+    with timer.stage("static_fetch"):
+        fetched = await get_static_fetcher(USER_AGENT).fetch(url)
+    if fetched is None:
+        return None
+    final_url, html = fetched
+    hostname = url_hostname(final_url)
+    with timer.stage("static_parse"):
+        found = extract_static_price(html, get_domain_config(hostname))
+    if found is None:
+        return None
+
+    amount, currency = found.amount, found.currency
+    if amount is None:
+        amount, parsed_currency = extract_price_and_currency(found.raw_text)
+        currency = currency or parsed_currency
+    usd = normalize_to_usd(amount, currency, fx_rates)
+    if usd is None:
+        return None
+
+    return {
+        "hostname": hostname,
+        "url": final_url,
+        "rawPriceText": found.raw_text,
+        "parsedPriceUsd": usd,
+        "currency": currency,
+        "status": "succeeded",
+        "errorReason": None,
+        "scrapedAt": datetime.now(timezone.utc),
+        "latencyMs": int((time.time() - start) * 1000),
+        "tier": "static",
+        "stageMs": timer.as_ms(),
+    }
 
-    page = await browser.new_page(user_agent=USER_AGENT)
-    results: List[Dict[str, Any]] = []
 
+def _static_eligible(hostname: str) -> bool:
+    if not STATIC_FETCH_ENABLED:
+        return False
+    cfg = get_domain_config(hostname)
+    if cfg is not None and cfg.js_only:
+        return False
+    return tier_stats.static_worthwhile(hostname)
+
+
+def circuit_open_result(url: str, hostname: str) -> Dict[str, Any]:
+    return {
+        "hostname": hostname,
+        "url": url,
+        "rawPriceText": None,
+        "parsedPriceUsd": None,
+        "currency": None,
+        "status": "circuit_open",
+        "errorReason": "circuit_open",
+        "scrapedAt": datetime.now(timezone.utc),
+        "latencyMs": 0,
+        "tier": None,
+        "stageMs": {},
+    }
+
+
+async def scrape_url(pool: PagePool, url: str, fx_rates: dict) -> Dict[str, Any]:
+    hostname = url_hostname(url)
+    timer = StageTimer()
+    waited = time.perf_counter()
     try:
-        for url in job.urls:
-            await page.wait_for_timeout(500)
-            result = await extract_price_for_url(page, url, job.fx_rates)
-            results.append(result)
-
-        success_count = sum(1 for r in results if r["status"] == "succeeded")
-        blocked_count = sum(1 for r in results if r["status"] == "blocked")
-        failure_count = len(results) - success_count - blocked_count
-        domains: Dict[str, int] = {}
-        for r in results:
-            host = r.get("hostname") or ""  # type: ignore[assignment]
-            if not host:
-                continue
-            domains[host] = domains.get(host, 0) + 1
-
-        snapshots_ref = client.collection(SNAPSHOTS_COLLECTION)
-        snap_doc = snapshots_ref.document()
-        snapshot_payload: Dict[str, Any] = {
-            "snapshotId": snap_doc.id,
-            "productId": job.product_id,
-            "jobId": job.job_id,
-            "scrapedAt": datetime.now(timezone.utc),
-            "scrapeLatencyMs": int((time.time() - start) * 1000),
-            "competitors": results,
-            "stats": {
-                "successCount": success_count,
-                "failureCount": failure_count,
-                "blockedCount": blocked_count,
-                "domains": domains,
-            },
-            "pricingStatus": "pending",
-            "lastError": None,
-        }
+        async with pool.hosts.slot(hostname):
+            # pacing and concurrency limits, not the site itself
+            timer.add("host_wait", time.perf_counter() - waited)
+            attempted = _static_eligible(hostname)
+            result = await extract_price_static(url, fx_rates, timer) if attempted else None
+            if result is not None:
+                tier_stats.record(hostname, "static", attempted)
+            else:
+                if attempted:
+                    record_fallback(hostname, "static_to_browser")
+                waited = time.perf_counter()
+                async with pool.page(url) as page:
+                    timer.add("page_wait", time.perf_counter() - waited)
+                    result = await extract_price_for_url(page, url, fx_rates, timer)
+                tier_stats.record(hostname, "browser", attempted)
+            # inside the slot so a half-open probe resolves before the next URL is admitted
+            pool.hosts.record(hostname, result["status"])
+            if SESSION_CACHE_ENABLED and result["status"] == "blocked":
+                # the saved cookies may be what got flagged; the next visit starts clean
+                await sessions.invalidate(hostname, pool.contexts, "blocked")
+    except CircuitOpenError:
+        result = circuit_open_result(url, hostname)
+    # adds the wait stages, and a missed static attempt's stages to the browser result
+    result["stageMs"] = timer.as_ms()
+    timer.record(result["hostname"] or hostname)
+    record_result(result)
+    return result
+
+
+async def scrape_urls(
+    pool: PagePool,
+    urls: List[str],
+    fx_rates: dict,
+    on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> List[Dict[str, Any]]:
+    async def _one(url: str) -> Dict[str, Any]:
+        result = await scrape_url(pool, url, fx_rates)
+        if on_result is not None:
+            on_result(result)
+        return result
+
+    # gather keeps results in URL order regardless of completion order
+    return list(await asyncio.gather(*(_one(url) for url in urls)))
+
+
+def snapshot_stats(pool: PagePool, job: ScrapeJob, results: List[Dict[str, Any]], job_timer: Optional[StageTimer] = None) -> Dict[str, Any]:
+    success_count = sum(1 for r in results if r["status"] == "succeeded")
+    blocked_count = sum(1 for r in results if r["status"] == "blocked")
+    circuit_open_count = sum(1 for r in results if r["status"] == "circuit_open")
+    failure_count = len(results) - success_count - blocked_count - circuit_open_count
+    domains: Dict[str, int] = {}
+    tiers: Dict[str, int] = {"static": 0, "browser": 0}
+    for r in results:
+        if r["tier"]:
+            tiers[r["tier"]] += 1
+        host = r.get("hostname") or ""  # type: ignore[assignment]
+        if not host:
+            continue
+        domains[host] = domains.get(host, 0) + 1
+    return {
+        "successCount": success_count,
+        "failureCount": failure_count,
+        "blockedCount": blocked_count,
+        "circuitOpenCount": circuit_open_count,
+        "domains": domains,
+        "tiers": tiers,
+        "hostLimits": pool.hosts.snapshot(url_hostname(url) for url in job.urls),
+        "stages": summarize_stages(results, job_timer),
+    }
+
+
+async def process_job(pool: PagePool, job: ScrapeJob) -> None:
+    client = get_client()
+    info("scraper", "processing_job", job_id=job.job_id, product_id=job.product_id, url_count=len(job.urls))
+    start = time.time()
+    stream: Optional[SnapshotStream] = None
+    timer = StageTimer()
 
-        snap_doc.set(snapshot_payload)
-        complete_job_success(job, snap_doc.id)
+    try:
+        snap_doc = client.collection(SNAPSHOTS_COLLECTION).document()
+        if STREAM_SNAPSHOTS:
+            stream = SnapshotStream(snap_doc, job)
+            with timer.stage("snapshot_open"):
+                await stream.open()
+            with timer.stage("scrape"):
+                results = await scrape_urls(pool, job.urls, job.fx_rates, on_result=stream.add)
+            with timer.stage("snapshot_close"):
+                await stream.close(snapshot_stats(pool, job, results, timer), int((time.time() - start) * 1000))
+            # the snapshot is already written; only the job update goes through the batcher
+            completions.add_success(job, snap_doc, None)
+        else:
+            with timer.stage("scrape"):
+                results = await scrape_urls(pool, job.urls, job.fx_rates)
+            snapshot_payload: Dict[str, Any] = {
+                "snapshotId": snap_doc.id,
+                "productId": job.product_id,
+                "jobId": job.job_id,
+                "scrapedAt": datetime.now(timezone.utc),
+                "scrapeLatencyMs": int((time.time() - start) * 1000),
+                "competitors": results,
+                "stats": snapshot_stats(pool, job, results, timer),
+                "pricingStatus": "pending",
+                "lastError": None,
+            }
+            # snapshot + job update are committed by flush_completions in one batch with other finished jobs
+            completions.add_success(job, snap_doc, snapshot_payload)
+        outcome = "succeeded"
         info("scraper", "job_completed", job_id=job.job_id, snapshot_id=snap_doc.id)
+    except asyncio.CancelledError:
+        # abandoned after the lease was lost; the job's new owner writes its own snapshot
+        if stream is not None:
+            try:
+                await stream.abort("lease_lost")
+            except Exception as abort_exc:  # noqa: BLE001
+                warn("scraper", "snapshot_abort_failed", job_id=job.job_id, error=str(abort_exc))
+        timer.record_job("abandoned")
+        raise
     except Exception as exc:  # noqa: BLE001
         error("scraper", "job_exception", job_id=job.job_id, error=str(exc))
-        complete_job_failure(job, str(exc))
-    finally:
-        await page.close()
+        outcome = "failed"
+        if stream is not None:
+            try:
+                await stream.abort(str(exc))
+            except Exception as abort_exc:  # noqa: BLE001
+                warn("scraper", "snapshot_abort_failed", job_id=job.job_id, error=str(abort_exc))
+        completions.add_failure(job, str(exc))
+    if completions.pending_writes >= completions.max_writes:
+        with timer.stage("completion_flush"):
+            await asyncio.to_thread(completions.flush)
+    timer.record_job(outcome)
+
+
+async def flush_completions() -> None:
+    while True:
+        await asyncio.sleep(COMPLETION_FLUSH_SEC)
+        try:
+            # blocking Firestore commit runs in a thread so in-flight jobs keep scraping
+            await asyncio.to_thread(completions.flush)
+        except Exception as exc:  # noqa: BLE001
+            # writes stay queued for the next attempt
+            error("queue", "completion_flush_failed", error=str(exc), pending=completions.pending_writes)
+
+
+async def maintain_leases(scheduler: JobScheduler) -> None:
+    """Heartbeats this process's leases and re-queues jobs whose worker died."""
+    next_reap = time.monotonic()
+    while True:
+        try:
+            lost = await asyncio.to_thread(renew_leases, scheduler.inflight_job_ids())
+        except Exception as exc:  # noqa: BLE001
+            warn("queue", "lease_heartbeat_failed", error=str(exc))
+            lost = []
+        for job_id in lost:
+            # reaped and handed to another worker: stop scraping it, its result would be discarded anyway
+            warn("queue", "lease_lost", job_id=job_id)
+            scheduler.abandon(job_id)
+        if time.monotonic() >= next_reap and not scheduler.stopping:
+            next_reap = time.monotonic() + REAPER_INTERVAL_SEC
+            try:
+                await asyncio.to_thread(reap_expired_leases)
+            except Exception as exc:  # noqa: BLE001
+                warn("queue", "lease_reaper_failed", error=str(exc))
+        await asyncio.sleep(HEARTBEAT_SEC)
+
+
+def worker_stats(scheduler: JobScheduler) -> Dict[str, Any]:
+    return dict(scheduler.stats(), tiers=tier_stats.snapshot(), hostLimits=scheduler.pool.hosts.snapshot(), logs=log_stats(), sessions=sessions.stats())
+
+
+async def publish_stats(scheduler: JobScheduler) -> None:
+    while True:
+        write_stats(STATS_FILE, worker_stats(scheduler))
+        await asyncio.sleep(STATS_INTERVAL_SEC)
 
 
 async def main_loop() -> None:
     async with async_playwright() as p:
         browser = await p.chromium.launch(headless=True)
-        info("scraper", "worker_started")
-        try:
-            while True:
-                job = lease_next_job()
-                if not job:
-                    await asyncio.sleep(POLL_INTERVAL_SEC)
-                    continue
+        pool = PagePool(browser, USER_AGENT)
+        await pool.start()
+        loop = asyncio.get_running_loop()
+        notifier = None
+        if LISTENER_ENABLED:
+            # push-based wakeups; the scheduler falls back to backoff polling while it is down
+            notifier = JobNotifier()
+            notifier.start(loop)
+        scheduler = JobScheduler(pool, process_job, lease_jobs, poll_interval=POLL_INTERVAL_SEC, notifier=notifier)
+        metrics_server = start_metrics_server()
 
-                await process_job(browser, job)
+        # SIGTERM/SIGINT stop leasing; in-flight jobs finish before the browser closes
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, scheduler.request_stop)
+            except NotImplementedError:
+                pass
+
+        flush_task = asyncio.create_task(flush_completions())
+        lease_task = asyncio.create_task(maintain_leases(scheduler))
+        stats_task = asyncio.create_task(publish_stats(scheduler)) if STATS_FILE else None
+        info("scraper", "worker_started", max_jobs=scheduler.max_jobs, pages=pool.size)
+        try:
+            await scheduler.run()
         finally:
+            if notifier is not None:
+                notifier.stop()
+            flush_task.cancel()
+            lease_task.cancel()
+            try:
+                await asyncio.to_thread(completions.flush)
+            except Exception as exc:  # noqa: BLE001
+                error("queue", "completion_flush_failed", error=str(exc), pending=completions.pending_writes)
+            if stats_task is not None:
+                stats_task.cancel()
+                write_stats(STATS_FILE, worker_stats(scheduler))
+            if metrics_server is not None:
+                metrics_server.shutdown()
+            await close_static_fetcher()
+            await pool.close()
             await browser.close()
 
 
 if __name__ == "__main__":
-    asyncio.run(main_loop())
+    try:
+        asyncio.run(main_loop())
+    finally:
+        close_logs()